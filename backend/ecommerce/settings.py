@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
+    'django.contrib.postgres',  # full-text / trigram lookups used by shop.search
 ]
 
 # Only add Cloudinary apps if credentials are set (prevents build errors)
@@ -68,7 +69,7 @@ INSTALLED_APPS += [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'shop.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
 }
@@ -117,8 +118,64 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Take the write lock when a transaction starts and wait for it,
+            # so concurrent checkouts queue up instead of failing with
+            # "database is locked" (PostgreSQL blocks on the row instead)
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+            # File-backed test database so threaded tests share real locking
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
         }
     }
+# Cache backend: locmem (default, per process), file or redis.
+# Use redis (needs the `redis` package) when running several workers so
+# catalog invalidation reaches all of them.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/0'),
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', str(BASE_DIR / '.cache')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Whether every worker and --loop command sees the same cache. Features
+# that rely on cross-process invalidation fall back to safe defaults when not.
+SHARED_CACHE = CACHE_BACKEND in ('redis', 'file')
+
+# Seconds a token -> user lookup stays cached; logout and user edits
+# drop it sooner (see shop.authentication). Off unless the cache is
+# shared: a per-process cache would keep a revoked token or deactivated
+# user working in every other worker until the entry expired.
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', '300' if SHARED_CACHE else '0'))
+
+# Seconds a worker trusts its in-memory delivery zones (shop.delivery_zones)
+# before reloading them; 0 means until the shared version key moves. Zone
+# edits only bump that key in every worker when the cache is shared, so
+# without one a stale delivery fee lives at most this long.
+DELIVERY_ZONES_MAX_AGE = int(os.getenv('DELIVERY_ZONES_MAX_AGE', '0' if SHARED_CACHE else '30'))
+
+# Seconds a cached catalog payload may live; writes
+# invalidate it sooner (see shop.catalog_cache)
+CATALOG_CACHE_TTL = int(os.getenv('CATALOG_CACHE_TTL', '300'))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -173,9 +230,20 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # ========================================
 # CLOUDINARY CONFIGURATION
 # ========================================
-CLOUDINARY_CLOUD_NAME = os.getenv('CLOUDINARY_CLOUD_NAME', '')
+# Also used to build media delivery URLs (shop.media), so it defaults to the shop's cloud
+CLOUDINARY_CLOUD_NAME = os.getenv('CLOUDINARY_CLOUD_NAME', 'dudqljqqc')
 CLOUDINARY_API_KEY = os.getenv('CLOUDINARY_API_KEY', '')
 CLOUDINARY_API_SECRET = os.getenv('CLOUDINARY_API_SECRET', '')
+# Admin uploads are staged here and pushed to Cloudinary by process_media_uploads
+MEDIA_UPLOAD_STAGING_DIR = os.getenv('MEDIA_UPLOAD_STAGING_DIR', str(BASE_DIR / 'media' / 'staging'))
+MEDIA_UPLOAD_CONCURRENCY = int(os.getenv('MEDIA_UPLOAD_CONCURRENCY', '4'))
+# Signed direct uploads from the admin SPA (shop.direct_uploads): 'cloudinary',
+# or 'local' to store under MEDIA_ROOT when there are no Cloudinary credentials
+MEDIA_DIRECT_UPLOAD_BACKEND = os.getenv(
+    'MEDIA_DIRECT_UPLOAD_BACKEND',
+    'cloudinary' if CLOUDINARY_API_KEY and CLOUDINARY_API_SECRET else 'local'
+)
+DIRECT_UPLOAD_TTL_SECONDS = int(os.getenv('DIRECT_UPLOAD_TTL_SECONDS', '900'))
 
 # Only configure Cloudinary if all credentials are present
 if CLOUDINARY_CLOUD_NAME and CLOUDINARY_API_KEY and CLOUDINARY_API_SECRET:
@@ -216,7 +284,24 @@ CSRF_TRUSTED_ORIGINS = [
 # ========================================
 # SESSION AND COOKIE SETTINGS
 # ========================================
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Where sessions (admin, allauth / Google OAuth flows) live:
+#   db             - a django_session read per request, a write when changed
+#   cached_db      - reads from the cache, writes through to the table (default
+#                    with a shared cache: redis or file)
+#   cache          - cache only; sessions are lost when the cache is flushed
+#   signed_cookies - no server-side storage at all
+# A per-process locmem cache would serve other workers' stale copies, so
+# with CACHE_BACKEND=locmem the default stays db. Switching between db and
+# cached_db keeps existing sessions; cache / signed_cookies log everyone
+# out once (see README). Expired rows are removed by purge_sessions.
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'db' if CACHE_BACKEND == 'locmem' else 'cached_db')
+SESSION_ENGINE = SESSION_ENGINES.get(SESSION_BACKEND, SESSION_ENGINES['db'])
 SESSION_COOKIE_AGE = 1209600  # 2 weeks in seconds
 
 # Cookie security settings for production
@@ -280,6 +365,21 @@ PESAPAL_CONSUMER_KEY = os.getenv('PESAPAL_CONSUMER_KEY', '')
 PESAPAL_CONSUMER_SECRET = os.getenv('PESAPAL_CONSUMER_SECRET', '')
 PESAPAL_ENVIRONMENT = os.getenv('PESAPAL_ENVIRONMENT', 'live')
 PESAPAL_IPN_ID = os.getenv('PESAPAL_IPN_ID', '')
+# HTTP client tuning: (connect, read) timeouts in seconds, keep-alive pool
+# size per worker and bounded retries (see shop.pesapal.build_session)
+PESAPAL_CONNECT_TIMEOUT = float(os.getenv('PESAPAL_CONNECT_TIMEOUT', '3.05'))
+PESAPAL_READ_TIMEOUT = float(os.getenv('PESAPAL_READ_TIMEOUT', '20'))
+PESAPAL_POOL_MAXSIZE = int(os.getenv('PESAPAL_POOL_MAXSIZE', '10'))
+PESAPAL_MAX_RETRIES = int(os.getenv('PESAPAL_MAX_RETRIES', '2'))
+# Upper bound on concurrent connections from the async checkout path, per worker
+PESAPAL_ASYNC_MAX_CONNECTIONS = int(os.getenv('PESAPAL_ASYNC_MAX_CONNECTIONS', '100'))
+# verify_payment serves the stored payment status if it was looked up this
+# recently; reconcile_payments keeps checking unsettled orders for this long
+PAYMENT_STATUS_FRESH_SECONDS = int(os.getenv('PAYMENT_STATUS_FRESH_SECONDS', '15'))
+PAYMENT_RECONCILE_WINDOW_HOURS = int(os.getenv('PAYMENT_RECONCILE_WINDOW_HOURS', '48'))
+
+# How long checkout holds stock for an unpaid order before it is released
+STOCK_RESERVATION_MINUTES = int(os.getenv('STOCK_RESERVATION_MINUTES', '30'))
 
 # Email
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -0,0 +1,29 @@
+#!/usr/bin/env bash
+# Start the background --loop workers next to the web process.
+#
+# Each worker runs under its own restart loop: if it crashes (or exits for
+# any reason) the exit is logged and it starts again after a short pause,
+# so expired holds keep being released and emails keep going out while
+# the web process stays up.
+
+RESTART_DELAY=${WORKER_RESTART_DELAY:-5}
+
+WORKERS=(
+  send_queued_emails
+  release_expired_reservations
+  reconcile_payments
+  process_media_uploads
+  purge_sessions
+)
+
+supervise() {
+  while true; do
+    python manage.py "$1" --loop
+    echo "⚠️ Worker $1 exited with status $?, restarting in ${RESTART_DELAY}s" >&2
+    sleep "$RESTART_DELAY"
+  done
+}
+
+for worker in "${WORKERS[@]}"; do
+  supervise "$worker" &
+done
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Product, Order, OrderItem, ProductImage, ProductVideo, DeliveryZone
+from .models import Product, Order, OrderItem, ProductImage, ProductVideo, DeliveryZone, DailySalesRollup, StockReservation, OutboxEmail, PaymentNotification, MediaUpload, Cart, CartItem
+from .search import filter_products
 
 # Inline admin for additional images
 class ProductImageInline(admin.TabularInline):
@@ -17,11 +18,17 @@ class ProductVideoInline(admin.StackedInline):
 # Product Admin with inlines
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'price', 'stock', 'category', 'size', 'condition', 'is_active', 'created_at']
-    list_filter = ['is_active', 'category', 'size', 'condition', 'created_at']
+    list_display = ['name', 'price', 'stock', 'category', 'size', 'condition', 'is_active', 'media_status', 'created_at']
+    list_filter = ['is_active', 'media_status', 'category', 'size', 'condition', 'created_at']
     search_fields = ['name', 'description', 'category']
     list_editable = ['stock', 'is_active']
     inlines = [ProductImageInline, ProductVideoInline]
+
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index (shop.search) rather than icontains scans
+        if not search_term.strip():
+            return super().get_search_results(request, queryset, search_term)
+        return filter_products(queryset, search_term), False
     
     fieldsets = (
         ('Basic Information', {
@@ -88,4 +95,78 @@ class DeliveryZoneAdmin(admin.ModelAdmin):
     list_editable = ['delivery_fee', 'estimated_days', 'is_active']
     search_fields = ['city']
 
-    
\ No newline at end of file
+@admin.register(DailySalesRollup)
+class DailySalesRollupAdmin(admin.ModelAdmin):
+    list_display = ['date', 'category', 'city', 'payment_method', 'order_count', 'units_sold', 'revenue']
+    list_filter = ['category', 'city', 'payment_method']
+    date_hierarchy = 'date'
+    readonly_fields = ['date', 'category', 'city', 'payment_method', 'order_count', 'units_sold', 'revenue']
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['order', 'product', 'quantity', 'status', 'expires_at', 'created_at']
+    list_filter = ['status']
+    raw_id_fields = ['order', 'product']
+
+
+class CartItemInline(admin.TabularInline):
+    model = CartItem
+    extra = 0
+    can_delete = False
+    readonly_fields = ['product', 'quantity', 'unit_price', 'added_at']
+
+
+# Read-only: the running totals are kept by shop.cart
+@admin.register(Cart)
+class CartAdmin(admin.ModelAdmin):
+    list_display = ['user', 'item_count', 'subtotal', 'shipping_city', 'updated_at']
+    search_fields = ['user__username']
+    readonly_fields = ['user', 'shipping_city', 'subtotal', 'item_count', 'updated_at']
+    inlines = [CartItemInline]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at']
+    list_filter = ['status']
+    search_fields = ['subject']
+    readonly_fields = ['created_at', 'sent_at', 'last_error']
+    actions = ['retry_now']
+
+    @admin.action(description='Retry selected emails now')
+    def retry_now(self, request, queryset):
+        from django.utils import timezone
+        queryset.exclude(status=OutboxEmail.SENT).update(
+            status=OutboxEmail.PENDING, next_attempt_at=timezone.now()
+        )
+
+
+@admin.register(MediaUpload)
+class MediaUploadAdmin(admin.ModelAdmin):
+    list_display = ['product', 'kind', 'order', 'original_name', 'status', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['product__name', 'original_name']
+    readonly_fields = ['created_at', 'finished_at', 'last_error']
+    actions = ['retry_now']
+
+    @admin.action(description='Retry selected uploads now')
+    def retry_now(self, request, queryset):
+        from django.utils import timezone
+        from .media_uploads import refresh_media_status
+        failed = queryset.filter(status=MediaUpload.FAILED)
+        product_ids = set(failed.values_list('product_id', flat=True))
+        failed.update(status=MediaUpload.PENDING, attempts=0, finished_at=None, next_attempt_at=timezone.now())
+        for product_id in product_ids:
+            refresh_media_status(product_id)
+
+
+@admin.register(PaymentNotification)
+class PaymentNotificationAdmin(admin.ModelAdmin):
+    list_display = ['order_tracking_id', 'merchant_reference', 'status', 'payment_status', 'times_received', 'last_received_at', 'processed_at']
+    list_filter = ['status', 'payment_status']
+    search_fields = ['order_tracking_id', 'merchant_reference']
+    readonly_fields = ['created_at', 'last_received_at', 'processed_at']
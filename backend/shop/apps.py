@@ -5,4 +5,8 @@ class ShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shop'
 
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        from . import signals  # noqa: F401
 
+        post_migrate.connect(signals.ensure_search_index, sender=self)
@@ -0,0 +1,55 @@
+"""
+Token authentication with the token -> user lookup cached.
+
+DRF's TokenAuthentication joins Token and User on every request. This
+class keeps the user for AUTH_TOKEN_CACHE_TTL seconds under a hash of
+the key (raw tokens never become cache keys), so an authenticated call
+usually costs one cache hit. Deleting the token (logout) or saving /
+deleting the user drops the entry straight away (shop.signals), so a
+revoked token or deactivated user stops working immediately rather than
+at the end of the TTL. That only holds everywhere when the cache is
+shared, so AUTH_TOKEN_CACHE_TTL defaults to 0 (plain DRF lookups) under
+the per-process locmem cache.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from . import metrics
+
+metrics.register_counters('cache.auth.hit', 'cache.auth.miss')
+
+
+def token_cache_key(key):
+    return f"shop:auth:token:{hashlib.sha256(key.encode()).hexdigest()[:40]}"
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        if settings.AUTH_TOKEN_CACHE_TTL <= 0:
+            return super().authenticate_credentials(key)
+        cache_key = token_cache_key(key)
+        user = cache.get(cache_key)
+        if user is not None:
+            metrics.incr('cache.auth.hit')
+            # Same row the database would return; request.auth.delete() still works
+            return user, Token(key=key, user=user)
+
+        metrics.incr('cache.auth.miss')
+        user, token = super().authenticate_credentials(key)
+        cache.set(cache_key, user, settings.AUTH_TOKEN_CACHE_TTL)
+        return user, token
+
+
+def forget_tokens(*keys):
+    """Drop cached lookups for these token keys, now and again on commit"""
+    def forget():
+        cache.delete_many([token_cache_key(key) for key in keys])
+    if keys:
+        forget()
+        transaction.on_commit(forget)
@@ -0,0 +1,278 @@
+"""
+Bulk product import and streaming catalog / order export.
+
+Imports read CSV or JSONL a row at a time and work in batches: each batch
+is validated with ProductImportSerializer, then written with one
+bulk_create (new products, slugs made in memory) and one bulk_update
+(rows with an id), plus one bulk_create for additional images. Invalid
+rows are reported by line number and skipped; the rest of the file is
+still imported.
+
+Exports iterate the database in chunks (server-side cursors on
+PostgreSQL), so memory stays flat however large the table is.
+"""
+import csv
+import io
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .bulk_ops import save_product_updates
+from .catalog_cache import invalidate_products
+from .models import OrderItem, Product, ProductImage
+from .serializers import ProductImportSerializer
+from .stats import invalidate_dashboard_stats
+
+FORMATS = ('csv', 'jsonl')
+IMPORT_BATCH_SIZE = 500
+# Per-row errors listed in a report; the rest are only counted
+MAX_REPORTED_ERRORS = 500
+# CSV cells holding several additional images separate them with this
+LIST_SEPARATOR = '|'
+# Rows joined into one chunk of an export stream
+EXPORT_CHUNK_ROWS = 500
+
+PRODUCT_EXPORT_FIELDS = [
+    'id', 'name', 'slug', 'description', 'price', 'stock', 'category', 'size', 'condition',
+    'instagram_link', 'tiktok_link', 'is_active', 'image', 'additional_images', 'created_at', 'updated_at',
+]
+ORDER_EXPORT_FIELDS = {
+    'order_id': 'order_id',
+    'created_at': 'order__created_at',
+    'status': 'order__status',
+    'payment_status': 'order__payment_status',
+    'payment_method': 'order__payment_method',
+    'username': 'order__user__username',
+    'shipping_city': 'order__shipping_city',
+    'delivery_fee': 'order__delivery_fee',
+    'total_amount': 'order__total_amount',
+    'product_id': 'product_id',
+    'product_name': 'product__name',
+    'quantity': 'quantity',
+    'price': 'price',
+}
+
+
+def format_for(filename, requested=None):
+    """Import/export format from an explicit choice or the file extension"""
+    fmt = (requested or '').lower() or ('jsonl' if str(filename).lower().endswith(('.jsonl', '.ndjson')) else 'csv')
+    if fmt not in FORMATS:
+        raise ValueError(f'format must be one of {FORMATS}')
+    return fmt
+
+
+# ---------------------------------------------------------------- import
+
+def _read_rows(stream, fmt):
+    """Yield (line number, row dict or error message) from a text stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # Empty cells mean "not given" so updates only touch filled-in columns
+            data = {key: value for key, value in row.items() if key and value not in (None, '')}
+            if 'additional_images' in data:
+                data['additional_images'] = [v.strip() for v in data['additional_images'].split(LIST_SEPARATOR) if v.strip()]
+            yield reader.line_num, data
+        return
+
+    for line_num, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield line_num, f'Invalid JSON: {e}'
+            continue
+        yield line_num, data if isinstance(data, dict) else 'Each line must be a JSON object'
+
+
+class ImportReport:
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.rows = self.created = self.updated = self.failed = 0
+        self.errors = []
+
+    def error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'dry_run': self.dry_run,
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+def _import_batch(batch, report):
+    ids = {int(data['id']) for _, data in batch if isinstance(data, dict) and str(data.get('id', '')).isdigit()}
+    creates, updates, images = [], [], []
+    update_fields, replace_images_of = set(), []
+
+    with transaction.atomic():
+        existing = Product.objects.select_for_update().in_bulk(ids)
+        for line, data in batch:
+            if isinstance(data, str):
+                report.error(line, {'row': [data]})
+                continue
+            instance = None
+            if data.get('id') not in (None, ''):
+                instance = existing.get(int(data['id'])) if str(data['id']).isdigit() else None
+                if instance is None:
+                    report.error(line, {'id': [f"No product with id {data['id']}"]})
+                    continue
+            serializer = ProductImportSerializer(instance, data=data, partial=instance is not None)
+            if not serializer.is_valid():
+                report.error(line, serializer.errors)
+                continue
+
+            values = dict(serializer.validated_data)
+            values.pop('id', None)
+            additional = values.pop('additional_images', None)
+            if instance is None:
+                product = Product(slug=Product.make_slug(values['name']), **values)
+                creates.append(product)
+            else:
+                product = instance
+                for field, value in values.items():
+                    setattr(product, field, value)
+                update_fields.update(values)
+                updates.append(product)
+            if additional is not None:
+                images.append((product, additional))
+                if instance is not None:
+                    replace_images_of.append(instance.pk)
+
+        report.created += len(creates)
+        report.updated += len(updates)
+        if report.dry_run:
+            transaction.set_rollback(True)
+            return
+
+        Product.objects.bulk_create(creates)
+        save_product_updates(updates, update_fields)
+        if images:
+            # A row's additional_images replace the product's current ones
+            ProductImage.objects.filter(product_id__in=replace_images_of).delete()
+            ProductImage.objects.bulk_create([
+                ProductImage(product=product, image=value, order=index)
+                for product, values in images
+                for index, value in enumerate(values)
+            ])
+
+        # bulk_create skips the post_save signals: refresh the caches once per batch
+        if creates:
+            invalidate_products(*[product.pk for product in creates])
+            invalidate_dashboard_stats()
+
+
+def import_products(stream, fmt='csv', dry_run=False, batch_size=IMPORT_BATCH_SIZE):
+    """Import products from a text stream of CSV or JSONL. Returns an ImportReport."""
+    report = ImportReport(dry_run=dry_run)
+    batch = []
+    for line, data in _read_rows(stream, fmt):
+        report.rows += 1
+        batch.append((line, data))
+        if len(batch) >= batch_size:
+            _import_batch(batch, report)
+            batch = []
+    if batch:
+        _import_batch(batch, report)
+    return report
+
+
+def text_stream(uploaded_file):
+    """Read an uploaded file as UTF-8 text (a BOM from spreadsheet exports is dropped)"""
+    uploaded_file.open('rb')
+    return io.TextIOWrapper(uploaded_file.file, encoding='utf-8-sig', newline='')
+
+
+# ---------------------------------------------------------------- export
+
+class _Echo:
+    """File-like object for csv.writer that hands back each line instead of buffering it"""
+    def write(self, value):
+        return value
+
+
+def _render(rows, fields, fmt):
+    """Yield the export as text chunks of EXPORT_CHUNK_ROWS rows"""
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        encode = writer.writerow
+        yield encode(fields)
+    else:
+        encode = lambda row: json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + '\n'
+
+    chunk = []
+    for row in rows:
+        chunk.append(encode(row))
+        if len(chunk) >= EXPORT_CHUNK_ROWS:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def _stored(field, value):
+    """Cloudinary value as stored in the database (what an import accepts back)"""
+    return field.get_prep_value(value) or ''
+
+
+def export_products(fmt='csv'):
+    image_field = Product._meta.get_field('image')
+    additional_field = ProductImage._meta.get_field('image')
+    products = Product.objects.prefetch_related('additional_images').order_by('id').iterator(chunk_size=EXPORT_CHUNK_ROWS)
+
+    def rows():
+        for product in products:
+            additional = [_stored(additional_field, image.image) for image in product.additional_images.all()]
+            yield [
+                product.id, product.name, product.slug, product.description, product.price, product.stock,
+                product.category, product.size, product.condition, product.instagram_link or '',
+                product.tiktok_link or '', product.is_active, _stored(image_field, product.image),
+                LIST_SEPARATOR.join(additional) if fmt == 'csv' else additional,
+                product.created_at, product.updated_at,
+            ]
+
+    return _render(rows(), PRODUCT_EXPORT_FIELDS, fmt)
+
+
+def export_orders(fmt='csv', status=None, start=None, end=None):
+    """One row per order item, with its order's details"""
+    items = OrderItem.objects.order_by('order_id', 'id')
+    if status:
+        items = items.filter(order__status=status)
+    if start:
+        items = items.filter(order__created_at__date__gte=start)
+    if end:
+        items = items.filter(order__created_at__date__lte=end)
+    rows = items.values_list(*ORDER_EXPORT_FIELDS.values()).iterator(chunk_size=EXPORT_CHUNK_ROWS)
+    return _render(rows, list(ORDER_EXPORT_FIELDS), fmt)
+
+
+async def _in_thread(chunks):
+    """Serve a sync generator to an ASGI server one chunk at a time (Django would buffer it whole)"""
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+def streaming_export(request, chunks, fmt, name):
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    django_request = getattr(request, '_request', request)
+    if isinstance(django_request, ASGIRequest):
+        chunks = _in_thread(chunks)
+    response = StreamingHttpResponse(chunks, content_type=f'{content_type}; charset=utf-8')
+    filename = f"{name}-{timezone.localdate():%Y%m%d}.{fmt}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
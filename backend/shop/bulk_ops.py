@@ -0,0 +1,153 @@
+"""
+Batch admin operations: many products or order statuses per request.
+
+A batch is applied in one transaction with bulk_update. Stock for
+cancelled orders moves in one set-based F() UPDATE (shop.inventory), the
+sales rollup is adjusted once per rollup row, and status emails are
+inserted into the outbox in one go for the send_queued_emails worker to
+deliver.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .cart import reprice_products
+from .catalog_cache import invalidate_products
+from .emails import queue_order_status_emails
+from .inventory import release_orders_reservations, restock_orders
+from .models import Order, Product
+from .rollups import record_orders_cancelled, record_orders_completed
+from .serializers import ProductImportSerializer
+from .stats import invalidate_dashboard_stats
+
+MAX_BATCH = 500
+BULK_PRODUCT_FIELDS = (
+    'name', 'description', 'price', 'stock', 'category', 'size', 'condition',
+    'instagram_link', 'tiktok_link', 'is_active',
+)
+
+
+class BulkOperationError(Exception):
+    def __init__(self, message, details=None):
+        self.message = message
+        self.details = details
+        super().__init__(message)
+
+    def as_dict(self):
+        body = {'error': self.message}
+        if self.details is not None:
+            body['details'] = self.details
+        return body
+
+
+def _clean_ids(ids):
+    if not isinstance(ids, list) or not ids:
+        raise BulkOperationError('ids must be a non-empty list')
+    if len(ids) > MAX_BATCH:
+        raise BulkOperationError(f'At most {MAX_BATCH} ids per request')
+    try:
+        return [int(pk) for pk in ids]
+    except (TypeError, ValueError):
+        raise BulkOperationError('ids must be integers')
+
+
+def save_product_updates(products, fields):
+    """bulk_update changed products (bumping updated_at) and refresh the caches once"""
+    if not products:
+        return
+    now = timezone.now()
+    for product in products:
+        product.updated_at = now
+    Product.objects.bulk_update(products, sorted(set(fields) | {'updated_at'}))
+    # bulk_update skips the post_save signals
+    if 'price' in fields:
+        reprice_products([product.pk for product in products])
+    invalidate_products(*{product.pk for product in products})
+    invalidate_dashboard_stats()
+
+
+def bulk_update_products(updates):
+    """
+    Apply [{'id': ..., <field>: <value>, ...}, ...] all or nothing.
+    Raises BulkOperationError listing every bad entry; returns the products.
+    """
+    if not isinstance(updates, list) or not all(isinstance(u, dict) for u in updates):
+        raise BulkOperationError('updates must be a list of objects')
+    ids = _clean_ids([update.get('id') for update in updates])
+
+    with transaction.atomic():
+        products = Product.objects.select_for_update().in_bulk(ids)
+        errors, changed, fields = [], {}, set()
+        for index, (pk, update) in enumerate(zip(ids, updates)):
+            values = {key: value for key, value in update.items() if key != 'id'}
+            unknown = sorted(set(values) - set(BULK_PRODUCT_FIELDS))
+            product = products.get(pk)
+            if product is None:
+                errors.append({'index': index, 'id': pk, 'errors': {'id': ['Product not found']}})
+                continue
+            if unknown or not values:
+                message = f"Can't bulk update {', '.join(unknown)}" if unknown else 'Nothing to update'
+                errors.append({'index': index, 'id': pk, 'errors': {'non_field_errors': [message]}})
+                continue
+            serializer = ProductImportSerializer(product, data=values, partial=True)
+            if not serializer.is_valid():
+                errors.append({'index': index, 'id': pk, 'errors': serializer.errors})
+                continue
+            for field, value in serializer.validated_data.items():
+                setattr(product, field, value)
+            fields.update(serializer.validated_data)
+            changed[pk] = product
+
+        if errors:
+            raise BulkOperationError('Some updates are invalid; nothing was changed', errors)
+        save_product_updates(list(changed.values()), fields)
+    return list(changed.values())
+
+
+def bulk_update_order_status(ids, new_status):
+    """
+    Move many orders to new_status with the side effects of
+    admin_update_order_status: stock goes back for cancelled orders (paid:
+    restocked and taken out of the rollup; unpaid: holds released), an
+    un-cancelled paid order returns to the rollup, and every changed order
+    gets a status email. Returns (orders found, number changed, emails queued).
+    """
+    if new_status not in dict(Order.STATUS_CHOICES):
+        raise BulkOperationError('Invalid status')
+    ids = _clean_ids(ids)
+
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update(of=('self',)).select_related('user').filter(pk__in=ids).order_by('pk')
+        )
+        missing = sorted(set(ids) - {order.pk for order in orders})
+        if missing:
+            raise BulkOperationError('Orders not found; nothing was changed', {'missing_ids': missing})
+
+        changes = [(order, order.status) for order in orders if order.status != new_status]
+        if not changes:
+            return orders, 0, 0
+
+        restock, release, uncancel = [], [], []
+        for order, old_status in changes:
+            paid = order.payment_status == 'completed'
+            if new_status == 'cancelled':
+                (restock if paid else release).append(order)
+            elif old_status == 'cancelled' and paid:
+                uncancel.append(order)
+
+        now = timezone.now()
+        for order, _ in changes:
+            order.status = new_status
+            order.updated_at = now
+        Order.objects.bulk_update([order for order, _ in changes], ['status', 'updated_at'])
+
+        restock_orders([order.pk for order in restock])
+        record_orders_cancelled(restock)
+        release_orders_reservations([order.pk for order in release])
+        record_orders_completed(uncancel)
+
+        emails = queue_order_status_emails(changes)
+        invalidate_dashboard_stats()
+
+    print(f"✅ Bulk status update: {len(changes)} orders → {new_status}, {len(emails)} emails queued")
+    return orders, len(changes), len(emails)
@@ -0,0 +1,217 @@
+"""
+Server-side carts and the pricing engine.
+
+Cart.subtotal and Cart.item_count are running totals: every add, remove
+or quantity change moves them by that line's delta with one F() UPDATE,
+and a product price change moves every cart holding it in one set-based
+UPDATE (reprice_products). Pricing a cart is then a single query for
+the cart row (delivery terms come from shop.delivery_zones), however
+many items it holds, and checkout takes its amounts straight from the cart.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from .delivery_zones import zone_for
+from .models import Cart, CartItem, Product
+
+# Used when a city has no active delivery zone (same as checkout always did)
+DEFAULT_DELIVERY_FEE = Decimal('0')
+DEFAULT_ESTIMATED_DAYS = 3
+MAX_CART_LINES = 100
+
+
+class CartError(Exception):
+    def __init__(self, message, status_code=400):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(message)
+
+    def as_dict(self):
+        return {'error': self.message}
+
+
+def _locked_cart(user):
+    """The user's cart, created on first use and locked for the rest of the transaction"""
+    cart, _ = Cart.objects.get_or_create(user=user)
+    return Cart.objects.select_for_update().get(pk=cart.pk)
+
+
+def _move_totals(cart_id, amount, units):
+    Cart.objects.filter(pk=cart_id).update(
+        subtotal=F('subtotal') + amount, item_count=F('item_count') + units, updated_at=timezone.now()
+    )
+
+
+def _quantity(value, minimum):
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        raise CartError('quantity must be an integer')
+    if quantity < minimum:
+        raise CartError(f'quantity must be at least {minimum}')
+    return quantity
+
+
+def add_items(user, entries):
+    """
+    Add [(product_id, quantity), ...] to the user's cart, on top of what is
+    already there. All or nothing; totals move by the added lines only.
+    """
+    entries = [(product_id, _quantity(quantity, 1)) for product_id, quantity in entries]
+    if not entries:
+        raise CartError('Nothing to add')
+    try:
+        product_ids = {int(product_id) for product_id, _ in entries}
+    except (TypeError, ValueError):
+        raise CartError('product_id must be an integer')
+
+    with transaction.atomic():
+        cart = _locked_cart(user)
+        products = Product.objects.filter(is_active=True).in_bulk(product_ids)
+        if len(products) != len(product_ids):
+            raise CartError('Product not found', status_code=404)
+        items = {item.product_id: item for item in cart.items.filter(product_id__in=product_ids)}
+        if cart.items.count() + len(product_ids - set(items)) > MAX_CART_LINES:
+            raise CartError(f'A cart holds at most {MAX_CART_LINES} different products')
+
+        amount, units = Decimal('0'), 0
+        for product_id, quantity in entries:
+            product = products[int(product_id)]
+            item = items.get(product.pk)
+            if item is None:
+                item = items[product.pk] = CartItem(cart=cart, product=product, quantity=0, unit_price=product.price)
+            item.quantity += quantity
+            if item.quantity > product.stock:
+                raise CartError(f'Only {product.stock} of {product.name} left')
+            amount += quantity * item.unit_price
+            units += quantity
+
+        CartItem.objects.bulk_create([item for item in items.values() if item.pk is None])
+        CartItem.objects.bulk_update([item for item in items.values() if item.pk is not None], ['quantity'])
+        _move_totals(cart.pk, amount, units)
+    return cart
+
+
+def set_quantity(user, product_id, quantity):
+    """Set one line's quantity (0 removes it); totals move by the difference"""
+    quantity = _quantity(quantity, 0)
+    with transaction.atomic():
+        cart = _locked_cart(user)
+        item = cart.items.select_related('product').filter(product_id=product_id).first()
+        if item is None:
+            raise CartError('Product is not in the cart', status_code=404)
+        # Lowering a quantity is always allowed, even below a stock that has since dropped
+        if quantity > item.quantity and quantity > item.product.stock:
+            raise CartError(f'Only {item.product.stock} of {item.product.name} left')
+
+        delta = quantity - item.quantity
+        if quantity:
+            item.quantity = quantity
+            item.save(update_fields=['quantity'])
+        else:
+            item.delete()
+        _move_totals(cart.pk, delta * item.unit_price, delta)
+    return cart
+
+
+def remove_item(user, product_id):
+    return set_quantity(user, product_id, 0)
+
+
+def set_shipping_city(user, city):
+    cart, _ = Cart.objects.get_or_create(user=user)
+    Cart.objects.filter(pk=cart.pk).update(shipping_city=city or '', updated_at=timezone.now())
+    return cart
+
+
+def clear_cart(cart_id):
+    with transaction.atomic():
+        CartItem.objects.filter(cart_id=cart_id).delete()
+        Cart.objects.filter(pk=cart_id).update(subtotal=0, item_count=0, updated_at=timezone.now())
+
+
+def reprice_products(product_ids):
+    """
+    Move carts holding these products onto their current prices: one
+    UPDATE adjusts every affected cart's subtotal, one rewrites the lines.
+    Call it whenever prices change without Product.save (bulk_update etc.).
+    """
+    stale = CartItem.objects.filter(product_id__in=product_ids).exclude(unit_price=F('product__price'))
+    delta = (
+        stale.filter(cart=OuterRef('pk'))
+        .order_by()
+        .values('cart')
+        .annotate(delta=Sum((F('product__price') - F('unit_price')) * F('quantity')))
+        .values('delta')
+    )
+    carts = Cart.objects.filter(pk__in=stale.values('cart_id')).update(
+        subtotal=F('subtotal') + Subquery(delta), updated_at=timezone.now()
+    )
+    if carts:
+        stale.update(unit_price=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1]))
+    return carts
+
+
+def drop_product(product_id):
+    """Take a product that is about to be deleted out of the running totals of carts holding it"""
+    lines = CartItem.objects.filter(cart=OuterRef('pk'), product_id=product_id)
+    Cart.objects.filter(items__product_id=product_id).update(
+        subtotal=F('subtotal') - Subquery(lines.annotate(amount=F('quantity') * F('unit_price')).values('amount')[:1]),
+        item_count=F('item_count') - Subquery(lines.values('quantity')[:1]),
+        updated_at=timezone.now(),
+    )
+
+
+def _terms(zone):
+    return (zone.delivery_fee, zone.estimated_days) if zone else (DEFAULT_DELIVERY_FEE, DEFAULT_ESTIMATED_DAYS)
+
+
+def delivery_terms(city):
+    """(delivery fee, estimated days) for a city, from the in-process zone registry"""
+    return _terms(zone_for(city))
+
+
+def cart_totals(user, city=None):
+    """
+    Price the user's cart in one query: running subtotal plus the delivery
+    terms of `city` (default: the city saved on the cart).
+    """
+    row = (
+        Cart.objects.filter(user=user).values('id', 'subtotal', 'item_count', 'shipping_city').first()
+        or {'id': None, 'subtotal': Decimal('0'), 'item_count': 0, 'shipping_city': ''}
+    )
+    city = row['shipping_city'] if city is None else city
+    zone = zone_for(city)
+    delivery_fee, estimated_days = _terms(zone)
+    return {
+        'cart_id': row['id'],
+        'subtotal': row['subtotal'],
+        'item_count': row['item_count'],
+        'shipping_city': city,
+        'delivery_available': zone is not None,
+        'delivery_fee': delivery_fee,
+        'estimated_days': estimated_days,
+        'total': row['subtotal'] + delivery_fee,
+    }
+
+
+def lock_for_checkout(user):
+    """
+    The user's cart, locked for the rest of the transaction, and its lines
+    as (product, quantity, current catalog price). Adds and removes wait on
+    the lock, so an order's items and total come from one consistent read.
+    Prices are the products' current ones rather than those saved when
+    each line was added, so an ended sale is never charged at checkout.
+    """
+    cart = Cart.objects.select_for_update().filter(user=user).first()
+    if cart is None:
+        return None, []
+    return cart, [(item.product, item.quantity, item.product.price) for item in cart_lines(cart.pk)]
+
+
+def cart_lines(cart_id):
+    """The cart's items with their products, in the order they were added"""
+    return list(CartItem.objects.filter(cart_id=cart_id).select_related('product'))
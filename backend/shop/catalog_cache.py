@@ -0,0 +1,78 @@
+"""
+Cached payloads for the public, read-heavy endpoints: the product list
+and product detail (delivery zones live in shop.delivery_zones).
+
+Product list pages are keyed by the full request URL under a catalog
+version number; any product change bumps the version, so every cached
+page is dropped at once without enumerating keys. Product detail is
+keyed per product and deleted when that product (or its media / stock)
+changes. Invalidation runs straight away and again on commit, so a read
+racing an open transaction can't re-cache the old row for long.
+
+That invalidation only reaches other processes through a shared cache,
+and the --loop workers move stock and media too. So every payload is
+stored with the ETag it was built for (shop.conditional computes it from
+the database on each request) and only served while the ETag still
+matches: under the per-process locmem cache a worker's write costs the
+web process a rebuild, never a stale body behind a fresh ETag.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import metrics
+
+CATALOG_VERSION_KEY = 'shop:catalog:version'
+
+metrics.register_counters('cache.catalog.hit', 'cache.catalog.miss')
+
+
+def catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def product_list_key(request):
+    url_hash = hashlib.sha256(request.build_absolute_uri().encode()).hexdigest()[:32]
+    return f'shop:catalog:v{catalog_version()}:list:{url_hash}'
+
+
+def product_detail_key(pk):
+    return f'shop:catalog:product:{pk}'
+
+
+def get_or_build(key, etag, build):
+    """Return the payload cached for key if it was built for etag, otherwise build, cache and return it"""
+    cached = cache.get(key)
+    if cached is not None and cached[0] == etag:
+        metrics.incr('cache.catalog.hit')
+        return cached[1]
+    metrics.incr('cache.catalog.miss')
+    data = build()
+    cache.set(key, (etag, data), settings.CATALOG_CACHE_TTL)
+    return data
+
+
+def _now_and_on_commit(func):
+    func()
+    transaction.on_commit(func)
+
+
+def _bump_catalog_version():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+
+
+def invalidate_products(*pks):
+    """A product's fields, media or stock changed: drop its detail and every list page"""
+    def invalidate():
+        cache.delete_many([product_detail_key(pk) for pk in pks])
+        _bump_catalog_version()
+    _now_and_on_commit(invalidate)
@@ -0,0 +1,163 @@
+"""
+Checkout steps shared by the sync (create_order) and async
+(create_order_async) views.
+
+Everything here is synchronous ORM work; the async view runs it through
+sync_to_async and only awaits the Pesapal submission itself.
+"""
+import secrets
+import time
+
+from django.db import transaction
+
+from .models import Product, Order, OrderItem
+from .cart import clear_cart, delivery_terms, lock_for_checkout
+from .inventory import InsufficientStock, reserve_stock, release_reservations
+from .emails import queue_order_confirmation_email
+
+
+class CheckoutError(Exception):
+    def __init__(self, message, status_code=400, details=None):
+        self.message = message
+        self.status_code = status_code
+        self.details = details
+        super().__init__(message)
+
+    def as_dict(self):
+        body = {'error': self.message}
+        if self.details is not None:
+            body['details'] = self.details
+        return body
+
+
+def new_merchant_reference():
+    """Unique Pesapal merchant reference, made before the order row exists"""
+    return f"KT-{int(time.time())}-{secrets.token_hex(4).upper()}"
+
+
+def _order_lines(items_data):
+    """(product, quantity, price) per requested item, with one product query"""
+    try:
+        requested = [(int(item['product_id']), int(item['quantity'])) for item in items_data]
+    except (KeyError, TypeError, ValueError):
+        raise CheckoutError('Each item needs a product_id and quantity')
+    if any(quantity < 1 for _, quantity in requested):
+        raise CheckoutError('Quantities must be at least 1')
+
+    products = Product.objects.in_bulk({product_id for product_id, _ in requested})
+    if len(products) != len({product_id for product_id, _ in requested}):
+        raise CheckoutError('Product not found', status_code=404)
+    # Prices come from the catalog, never from the client
+    return [(products[product_id], quantity, products[product_id].price) for product_id, quantity in requested]
+
+
+def place_order(user, data):
+    """
+    Create the order, its items and the stock holds, then queue the
+    confirmation email. Raises CheckoutError if nothing could be placed.
+
+    Without an `items` list the user's server-side cart is checked out
+    (and emptied), read under the cart's row lock. Either way the amounts
+    are computed here from current catalog prices: any client-sent prices
+    or total_amount are ignored.
+    """
+    city = data.get('shipping_city')
+    items_data = data.get('items')
+    lines = _order_lines(items_data) if items_data else None
+    cart = None
+
+    # Create order, its items and the stock holds together: if any item
+    # is out of stock nothing is written and nothing is held. The order
+    # row is written once, merchant reference included.
+    try:
+        with transaction.atomic():
+            if lines is None:
+                cart, lines = lock_for_checkout(user)
+                city = city or (cart.shipping_city if cart else '')
+            if not lines:
+                raise CheckoutError('No items in order')
+            subtotal = sum(price * quantity for _, quantity, price in lines)
+            delivery_fee, estimated_days = delivery_terms(city)
+
+            order = Order.objects.create(
+                user=user,
+                total_amount=subtotal + delivery_fee,
+                shipping_address=data.get('shipping_address'),
+                shipping_city=city,
+                shipping_postal_code=data.get('shipping_postal_code', ''),
+                shipping_country=data.get('shipping_country'),
+                phone_number=data.get('phone_number'),
+                whatsapp_number=data.get('whatsapp_number', ''),
+                delivery_fee=delivery_fee,
+                estimated_delivery_days=estimated_days,
+                status='pending',
+                payment_status='pending',
+                pesapal_merchant_reference=new_merchant_reference(),
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=quantity, price=price)
+                for product, quantity, price in lines
+            ])
+
+            # Hold the stock until payment completes, fails or the hold expires
+            reserve_stock(order, [(product, quantity) for product, quantity, _ in lines])
+    except InsufficientStock as e:
+        raise CheckoutError(f'Insufficient stock for {e.product.name}')
+
+    # The email and the response both render the items with their products
+    order = Order.objects.with_details().get(pk=order.pk)
+    # The cart is emptied once payment starts (apply_payment_response), so
+    # a checkout that never reaches Pesapal leaves it as it was
+    order.checkout_cart_id = cart.pk if cart else None
+
+    # ✅ QUEUE ORDER CONFIRMATION EMAIL
+    try:
+        queue_order_confirmation_email(order)
+        print(f"✅ Order confirmation queued for Order #{order.id}")
+    except Exception as e:
+        print(f"❌ Email error: {e}")
+
+    return order
+
+
+def payment_request(order, user, data, callback_url):
+    """Keyword arguments for PesapalAPI.submit_order / asubmit_order"""
+    # Format customer name
+    customer_name = f"{user.first_name} {user.last_name}".strip()
+    if not customer_name:
+        customer_name = user.username
+
+    return {
+        'order_id': order.pesapal_merchant_reference,
+        'amount': float(order.total_amount),
+        'description': f"Kadi Thrift Order #{order.id}",
+        'callback_url': callback_url,
+        'customer_email': user.email,
+        'customer_phone': data.get('phone_number'),
+        'customer_name': customer_name,
+    }
+
+
+def apply_payment_response(order, pesapal_response):
+    """
+    Store the tracking id and return Pesapal's redirect URL. If the
+    submission was rejected the order is abandoned and CheckoutError raised.
+    """
+    print("Pesapal response:", pesapal_response)
+
+    # Check if order submission was successful
+    if pesapal_response.get('status') != '200':
+        abandon_order(order)
+        raise CheckoutError('Failed to initiate payment', details=pesapal_response)
+
+    order.pesapal_order_tracking_id = pesapal_response.get('order_tracking_id')
+    order.save(update_fields=['pesapal_order_tracking_id', 'updated_at'])
+    if getattr(order, 'checkout_cart_id', None):
+        clear_cart(order.checkout_cart_id)
+    return pesapal_response.get('redirect_url')
+
+
+def abandon_order(order):
+    """Hand back the stock held for an order whose payment never started, then delete it"""
+    release_reservations(order)
+    order.delete()  # Rollback
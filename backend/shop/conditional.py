@@ -0,0 +1,53 @@
+"""
+Conditional GET (ETag / Last-Modified) for catalog and order endpoints.
+
+Validators come from one aggregate over updated_at, never from the
+serialized body, so a 304 costs a single indexed query and no
+serialization. Product.updated_at moves on every field, stock or media
+change (see shop.inventory and shop.signals), so it is a sound version.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+# Cache-Control per endpoint. The catalog is public and may be reused
+# briefly (stock moves); orders are per user and always revalidated.
+PRODUCT_LIST_CACHE = {'public': True, 'max_age': 30, 'stale_while_revalidate': 60}
+PRODUCT_DETAIL_CACHE = {'public': True, 'max_age': 30, 'stale_while_revalidate': 60}
+ORDER_DETAIL_CACHE = {'private': True, 'no_cache': True}
+DELIVERY_ZONES_CACHE = {'public': True, 'max_age': 300}
+
+
+def _etag(*parts):
+    return quote_etag(hashlib.sha256('|'.join(str(p) for p in parts).encode()).hexdigest()[:32])
+
+
+def collection_validators(request, queryset):
+    """(etag, last_modified) for a filtered list page: newest updated_at + row count + the URL"""
+    stats = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    last_modified = stats['last_modified']
+    return _etag(request.get_full_path(), stats['count'], last_modified and last_modified.isoformat()), last_modified
+
+
+def object_validators(key, last_modified):
+    return _etag(key, last_modified.isoformat()), last_modified
+
+
+def conditional_response(request, etag, last_modified, cache_control, build):
+    """
+    Answer 304 if the client's copy is current, otherwise call build() for
+    the full response. Either way the validators and Cache-Control are set.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = build()
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(timestamp)
+    patch_cache_control(response, **cache_control)
+    return response
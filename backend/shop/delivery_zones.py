@@ -0,0 +1,98 @@
+"""
+Per-process delivery zone registry.
+
+Zones change maybe once a month but are read on every checkout, cart
+price and zones request, so each worker keeps them in memory: a
+case-insensitive city index plus the zones endpoint's JSON body, encoded
+once. The table is loaded lazily on first use. Any zone edit bumps a
+version token in the shared cache (shop.signals); a worker that sees a
+token other than the one it loaded reloads, so the admin's change
+reaches every process on its next lookup. The token is random rather
+than a counter, so a flushed or evicted cache also forces a reload.
+
+That only works when the cache is shared. Under the per-process locmem
+cache a worker also reloads once its copy is DELIVERY_ZONES_MAX_AGE
+seconds old, so another worker's edit shows up within that time.
+"""
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import quote_etag
+
+from . import metrics
+from .models import DeliveryZone
+
+ZONES_VERSION_KEY = 'shop:delivery_zones:version'
+
+Zone = namedtuple('Zone', ['city', 'delivery_fee', 'estimated_days'])
+
+metrics.register_counters('delivery_zones.reload')
+
+
+class _Registry:
+    def __init__(self, version, zones):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.by_city = {zone.city.strip().casefold(): zone for zone in zones}
+        self.body = json.dumps([
+            {'city': zone.city, 'delivery_fee': str(zone.delivery_fee), 'estimated_days': zone.estimated_days}
+            for zone in zones
+        ]).encode()
+        self.etag = quote_etag(hashlib.sha256(self.body).hexdigest()[:32])
+
+
+_registry = None
+_lock = threading.Lock()
+
+
+def _current_version():
+    version = cache.get(ZONES_VERSION_KEY)
+    if version is None:
+        cache.add(ZONES_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(ZONES_VERSION_KEY)
+    return version
+
+
+def _is_current(loaded, version):
+    if loaded is None or loaded.version != version:
+        return False
+    max_age = settings.DELIVERY_ZONES_MAX_AGE
+    return not max_age or time.monotonic() - loaded.loaded_at < max_age
+
+
+def registry():
+    """The loaded zones, reloaded if another process (or this one) changed them"""
+    global _registry
+    version = _current_version()
+    loaded = _registry
+    if _is_current(loaded, version):
+        return loaded
+    with _lock:
+        if not _is_current(_registry, version):
+            zones = [
+                Zone(*row) for row in DeliveryZone.objects.filter(is_active=True)
+                .order_by('city').values_list('city', 'delivery_fee', 'estimated_days')
+            ]
+            _registry = _Registry(version, zones)
+            metrics.incr('delivery_zones.reload')
+        return _registry
+
+
+def zone_for(city):
+    """The active zone for a city (any case / surrounding spaces), or None"""
+    return registry().by_city.get((city or '').strip().casefold())
+
+
+def invalidate_delivery_zones():
+    """A zone changed: every process reloads on its next lookup (again on commit, like the catalog cache)"""
+    def bump():
+        cache.set(ZONES_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    bump()
+    transaction.on_commit(bump)
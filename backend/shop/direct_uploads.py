@@ -0,0 +1,183 @@
+"""
+Direct-to-storage product media uploads.
+
+The admin SPA asks for signed upload parameters, posts each file straight
+to Cloudinary with them, then calls finalize with the version/format
+Cloudinary returned, so media bytes never pass through Django. Every grant
+carries an upload_token (django.core.signing) naming the public id and
+kind it was issued for: finalize only attaches files we handed out.
+
+MEDIA_DIRECT_UPLOAD_BACKEND='local' swaps Cloudinary for a stand-in
+endpoint that writes under MEDIA_ROOT and answers like Cloudinary, for
+development and tests.
+"""
+import re
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from cloudinary.utils import api_sign_request
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from .media_uploads import UPLOAD_TARGETS, THUMBNAIL_TARGET, attach_media
+from .models import MediaUpload, ProductImage
+
+VIDEO_THUMBNAIL = 'video_thumbnail'
+# Cloudinary folder and resource type per kind
+KINDS = {**UPLOAD_TARGETS, VIDEO_THUMBNAIL: THUMBNAIL_TARGET}
+MAX_GRANTS = 20
+TOKEN_SALT = 'shop.direct_uploads'
+# Finalize still accepts a token this long after its grant lapsed (a video
+# started just before the deadline may take a while to land)
+FINALIZE_GRACE = timedelta(hours=1)
+VERSION_RE = re.compile(r'\d{1,20}')
+FORMAT_RE = re.compile(r'[a-z0-9]{1,10}')
+
+
+class DirectUploadError(ValueError):
+    pass
+
+
+def _local_backend():
+    return settings.MEDIA_DIRECT_UPLOAD_BACKEND == 'local'
+
+
+def grant_uploads(request, kind, count=1):
+    """
+    Signed parameters for `count` uploads of one kind. The client posts the
+    file as `file_field` together with `fields` to `upload_url`.
+    """
+    if kind not in KINDS:
+        raise DirectUploadError(f'kind must be one of {sorted(KINDS)}')
+    if not 1 <= count <= MAX_GRANTS:
+        raise DirectUploadError(f'count must be between 1 and {MAX_GRANTS}')
+    return [_grant(request, kind) for _ in range(count)]
+
+
+def _grant(request, kind):
+    folder, resource_type = KINDS[kind]
+    public_id = f'{folder}/{uuid.uuid4().hex}'
+    token = signing.dumps({'kind': kind, 'public_id': public_id, 'resource_type': resource_type}, salt=TOKEN_SALT)
+
+    if _local_backend():
+        upload_url = request.build_absolute_uri(reverse('admin_local_upload'))
+        fields = {'upload_token': token}
+    else:
+        # Cloudinary rejects a signed upload whose timestamp is over an hour old
+        params = {'public_id': public_id, 'timestamp': int(time.time())}
+        fields = {
+            **params,
+            'api_key': settings.CLOUDINARY_API_KEY,
+            'signature': api_sign_request(params, settings.CLOUDINARY_API_SECRET),
+        }
+        upload_url = f'https://api.cloudinary.com/v1_1/{settings.CLOUDINARY_CLOUD_NAME}/{resource_type}/upload'
+
+    return {
+        'kind': kind,
+        'upload_url': upload_url,
+        'fields': fields,
+        'file_field': 'file',
+        'upload_token': token,
+        'expires_at': timezone.now() + timedelta(seconds=settings.DIRECT_UPLOAD_TTL_SECONDS),
+    }
+
+
+def read_token(token, max_age):
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=max_age)
+    except signing.SignatureExpired:
+        raise DirectUploadError('Upload grant expired')
+    except signing.BadSignature:
+        raise DirectUploadError('Invalid upload token')
+
+
+def _local_path(public_id, fmt):
+    return Path(settings.MEDIA_ROOT) / f'{public_id}.{fmt}'
+
+
+def store_local_upload(token, uploaded_file):
+    """The local stand-in for Cloudinary's upload API: returns the same fields finalize needs"""
+    grant = read_token(token, settings.DIRECT_UPLOAD_TTL_SECONDS)
+    fmt = Path(uploaded_file.name or '').suffix.lstrip('.').lower()
+    if not FORMAT_RE.fullmatch(fmt):
+        raise DirectUploadError('File needs an extension')
+
+    path = _local_path(grant['public_id'], fmt)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        out = open(path, 'xb')
+    except FileExistsError:
+        raise DirectUploadError('Upload grant already used')
+    with out:
+        for chunk in uploaded_file.chunks():
+            out.write(chunk)
+
+    return {
+        'public_id': grant['public_id'],
+        'version': int(time.time()),
+        'format': fmt,
+        'resource_type': grant['resource_type'],
+        'type': 'upload',
+        'bytes': path.stat().st_size,
+    }
+
+
+def _resolve(upload):
+    """(kind, CloudinaryField value, order) for one finalize entry"""
+    grant = read_token(
+        upload.get('upload_token') or '',
+        settings.DIRECT_UPLOAD_TTL_SECONDS + FINALIZE_GRACE.total_seconds(),
+    )
+    version = str(upload.get('version') or '')
+    fmt = str(upload.get('format') or '').lower()
+    if not VERSION_RE.fullmatch(version) or not FORMAT_RE.fullmatch(fmt):
+        raise DirectUploadError('Each upload needs the version and format storage returned')
+    if _local_backend() and not _local_path(grant['public_id'], fmt).exists():
+        raise DirectUploadError(f"{grant['public_id']} was never uploaded")
+    order = upload.get('order')
+    if order is not None and not (isinstance(order, int) and order >= 0):
+        raise DirectUploadError('order must be a non-negative integer')
+    value = f"{grant['resource_type']}/upload/v{version}/{grant['public_id']}.{fmt}"
+    return grant['kind'], value, order
+
+
+def finalize_uploads(product, uploads, replace_images=False):
+    """
+    Attach directly uploaded files to a product, all or nothing.
+    Additional images keep the order they are listed in unless an entry
+    gives its own `order`; finalizing the same upload twice is a no-op.
+    """
+    if not uploads:
+        raise DirectUploadError('No uploads to finalize')
+    resolved = [_resolve(upload) for upload in uploads]
+    by_kind = {kind: [(value, order) for k, value, order in resolved if k == kind] for kind in KINDS}
+    for kind in (MediaUpload.IMAGE, MediaUpload.VIDEO, VIDEO_THUMBNAIL):
+        if len(by_kind[kind]) > 1:
+            raise DirectUploadError(f'Only one {kind} per product')
+
+    video = by_kind[MediaUpload.VIDEO][0][0] if by_kind[MediaUpload.VIDEO] else None
+    thumbnail = by_kind[VIDEO_THUMBNAIL][0][0] if by_kind[VIDEO_THUMBNAIL] else None
+    if thumbnail and not video and not hasattr(product, 'video'):
+        raise DirectUploadError('A video thumbnail needs a video')
+
+    with transaction.atomic():
+        if by_kind[MediaUpload.IMAGE]:
+            attach_media(product, MediaUpload.IMAGE, by_kind[MediaUpload.IMAGE][0][0])
+
+        additional = by_kind[MediaUpload.ADDITIONAL_IMAGE]
+        if additional and replace_images:
+            product.additional_images.all().delete()
+        for index, (value, order) in enumerate(additional):
+            if not ProductImage.objects.filter(product=product, image=value).exists():
+                attach_media(product, MediaUpload.ADDITIONAL_IMAGE, value, order=index if order is None else order)
+
+        if video:
+            attach_media(product, MediaUpload.VIDEO, video, thumbnail=thumbnail)
+        elif thumbnail:
+            product.video.thumbnail = thumbnail
+            product.video.save()
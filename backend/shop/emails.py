@@ -1,10 +1,9 @@
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
-from django.conf import settings
 from django.utils.html import strip_tags
+from .outbox import enqueue_email, enqueue_emails
 
-def send_order_confirmation_email(order):
-    """Send order confirmation email"""
+def build_order_confirmation_email(order):
+    """Render the order confirmation email"""
     subject = f'🐆 Order Confirmation #{order.id} - Kadi Thrift'
     
     # HTML email content
@@ -97,18 +96,16 @@ def send_order_confirmation_email(order):
     
     plain_message = strip_tags(html_message)
     
-    send_mail(
-        subject=subject,
-        message=plain_message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[order.user.email],
-        html_message=html_message,
-        fail_silently=False,
-    )
+    return {
+        'subject': subject,
+        'message': plain_message,
+        'recipient_list': [order.user.email],
+        'html_message': html_message,
+    }
 
 
-def send_order_status_email(order, old_status):
-    """Send email when order status changes"""
+def build_order_status_email(order, old_status):
+    """Render the email sent when order status changes (None if there is nothing to say)"""
     
     status_messages = {
         'processing': {
@@ -138,7 +135,7 @@ def send_order_status_email(order, old_status):
     }
     
     if order.status not in status_messages:
-        return
+        return None
     
     info = status_messages[order.status]
     
@@ -197,18 +194,16 @@ def send_order_status_email(order, old_status):
     
     plain_message = strip_tags(html_message)
     
-    send_mail(
-        subject=info['subject'],
-        message=plain_message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[order.user.email],
-        html_message=html_message,
-        fail_silently=False,
-    )
+    return {
+        'subject': info['subject'],
+        'message': plain_message,
+        'recipient_list': [order.user.email],
+        'html_message': html_message,
+    }
 
 
-def send_welcome_email(user):
-    """Send welcome email to new users"""
+def build_welcome_email(user):
+    """Render the welcome email for new users"""
     subject = '🐆 Welcome to Kadi Thrift!'
     
     html_message = f"""
@@ -280,11 +275,29 @@ def send_welcome_email(user):
     
     plain_message = strip_tags(html_message)
     
-    send_mail(
-        subject=subject,
-        message=plain_message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[user.email],
-        html_message=html_message,
-        fail_silently=False,
-    )
\ No newline at end of file
+    return {
+        'subject': subject,
+        'message': plain_message,
+        'recipient_list': [user.email],
+        'html_message': html_message,
+    }
+
+
+# The only way to send: rendering happens now, delivery happens in
+# the send_queued_emails worker so a slow mail server never blocks a request
+
+def queue_order_confirmation_email(order):
+    return enqueue_email(build_order_confirmation_email(order))
+
+
+def queue_order_status_email(order, old_status):
+    return enqueue_email(build_order_status_email(order, old_status))
+
+
+def queue_order_status_emails(changes):
+    """queue_order_status_email for many (order, old_status) pairs at once"""
+    return enqueue_emails(build_order_status_email(order, old_status) for order, old_status in changes)
+
+
+def queue_welcome_email(user):
+    return enqueue_email(build_welcome_email(user))
@@ -0,0 +1,198 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
+
+from .models import Product, Order, OrderItem, StockReservation
+from .catalog_cache import invalidate_products
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product):
+        self.product = product
+        super().__init__(f'Insufficient stock for {product.name}')
+
+
+def _take_stock(product_id, quantity):
+    """
+    Atomically decrement stock if enough is available.
+
+    A single conditional UPDATE: two checkouts racing for the last item
+    can't both succeed, and no row lock is held across Python code.
+    """
+    taken = Product.objects.filter(pk=product_id, stock__gte=quantity).update(
+        stock=F('stock') - quantity, updated_at=timezone.now()
+    ) == 1
+    if taken:
+        invalidate_products(product_id)
+    return taken
+
+
+def _return_stock(product_id, quantity):
+    Product.objects.filter(pk=product_id).update(
+        stock=F('stock') + quantity, updated_at=timezone.now()
+    )
+    invalidate_products(product_id)
+
+
+def _return_stock_many(quantities):
+    """Hand back {product_id: quantity} in a single UPDATE"""
+    if not quantities:
+        return
+    Product.objects.filter(pk__in=quantities).update(
+        stock=F('stock') + Case(
+            *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+            output_field=IntegerField(),
+        ),
+        updated_at=timezone.now(),
+    )
+    invalidate_products(*quantities)
+
+
+def _take_stock_many(quantities):
+    """
+    Take {product_id: quantity} in a single conditional UPDATE. Returns
+    False if any product is short; the caller rolls the partial update back.
+    """
+    available = Q()
+    for pk, quantity in quantities.items():
+        available |= Q(pk=pk, stock__gte=quantity)
+    taken = Product.objects.filter(available).update(
+        stock=F('stock') - Case(
+            *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+            output_field=IntegerField(),
+        ),
+        updated_at=timezone.now(),
+    )
+    if taken == len(quantities):
+        invalidate_products(*quantities)
+        return True
+    return False
+
+
+def reserve_stock(order, lines):
+    """
+    Hold stock for every (product, quantity) in lines against order.
+
+    Raises InsufficientStock (and takes nothing) if any line can't be
+    satisfied. All products are decremented by one statement, so a
+    multi-item checkout holds no row lock across Python code.
+    """
+    quantities = defaultdict(int)
+    for product, quantity in lines:
+        quantities[product.pk] += quantity
+    products = {product.pk: product for product, _ in lines}
+    expires_at = timezone.now() + timedelta(minutes=settings.STOCK_RESERVATION_MINUTES)
+    with transaction.atomic():
+        if _take_stock_many(quantities):
+            StockReservation.objects.bulk_create([
+                StockReservation(order=order, product=products[pk], quantity=quantity, expires_at=expires_at)
+                for pk, quantity in quantities.items()
+            ])
+            return
+        # Undo the rows that were decremented
+        transaction.set_rollback(True)
+
+    # Name the product that ran out (the UPDATE only says something did)
+    stock = dict(Product.objects.filter(pk__in=quantities).values_list('pk', 'stock'))
+    short = next((pk for pk in sorted(quantities) if stock.get(pk, 0) < quantities[pk]), min(quantities))
+    raise InsufficientStock(products[short])
+
+
+def commit_reservations(order):
+    """
+    Order is paid: its held stock is now sold.
+
+    Holds that already expired gave their stock back, so try to take it
+    again. Orders from before reservations existed fall back to taking
+    stock for their items.
+    """
+    with transaction.atomic():
+        reservations = list(order.stock_reservations.select_for_update().select_related('product'))
+        if not reservations:
+            for item in OrderItem.objects.filter(order=order).select_related('product'):
+                if _take_stock(item.product_id, item.quantity):
+                    print(f"✅ Reduced stock for {item.product.name}: {item.quantity} units")
+                else:
+                    print(f"⚠️ Warning: Insufficient stock for {item.product.name}")
+            return
+
+        for reservation in reservations:
+            if reservation.status == StockReservation.RELEASED:
+                if not _take_stock(reservation.product_id, reservation.quantity):
+                    print(f"⚠️ Warning: Insufficient stock for {reservation.product.name} (hold had expired)")
+        order.stock_reservations.exclude(status=StockReservation.COMMITTED).update(
+            status=StockReservation.COMMITTED
+        )
+
+
+def release_reservations(order):
+    """Payment failed or the order was cancelled before payment: hand held stock back"""
+    with transaction.atomic():
+        held = list(order.stock_reservations.select_for_update().filter(status=StockReservation.HELD))
+        for reservation in held:
+            _return_stock(reservation.product_id, reservation.quantity)
+        StockReservation.objects.filter(pk__in=[r.pk for r in held]).update(status=StockReservation.RELEASED)
+    return len(held)
+
+
+def restock_order(order):
+    """A paid order was cancelled: put its items back on the shelf"""
+    with transaction.atomic():
+        for item in OrderItem.objects.filter(order=order).select_related('product'):
+            _return_stock(item.product_id, item.quantity)
+            print(f"✅ Restored stock for {item.product.name}: {item.quantity} units")
+
+
+def release_orders_reservations(order_ids):
+    """release_reservations for many orders at once: one stock UPDATE in total"""
+    with transaction.atomic():
+        held = list(
+            StockReservation.objects.select_for_update()
+            .filter(order_id__in=order_ids, status=StockReservation.HELD)
+            .values_list('pk', 'product_id', 'quantity')
+        )
+        quantities = defaultdict(int)
+        for _, product_id, quantity in held:
+            quantities[product_id] += quantity
+        _return_stock_many(quantities)
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in held]).update(status=StockReservation.RELEASED)
+    return len(held)
+
+
+def restock_orders(order_ids):
+    """restock_order for many cancelled paid orders: one stock UPDATE in total"""
+    quantities = dict(
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .order_by()
+        .values('product_id')
+        .annotate(quantity=Sum('quantity'))
+        .values_list('product_id', 'quantity')
+    )
+    _return_stock_many(quantities)
+    return quantities
+
+
+def release_expired_reservations(now=None):
+    """
+    Release every hold past its expiry and mark its unpaid order expired.
+    Returns the number of orders released.
+    """
+    now = now or timezone.now()
+    order_ids = (
+        StockReservation.objects.filter(status=StockReservation.HELD, expires_at__lte=now)
+        .values_list('order_id', flat=True)
+        .distinct()
+    )
+    released = 0
+    for order in Order.objects.filter(pk__in=list(order_ids)).exclude(payment_status='completed'):
+        with transaction.atomic():
+            release_reservations(order)
+            Order.objects.filter(pk=order.pk).exclude(payment_status='completed').update(
+                payment_status='expired', status='cancelled', updated_at=now
+            )
+        released += 1
+    return released
@@ -0,0 +1,80 @@
+import statistics
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import HttpResponse
+# Test utilities stay in this command, never in modules the web process or workers load
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+
+def _touch_session(request):
+    # What an allauth / admin request does: read the session, change it
+    request.session['visits'] = request.session.get('visits', 0) + 1
+    return HttpResponse()
+
+
+def benchmark_engine(name, requests=200):
+    """
+    Run `requests` requests through SessionMiddleware with one session
+    stored by engine `name` (a SESSION_BACKEND value), each reading and
+    updating it. Returns per-request latency (ms) and database queries.
+    """
+    engine = settings.SESSION_ENGINES[name]
+    cookie_name = settings.SESSION_COOKIE_NAME
+    factory = RequestFactory()
+    timings, queries, cookie = [], 0, None
+    with override_settings(SESSION_ENGINE=engine):
+        middleware = SessionMiddleware(_touch_session)
+        for _ in range(requests):
+            request = factory.get('/')
+            if cookie:
+                request.COOKIES[cookie_name] = cookie
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = middleware(request)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries += len(ctx.captured_queries)
+            if cookie_name in response.cookies:
+                cookie = response.cookies[cookie_name].value
+
+        # Leave nothing behind
+        if cookie:
+            import_module(engine).SessionStore(cookie).delete()
+
+    timings.sort()
+    return {
+        'engine': name,
+        'requests': requests,
+        'mean_ms': statistics.fmean(timings),
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'queries_per_request': queries / requests,
+    }
+
+
+
+class Command(BaseCommand):
+    help = 'Compare per-request session cost (latency and DB queries) across SESSION_BACKEND engines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('engines', nargs='*', help=f'Engines to compare (default: all of {", ".join(settings.SESSION_ENGINES)})')
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        engines = options['engines'] or list(settings.SESSION_ENGINES)
+        unknown = set(engines) - set(settings.SESSION_ENGINES)
+        if unknown:
+            raise CommandError(f"Unknown engine(s): {', '.join(sorted(unknown))}")
+        self.stdout.write(f"📊 {options['requests']} requests per engine, cache backend: {settings.CACHE_BACKEND}")
+        self.stdout.write(f"{'engine':<16}{'mean ms':>10}{'p95 ms':>10}{'queries/req':>14}")
+        for name in engines:
+            result = benchmark_engine(name, options['requests'])
+            current = '  ← current' if settings.SESSION_ENGINE == settings.SESSION_ENGINES[name] else ''
+            self.stdout.write(
+                f"{name:<16}{result['mean_ms']:>10.3f}{result['p95_ms']:>10.3f}"
+                f"{result['queries_per_request']:>14.2f}{current}"
+            )
@@ -0,0 +1,35 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.bulk_io import export_orders, export_products
+
+
+class Command(BaseCommand):
+    help = 'Stream the product catalog or order items to CSV / JSONL without loading the table into memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=['products', 'orders'])
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--output', default='-', help="File to write, or '-' for stdout")
+        parser.add_argument('--status', help='Orders only: filter by order status')
+        parser.add_argument('--start', type=date.fromisoformat, help='Orders only: YYYY-MM-DD')
+        parser.add_argument('--end', type=date.fromisoformat, help='Orders only: YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        if options['dataset'] == 'products':
+            chunks = export_products(options['format'])
+        else:
+            chunks = export_orders(options['format'], options['status'], options['start'], options['end'])
+
+        try:
+            out = sys.stdout if options['output'] == '-' else open(options['output'], 'w', encoding='utf-8', newline='')
+        except OSError as e:
+            raise CommandError(e)
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout:
+                out.close()
@@ -0,0 +1,35 @@
+import json
+import sys
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.bulk_io import IMPORT_BATCH_SIZE, format_for, import_products
+
+
+class Command(BaseCommand):
+    help = 'Bulk create/update products from a CSV or JSONL file (rows with an id update that product)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Default: from the file extension')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Validate only, write nothing')
+
+    def handle(self, *args, **options):
+        fmt = format_for(options['path'], options['format'])
+        try:
+            # Only close what we opened: stdin belongs to the caller
+            opened = nullcontext(sys.stdin) if options['path'] == '-' else open(
+                options['path'], encoding='utf-8-sig', newline=''
+            )
+        except OSError as e:
+            raise CommandError(e)
+
+        with opened as stream:
+            report = import_products(stream, fmt, dry_run=options['dry_run'], batch_size=options['batch_size'])
+
+        for error in report.errors:
+            self.stderr.write(f"Line {error['line']}: {json.dumps(error['errors'])}")
+        prefix = 'Dry run: would create' if report.dry_run else '📦 Created'
+        self.stdout.write(f'{prefix} {report.created}, updated {report.updated}, failed {report.failed} of {report.rows} rows')
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.media_uploads import process_media_uploads
+
+
+class Command(BaseCommand):
+    help = 'Push staged product images and videos to Cloudinary, several at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling every --interval seconds')
+        parser.add_argument('--interval', type=int, default=2)
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--concurrency', type=int, default=None, help='Uploads in flight at once (default MEDIA_UPLOAD_CONCURRENCY)')
+
+    def handle(self, *args, **options):
+        while True:
+            done, retried, failed = process_media_uploads(options['batch_size'], options['concurrency'])
+            if done or retried or failed:
+                self.stdout.write(f'🖼️ Uploaded {done}, retrying {retried}, failed {failed}')
+            # Work through a backlog without sleeping between full batches
+            if done + retried + failed == options['batch_size']:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.sessions import PURGE_BATCH_SIZE, purge_expired_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete expired rows from the django_session table in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, purging every --interval seconds')
+        parser.add_argument('--interval', type=int, default=3600)
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = purge_expired_sessions(batch_size=options['batch_size'])
+            if deleted:
+                self.stdout.write(self.style.SUCCESS(f'✅ Purged {deleted} expired session(s)'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
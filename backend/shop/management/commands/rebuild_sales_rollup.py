@@ -0,0 +1,23 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.rollups import rebuild_rollup
+
+
+class Command(BaseCommand):
+    help = 'Backfill or rebuild the DailySalesRollup table from paid orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD). Default: beginning of history')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD). Default: today')
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else None
+            end = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError:
+            raise CommandError('Dates must be in YYYY-MM-DD format')
+
+        written = rebuild_rollup(start=start, end=end)
+        self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt sales rollup: {written} row(s) written'))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.payments import reconcile_payments
+
+
+class Command(BaseCommand):
+    help = 'Look up the Pesapal status of unsettled orders and apply it (catches missed IPNs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling every --interval seconds')
+        parser.add_argument('--interval', type=int, default=15)
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--concurrency', type=int, default=8, help='Status lookups in flight at once')
+
+    def handle(self, *args, **options):
+        while True:
+            checked, settled, errors = reconcile_payments(options['batch_size'], options['concurrency'])
+            if checked or errors:
+                self.stdout.write(f'💳 Checked {checked} orders, settled {settled}, lookup errors {errors}')
+            # Work through a backlog without sleeping between full batches
+            if checked + errors == options['batch_size']:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.inventory import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = 'Release stock held by unpaid orders whose reservation has expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, checking every --interval seconds')
+        parser.add_argument('--interval', type=int, default=60)
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired_reservations()
+            if released:
+                self.stdout.write(self.style.SUCCESS(f'✅ Released stock for {released} expired order(s)'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.outbox import deliver_batch
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails from the outbox, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling every --interval seconds')
+        parser.add_argument('--interval', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        while True:
+            sent, retried, failed = deliver_batch(options['batch_size'])
+            if sent or retried or failed:
+                self.stdout.write(f'📧 Sent {sent}, retrying {retried}, failed {failed}')
+            # Drain a backlog without sleeping between full batches
+            if sent + retried + failed == options['batch_size']:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,78 @@
+"""
+Cloudinary delivery URLs for product media.
+
+Every image URL goes through the same builder: format and quality are
+chosen by Cloudinary (f_auto,q_auto) and the width is capped (c_limit),
+so a phone asking for a thumbnail never downloads the multi-megabyte
+original. URLs are pure string work on (public id, transformation) and
+are memoized per process.
+"""
+import re
+from functools import lru_cache
+
+from cloudinary.models import CLOUDINARY_FIELD_DB_RE
+from django.conf import settings
+
+# Width caps per use
+THUMBNAIL_WIDTH = 480
+DETAIL_WIDTH = 1280
+ORDER_ITEM_WIDTH = 160
+VIDEO_POSTER_WIDTH = 640
+# Candidate widths offered to the browser in srcset
+SRCSET_WIDTHS = (320, 480, 640, 960, 1280)
+
+
+def _public_id(value):
+    """
+    (public id with format, version) from a CloudinaryField value. Without
+    Cloudinary credentials the field holds the raw stored string
+    ('image/upload/v123/abc.jpg'), which is parsed the same way.
+    """
+    if not value:
+        return None, None
+    if isinstance(value, str):
+        m = re.match(CLOUDINARY_FIELD_DB_RE, value)
+        public_id, fmt, version = m.group('public_id'), m.group('format'), m.group('version')
+    else:
+        public_id, fmt, version = value.public_id, value.format, value.version
+    if fmt:
+        public_id = f'{public_id}.{fmt}'
+    return public_id, version
+
+
+def build_url(public_id, resource_type='image', transformation='', version=None):
+    return _build_url(settings.CLOUDINARY_CLOUD_NAME, public_id, resource_type, transformation, version)
+
+
+@lru_cache(maxsize=8192)
+def _build_url(cloud_name, public_id, resource_type, transformation, version):
+    parts = [f'https://res.cloudinary.com/{cloud_name}', resource_type, 'upload']
+    if transformation:
+        parts.append(transformation)
+    if version:
+        parts.append(f'v{version}')
+    parts.append(public_id)
+    return '/'.join(parts)
+
+
+def image_url(value, width=None):
+    """Optimised image URL, no wider than width (None keeps the original size)"""
+    public_id, version = _public_id(value)
+    if not public_id:
+        return None
+    transformation = 'f_auto,q_auto' + (f',c_limit,w_{width}' if width else '')
+    return build_url(public_id, 'image', transformation, version)
+
+
+def image_srcset(value, widths=SRCSET_WIDTHS):
+    """srcset value so the browser picks the smallest variant that fills the slot"""
+    if not value:
+        return None
+    return ', '.join(f'{image_url(value, width)} {width}w' for width in widths)
+
+
+def video_url(value):
+    public_id, version = _public_id(value)
+    if not public_id:
+        return None
+    return build_url(public_id, 'video', 'q_auto', version)
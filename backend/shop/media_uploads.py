@@ -0,0 +1,271 @@
+"""
+Off-request product media uploads.
+
+The admin product endpoints stream each file into a local staging
+directory and record a MediaUpload row; the product is saved straight away
+with media_status='processing'. The process_media_uploads worker pushes
+staged files to Cloudinary several at a time and attaches the results to
+the product as they land. Failed uploads back off and retry like the
+email outbox; one that gives up keeps its staged file so it can be
+retried from the Django admin.
+"""
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from pathlib import Path
+
+import cloudinary.uploader
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from . import metrics
+from .models import MediaUpload, Product, ProductImage, ProductVideo
+from .outbox import backoff_delay
+
+MAX_ATTEMPTS = 5
+CLAIM_LEASE = timedelta(minutes=10)
+# Cloudinary folder and resource type per kind (same folders as the model fields)
+UPLOAD_TARGETS = {
+    MediaUpload.IMAGE: ('products', 'image'),
+    MediaUpload.ADDITIONAL_IMAGE: ('products/additional', 'image'),
+    MediaUpload.VIDEO: ('products/videos', 'video'),
+}
+THUMBNAIL_TARGET = ('products/video_thumbnails', 'image')
+
+metrics.register_timers('media.upload')
+
+
+def staging_root():
+    return Path(settings.MEDIA_UPLOAD_STAGING_DIR)
+
+
+def stage_file(uploaded_file):
+    """
+    Put an uploaded file in the staging area without loading it into memory.
+    Returns (path relative to the staging root, size in bytes).
+    """
+    root = staging_root()
+    root.mkdir(parents=True, exist_ok=True)
+    name = f"{uuid.uuid4().hex}_{get_valid_filename(os.path.basename(uploaded_file.name or 'upload'))}"
+    target = root / name
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        # Large uploads are already on disk (TemporaryUploadedFile): just move them
+        shutil.move(uploaded_file.temporary_file_path(), target)
+    else:
+        with open(target, 'wb') as out:
+            for chunk in uploaded_file.chunks():
+                out.write(chunk)
+    return name, target.stat().st_size
+
+
+def discard_staged_files(upload):
+    """Remove an upload's staged files (after it lands, or when the row is deleted)"""
+    for path in (upload.staged_path, upload.thumbnail_path):
+        if path:
+            try:
+                (staging_root() / path).unlink()
+            except FileNotFoundError:
+                pass
+
+
+def stage_product_media(product, files):
+    """
+    Stage the media files of an admin create/update request (request.FILES)
+    for upload. Returns the new MediaUpload rows; if there are any the
+    product is marked as processing.
+    """
+    jobs = []
+
+    def add(kind, uploaded_file, order=0, thumbnail=None):
+        path, size = stage_file(uploaded_file)
+        thumbnail_path = stage_file(thumbnail)[0] if thumbnail else ''
+        jobs.append(MediaUpload(
+            product=product,
+            kind=kind,
+            order=order,
+            original_name=(uploaded_file.name or '')[:255],
+            size=size,
+            staged_path=path,
+            thumbnail_path=thumbnail_path,
+            next_attempt_at=timezone.now(),
+        ))
+
+    if files.get('image'):
+        add(MediaUpload.IMAGE, files['image'])
+    for index, image_file in enumerate(files.getlist('additional_images')):
+        add(MediaUpload.ADDITIONAL_IMAGE, image_file, order=index)
+    if files.get('video'):
+        add(MediaUpload.VIDEO, files['video'], thumbnail=files.get('video_thumbnail'))
+
+    if not jobs:
+        return jobs
+
+    with transaction.atomic():
+        # Progress reports on the latest batch only
+        product.media_uploads.exclude(status=MediaUpload.PENDING).delete()
+        MediaUpload.objects.bulk_create(jobs)
+        product.media_status = Product.MEDIA_PROCESSING
+        product.save(update_fields=['media_status', 'updated_at'])
+    return jobs
+
+
+def upload_to_cloudinary(path, folder, resource_type):
+    """Upload one file; returns the value a CloudinaryField stores for it"""
+    result = cloudinary.uploader.upload(str(path), folder=folder, resource_type=resource_type)
+    return f"{result['resource_type']}/{result['type']}/v{result['version']}/{result['public_id']}.{result['format']}"
+
+
+def claim_upload_batch(batch_size):
+    """Lease up to batch_size due uploads to this worker"""
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            MediaUpload.objects.select_for_update(skip_locked=True)
+            .filter(status=MediaUpload.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        MediaUpload.objects.filter(pk__in=[u.pk for u in batch]).update(next_attempt_at=now + CLAIM_LEASE)
+    return batch
+
+
+def _upload(job):
+    """Runs on a pool thread: network only, no database access"""
+    started = time.perf_counter()
+    ok = False
+    try:
+        folder, resource_type = UPLOAD_TARGETS[job.kind]
+        value = upload_to_cloudinary(staging_root() / job.staged_path, folder, resource_type)
+        thumbnail = None
+        if job.thumbnail_path:
+            thumbnail = upload_to_cloudinary(staging_root() / job.thumbnail_path, *THUMBNAIL_TARGET)
+        ok = True
+        return value, thumbnail
+    finally:
+        metrics.record_timing('media.upload', (time.perf_counter() - started) * 1000, ok=ok)
+
+
+def attach_media(product, kind, value, order=0, thumbnail=None):
+    """
+    Point a product at an uploaded file (a CloudinaryField value). post_save
+    signals refresh the caches. Used by the worker and by direct uploads.
+    """
+    if kind == MediaUpload.IMAGE:
+        product.image = value
+        product.save(update_fields=['image', 'updated_at'])
+    elif kind == MediaUpload.ADDITIONAL_IMAGE:
+        ProductImage.objects.create(product=product, image=value, order=order)
+    else:
+        ProductVideo.objects.update_or_create(product=product, defaults={'video': value, 'thumbnail': thumbnail})
+
+
+def _attach(job, value, thumbnail):
+    product = Product.objects.select_for_update().get(pk=job.product_id)
+    attach_media(product, job.kind, value, job.order, thumbnail)
+
+
+def refresh_media_status(product_id):
+    """processing while anything is pending, failed if an upload gave up, else ready"""
+    counts = MediaUpload.objects.filter(product_id=product_id).aggregate(
+        pending=Count('id', filter=Q(status=MediaUpload.PENDING)),
+        failed=Count('id', filter=Q(status=MediaUpload.FAILED)),
+    )
+    if counts['pending']:
+        media_status = Product.MEDIA_PROCESSING
+    elif counts['failed']:
+        media_status = Product.MEDIA_FAILED
+    else:
+        media_status = Product.MEDIA_READY
+    product = Product.objects.filter(pk=product_id).first()
+    if product and product.media_status != media_status:
+        product.media_status = media_status
+        product.save(update_fields=['media_status', 'updated_at'])
+
+
+def _save_job(job):
+    # update() rather than save(): the row is gone if the product was deleted mid-upload
+    MediaUpload.objects.filter(pk=job.pk).update(
+        attempts=job.attempts, status=job.status, next_attempt_at=job.next_attempt_at,
+        finished_at=job.finished_at, last_error=job.last_error,
+    )
+
+
+def process_media_uploads(batch_size=20, concurrency=None):
+    """
+    Upload one batch of staged media, `concurrency` files at a time.
+    Returns (done, retried, failed) counts.
+    """
+    batch = claim_upload_batch(batch_size)
+    done = retried = failed = 0
+    if not batch:
+        return done, retried, failed
+
+    workers = max(1, concurrency or settings.MEDIA_UPLOAD_CONCURRENCY)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        uploads = {pool.submit(_upload, job): job for job in batch}
+        for future in as_completed(uploads):
+            job = uploads[future]
+            job.attempts += 1
+            try:
+                value, thumbnail = future.result()
+                with transaction.atomic():
+                    _attach(job, value, thumbnail)
+                    job.status = MediaUpload.DONE
+                    job.finished_at = timezone.now()
+                    job.last_error = ''
+                    _save_job(job)
+                done += 1
+            except Product.DoesNotExist:
+                # Deleted while its media was in flight (the job row and files went with it)
+                continue
+            except Exception as e:
+                job.last_error = str(e)
+                if job.attempts >= MAX_ATTEMPTS:
+                    job.status = MediaUpload.FAILED
+                    job.finished_at = timezone.now()
+                    failed += 1
+                    print(f"❌ Giving up on upload #{job.id} for product {job.product_id}: {e}")
+                else:
+                    job.status = MediaUpload.PENDING
+                    job.finished_at = None
+                    job.next_attempt_at = timezone.now() + backoff_delay(job.attempts)
+                    retried += 1
+                    print(f"⚠️ Upload #{job.id} failed (attempt {job.attempts}), retrying: {e}")
+                _save_job(job)
+
+            if job.status == MediaUpload.DONE:
+                discard_staged_files(job)
+            refresh_media_status(job.product_id)
+
+    return done, retried, failed
+
+
+def media_progress(product):
+    """Upload progress for the admin polling endpoint"""
+    uploads = list(product.media_uploads.all())
+    return {
+        'product_id': product.id,
+        'media_status': product.media_status,
+        'total': len(uploads),
+        'done': sum(u.status == MediaUpload.DONE for u in uploads),
+        'failed': sum(u.status == MediaUpload.FAILED for u in uploads),
+        'pending': sum(u.status == MediaUpload.PENDING for u in uploads),
+        'uploads': [
+            {
+                'id': u.id,
+                'kind': u.kind,
+                'order': u.order,
+                'name': u.original_name,
+                'size': u.size,
+                'status': u.status,
+                'attempts': u.attempts,
+                'error': u.last_error,
+            }
+            for u in uploads
+        ],
+    }
@@ -0,0 +1,92 @@
+"""
+Lightweight counters and latency timings kept in the Django cache.
+
+Every event costs one cache incr: a counter bump, or for a timing the
+counter of its (outcome, latency bucket) pair, from which snapshot()
+derives the totals. With a shared cache (CACHE_BACKEND=redis or file)
+every worker and --loop command reports into the same numbers; with the
+default local-memory cache each process keeps its own, so the admin
+metrics endpoint only shows what the web process that answered saw.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+KEY_PREFIX = 'metrics:'
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000)
+
+_timers = set()
+_counters = set()
+
+
+def register_timers(*names):
+    """Declare timers up front so snapshot() lists them even before they fire in this process"""
+    _timers.update(names)
+
+
+def register_counters(*names):
+    _counters.update(names)
+
+
+def _incr(key, delta=1):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # First write (or evicted): add() so two racing writers can't both reset it
+        if cache.add(key, delta, timeout=None):
+            return delta
+        return cache.incr(key, delta)
+
+
+def incr(name, delta=1):
+    _counters.add(name)
+    _incr(f'{KEY_PREFIX}count:{name}', delta)
+
+
+def _bucket(elapsed_ms):
+    return next((str(b) for b in LATENCY_BUCKETS_MS if elapsed_ms <= b), 'inf')
+
+
+def _timing_key(name, outcome, bucket):
+    return f'{KEY_PREFIX}timing:{name}:{outcome}:le_{bucket}'
+
+
+def _timing_keys(name):
+    """{(outcome, bucket): cache key} for every counter behind a timer"""
+    buckets = [str(b) for b in LATENCY_BUCKETS_MS] + ['inf']
+    return {(outcome, b): _timing_key(name, outcome, b) for outcome in ('ok', 'error') for b in buckets}
+
+
+def record_timing(name, elapsed_ms, ok=True):
+    _timers.add(name)
+    _incr(_timing_key(name, 'ok' if ok else 'error', _bucket(elapsed_ms)))
+
+
+def _timing_snapshot(name):
+    keys = _timing_keys(name)
+    values = cache.get_many(list(keys.values()))
+    counts = {pair: values.get(key, 0) for pair, key in keys.items()}
+    histogram = {}
+    for (_, bucket), count in counts.items():
+        histogram[bucket] = histogram.get(bucket, 0) + count
+    return {
+        'count': sum(histogram.values()),
+        'errors': sum(count for (outcome, _), count in counts.items() if outcome == 'error'),
+        'histogram_ms': histogram,
+    }
+
+
+def snapshot():
+    counter_values = cache.get_many([f'{KEY_PREFIX}count:{name}' for name in _counters])
+    return {
+        'scope': 'shared' if settings.SHARED_CACHE else 'process',
+        'timers': {name: _timing_snapshot(name) for name in sorted(_timers)},
+        'counters': {name: counter_values.get(f'{KEY_PREFIX}count:{name}', 0) for name in sorted(_counters)},
+    }
+
+
+def reset():
+    """Clear every known metric (used by tests and after deploys)"""
+    keys = [f'{KEY_PREFIX}count:{name}' for name in _counters]
+    for name in _timers:
+        keys += _timing_keys(name).values()
+    cache.delete_many(keys)
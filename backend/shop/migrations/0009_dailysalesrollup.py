@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_product_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('category', models.CharField(max_length=100)),
+                ('city', models.CharField(max_length=100)),
+                ('payment_method', models.CharField(blank=True, default='', max_length=50)),
+                ('order_count', models.IntegerField(default=0)),
+                ('units_sold', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+            options={
+                'ordering': ['-date', 'category'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'category', 'city', 'payment_method'), name='unique_daily_sales_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_outboxemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_tracking_id', models.CharField(max_length=255, unique=True)),
+                ('merchant_reference', models.CharField(blank=True, max_length=255)),
+                ('notification_type', models.CharField(blank=True, max_length=50)),
+                ('status', models.CharField(choices=[('received', 'Received'), ('processing', 'Processing'), ('processed', 'Processed')], default='received', max_length=20)),
+                ('times_received', models.PositiveIntegerField(default=1)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('payment_status', models.CharField(blank=True, max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:03
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from shop.search import install_search_index
+    install_search_index(schema_editor.connection, rebuild=True)
+
+
+def drop_search_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        if schema_editor.connection.vendor == 'postgresql':
+            cursor.execute("DROP TRIGGER IF EXISTS shop_product_search_vector_trg ON shop_product")
+            cursor.execute("DROP FUNCTION IF EXISTS shop_product_search_vector()")
+            cursor.execute("DROP INDEX IF EXISTS product_search_vector_idx")
+            cursor.execute("DROP INDEX IF EXISTS product_name_trgm_idx")
+        elif schema_editor.connection.vendor == 'sqlite':
+            for trigger in ('shop_product_fts_ai', 'shop_product_fts_ad', 'shop_product_fts_au'):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            cursor.execute("DROP TABLE IF EXISTS shop_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_order_payment_reconciliation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(install_search_index, drop_search_index),
+    ]
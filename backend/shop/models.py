@@ -1,9 +1,25 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
 from django.utils.text import slugify
 import uuid
 from cloudinary.models import CloudinaryField
 
+
+class ProductQuerySet(models.QuerySet):
+    def with_media(self):
+        """Load the images and video ProductSerializer needs in 2 queries total"""
+        return self.select_related('video').prefetch_related('additional_images')
+
+
+class OrderQuerySet(models.QuerySet):
+    def with_details(self):
+        """Load everything OrderSerializer touches (user, items, item products) up front"""
+        return self.select_related('user').prefetch_related(
+            models.Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+        )
+
+
 class Product(models.Model):
     CONDITION_CHOICES = [
         ('new', 'New'),
@@ -39,25 +55,60 @@ class Product(models.Model):
     image = CloudinaryField('image', folder='products', blank=True, null=True)
     
     # Status fields
+    MEDIA_READY = 'ready'
+    MEDIA_PROCESSING = 'processing'
+    MEDIA_FAILED = 'failed'
+    MEDIA_STATUS_CHOICES = [
+        (MEDIA_READY, 'Ready'),
+        (MEDIA_PROCESSING, 'Processing'),
+        (MEDIA_FAILED, 'Failed'),
+    ]
+
     is_active = models.BooleanField(default=True)
+    # Uploads staged by the admin endpoints and still on their way to
+    # Cloudinary (see MediaUpload / shop.media_uploads)
+    media_status = models.CharField(max_length=20, choices=MEDIA_STATUS_CHOICES, default=MEDIA_READY)
     slug = models.SlugField(unique=True, blank=True, max_length=300)
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    
+
+    # Maintained by a database trigger on PostgreSQL (see shop.search);
+    # unused on SQLite, which searches the shop_product_fts table instead
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
+
+    @staticmethod
+    def make_slug(name):
+        # Slug from name plus a unique identifier (no query needed to keep it unique)
+        base_slug = slugify(name)
+        unique_id = str(uuid.uuid4())[:8]
+        return f"{base_slug}-{unique_id}"
+
     def save(self, *args, **kwargs):
         if not self.slug:
-            # Generate slug from name
-            base_slug = slugify(self.name)
-            # Add unique identifier to ensure uniqueness
-            unique_id = str(uuid.uuid4())[:8]
-            self.slug = f"{base_slug}-{unique_id}"
+            self.slug = self.make_slug(self.name)
         super().save(*args, **kwargs)
-    
+
     def __str__(self):
         return self.name
 
+    class Meta:
+        # Back the catalog filters / sort orders in ProductViewSet so a
+        # cursor page is an index range scan regardless of catalog size
+        indexes = [
+            models.Index(fields=['is_active', '-created_at', '-id'], name='product_active_newest_idx'),
+            models.Index(fields=['is_active', 'price', 'id'], name='product_active_price_idx'),
+            models.Index(fields=['is_active', 'name', 'id'], name='product_active_name_idx'),
+            models.Index(fields=['is_active', 'category', '-created_at'], name='product_active_category_idx'),
+            models.Index(fields=['is_active', 'size'], name='product_active_size_idx'),
+            models.Index(fields=['is_active', 'condition'], name='product_active_condition_idx'),
+            # Max(updated_at) for catalog ETags (shop.conditional)
+            models.Index(fields=['is_active', 'updated_at'], name='product_active_updated_idx'),
+        ]
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='additional_images')
     image = CloudinaryField('image', folder='products/additional')  # Changed
@@ -77,6 +128,60 @@ class ProductVideo(models.Model):
     def __str__(self):
         return f"{self.product.name} - Video"
 
+
+class MediaUpload(models.Model):
+    """
+    A product image or video staged on local disk, waiting for the
+    process_media_uploads worker to push it to Cloudinary.
+
+    The admin product endpoints only stream files into the staging area and
+    insert rows here, so a product with many photos is saved in one short
+    request and its uploads run in parallel off the request path.
+    """
+    IMAGE = 'image'
+    ADDITIONAL_IMAGE = 'additional_image'
+    VIDEO = 'video'
+    KIND_CHOICES = [
+        (IMAGE, 'Main image'),
+        (ADDITIONAL_IMAGE, 'Additional image'),
+        (VIDEO, 'Video'),
+    ]
+
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='media_uploads')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    order = models.PositiveIntegerField(default=0)
+    original_name = models.CharField(max_length=255, blank=True)
+    size = models.PositiveBigIntegerField(default=0)
+    # Paths relative to MEDIA_UPLOAD_STAGING_DIR; a video's thumbnail goes up with it
+    staged_path = models.CharField(max_length=500)
+    thumbnail_path = models.CharField(max_length=500, blank=True)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='mediaupload_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} for {self.product_id} ({self.status})"
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -107,12 +212,23 @@ class Order(models.Model):
     pesapal_merchant_reference = models.CharField(max_length=255, blank=True, null=True)
     payment_status = models.CharField(max_length=20, default='pending')
     payment_method = models.CharField(max_length=50, blank=True, null=True)  # mpesa, card, etc.
+
+    # Last GetTransactionStatus lookup (IPN, verify_payment or the
+    # reconcile_payments worker) and when the worker should look again
+    payment_checked_at = models.DateTimeField(blank=True, null=True)
+    next_payment_check_at = models.DateTimeField(blank=True, null=True)
+    payment_check_attempts = models.PositiveIntegerField(default=0)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    
+
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['payment_status', 'next_payment_check_at'], name='order_payment_check_idx'),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} - {self.user.username}"
@@ -128,6 +244,40 @@ class OrderItem(models.Model):
     def get_total(self):
         return self.quantity * self.price
     
+class Cart(models.Model):
+    """
+    A shopper's server-side cart. subtotal and item_count are running
+    totals moved by every add/remove and price change (shop.cart), so
+    pricing the cart never sums its items.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
+    shipping_city = models.CharField(max_length=100, blank=True)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Cart of {self.user.username}"
+
+
+class CartItem(models.Model):
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='cart_items')
+    quantity = models.PositiveIntegerField()
+    # The price counted in cart.subtotal; follows the product's price
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    added_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['added_at', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='cartitem_unique_product'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity}x {self.product.name}"
+
+
 class DeliveryZone(models.Model):
     city = models.CharField(max_length=100, unique=True)
     delivery_fee = models.DecimalField(max_digits=10, decimal_places=2)
@@ -138,4 +288,145 @@ class DeliveryZone(models.Model):
         return f"{self.city} - KES {self.delivery_fee}"
     
     class Meta:
-        ordering = ['city']
\ No newline at end of file
+        ordering = ['city']
+
+class DailySalesRollup(models.Model):
+    """
+    Pre-aggregated sales per day / category / delivery city / payment method.
+
+    Kept up to date by shop.rollups as orders are paid or cancelled so the
+    revenue analytics never scan Order/OrderItem. Revenue is the item
+    subtotal (delivery fees are not attributed to a category). An order
+    with items from two categories counts once in each category's row.
+    """
+    date = models.DateField()
+    category = models.CharField(max_length=100)
+    city = models.CharField(max_length=100)
+    payment_method = models.CharField(max_length=50, blank=True, default='')
+
+    order_count = models.IntegerField(default=0)
+    units_sold = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-date', 'category']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'category', 'city', 'payment_method'],
+                name='unique_daily_sales_rollup',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.category} / {self.city} - KES {self.revenue}"
+
+
+class StockReservation(models.Model):
+    """
+    Stock held for an unpaid order.
+
+    Product.stock is decremented when the hold is taken (see shop.inventory),
+    so it always means "available to buy". A hold is committed when the
+    order is paid, or released (stock handed back) when payment fails or
+    the hold expires.
+    """
+    HELD = 'held'
+    COMMITTED = 'committed'
+    RELEASED = 'released'
+    STATUS_CHOICES = [
+        (HELD, 'Held'),
+        (COMMITTED, 'Committed'),
+        (RELEASED, 'Released'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='stock_reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=HELD)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='reservation_status_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity}x {self.product_id} for Order #{self.order_id} ({self.status})"
+
+
+class OutboxEmail(models.Model):
+    """
+    Rendered email waiting to be delivered by the send_queued_emails worker.
+
+    Request handlers only insert rows here (see shop.emails.queue_*), so SMTP
+    latency and outages never reach the checkout path.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    html_message = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255)
+    recipient_list = models.JSONField(default=list)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.recipient_list)} ({self.status})"
+
+
+class PaymentNotification(models.Model):
+    """
+    One row per Pesapal OrderTrackingId, however many times the IPN for it
+    arrives (Pesapal retries, customers reload the callback page).
+
+    shop.payments claims the row before looking the status up, so a burst
+    of duplicate callbacks costs one upstream call and one stock update.
+    """
+    RECEIVED = 'received'
+    PROCESSING = 'processing'
+    PROCESSED = 'processed'
+    STATUS_CHOICES = [
+        (RECEIVED, 'Received'),
+        (PROCESSING, 'Processing'),
+        (PROCESSED, 'Processed'),
+    ]
+
+    order_tracking_id = models.CharField(max_length=255, unique=True)
+    merchant_reference = models.CharField(max_length=255, blank=True)
+    notification_type = models.CharField(max_length=50, blank=True)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=RECEIVED)
+    times_received = models.PositiveIntegerField(default=1)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    payment_status = models.CharField(max_length=20, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"IPN {self.order_tracking_id} ×{self.times_received} ({self.status})"
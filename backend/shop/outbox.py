@@ -0,0 +1,116 @@
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+MAX_ATTEMPTS = 8
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 60 * 60
+# A claimed email is invisible to other workers for this long; if the worker
+# dies mid-send it becomes due again afterwards
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+def _outbox_row(email):
+    return OutboxEmail(
+        subject=email['subject'][:255],
+        message=email['message'],
+        html_message=email.get('html_message') or '',
+        from_email=email.get('from_email') or settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[r for r in email['recipient_list'] if r],
+        next_attempt_at=timezone.now(),
+    )
+
+
+def enqueue_email(email):
+    """Store a rendered email (dict from the shop.emails builders) for delivery"""
+    if email is None:
+        return None
+    row = _outbox_row(email)
+    row.save()
+    return row
+
+
+def enqueue_emails(emails):
+    """enqueue_email for many emails in one INSERT"""
+    return OutboxEmail.objects.bulk_create([_outbox_row(email) for email in emails if email is not None])
+
+
+def backoff_delay(attempts):
+    """Exponential backoff with full jitter"""
+    ceiling = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+    return timedelta(seconds=random.uniform(ceiling / 2, ceiling))
+
+
+def claim_batch(batch_size):
+    """Lease up to batch_size due emails to this worker"""
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        OutboxEmail.objects.filter(pk__in=[e.pk for e in batch]).update(next_attempt_at=now + CLAIM_LEASE)
+    return batch
+
+
+def deliver_batch(batch_size=50):
+    """
+    Send one batch of due emails over a single SMTP connection.
+    Returns (sent, retried, failed) counts.
+    """
+    batch = claim_batch(batch_size)
+    sent = retried = failed = 0
+    if not batch:
+        return sent, retried, failed
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception:
+        # Can't reach the mail server at all: every email in the batch backs off
+        pass
+
+    for email in batch:
+        email.attempts += 1
+        try:
+            if not email.recipient_list:
+                raise ValueError('No recipients')
+            message = EmailMultiAlternatives(
+                subject=email.subject,
+                body=email.message,
+                from_email=email.from_email,
+                to=email.recipient_list,
+                connection=connection,
+            )
+            if email.html_message:
+                message.attach_alternative(email.html_message, 'text/html')
+            message.send()
+        except Exception as e:
+            email.last_error = str(e)
+            if email.attempts >= MAX_ATTEMPTS:
+                email.status = OutboxEmail.FAILED
+                failed += 1
+                print(f"❌ Giving up on email #{email.id} after {email.attempts} attempts: {e}")
+            else:
+                email.next_attempt_at = timezone.now() + backoff_delay(email.attempts)
+                retried += 1
+                print(f"⚠️ Email #{email.id} failed (attempt {email.attempts}), retrying: {e}")
+        else:
+            email.status = OutboxEmail.SENT
+            email.sent_at = timezone.now()
+            email.last_error = ''
+            sent += 1
+        email.save(update_fields=['attempts', 'status', 'next_attempt_at', 'last_error', 'sent_at'])
+
+    try:
+        connection.close()
+    except Exception:
+        pass
+    return sent, retried, failed
@@ -0,0 +1,34 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the public catalog.
+
+    Each page is a single indexed range scan (see Product.Meta.indexes),
+    so fetching page 200 costs the same as fetching page 1.
+    """
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    # ?sort=<key> -> ordering. The trailing id keeps the ordering stable
+    # when several products share the same price / name / timestamp.
+    SORT_ORDERINGS = {
+        'newest': ('-created_at', '-id'),
+        'price-low': ('price', 'id'),
+        'price-high': ('-price', '-id'),
+        'name': ('name', 'id'),
+    }
+    DEFAULT_SORT = 'newest'
+
+    def get_ordering(self, request, queryset, view):
+        sort = request.query_params.get('sort', self.DEFAULT_SORT)
+        return self.SORT_ORDERINGS.get(sort, self.SORT_ORDERINGS[self.DEFAULT_SORT])
+
+
+class OrderPagination(PageNumberPagination):
+    """Page-numbered order history (customer and admin order lists)"""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,201 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Order, PaymentNotification
+from .inventory import commit_reservations, release_reservations
+from .outbox import backoff_delay
+from .pesapal import pesapal_client
+from .rollups import record_order_completed
+
+# A claimed notification is skipped by duplicates for this long; if the
+# worker dies mid-lookup the next IPN retry picks it up again afterwards
+CLAIM_LEASE = timedelta(minutes=2)
+# Only a completed payment is final: a customer whose attempt failed can
+# retry on the same Pesapal order, so a failed order keeps being looked up
+FINAL_PAYMENT_STATUSES = ('completed',)
+# Unsettled orders the reconcile_payments worker keeps asking Pesapal about
+# (an expired hold or a failed attempt can still be paid late)
+RECONCILE_PAYMENT_STATUSES = ('pending', 'expired', 'failed')
+RECONCILE_LEASE = timedelta(minutes=5)
+
+
+def payment_outcome(status_response):
+    """Map a GetTransactionStatus response to 'completed', 'failed' or None (still pending)"""
+    description = (status_response.get('payment_status_description') or '').lower()
+    if description == 'completed' or status_response.get('status_code') == 1:
+        return 'completed'
+    if description in ('failed', 'invalid'):
+        return 'failed'
+    return None
+
+
+def apply_transaction_status(order_id, status_response, apply_failure=True):
+    """
+    Move an order to the outcome Pesapal reports.
+
+    The order row is locked for the transition, so the IPN and
+    verify_payment can race on one order and stock is still committed (or
+    released) exactly once. A failed order that Pesapal later reports as
+    completed is completed (its released stock is taken again). With
+    apply_failure=False only a completed payment is applied. Returns the
+    refreshed order.
+    """
+    outcome = payment_outcome(status_response)
+    if outcome == 'failed' and not apply_failure:
+        outcome = None
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(pk=order_id)
+        order.payment_checked_at = timezone.now()
+
+        if outcome == 'completed' and order.payment_status != 'completed':
+            # ✅ PAYMENT SUCCESSFUL - commit the stock hold
+            commit_reservations(order)
+            order.payment_status = 'completed'
+            order.status = 'processing'
+            order.payment_method = status_response.get('payment_method', '')
+            order.save()
+            record_order_completed(order)
+            print(f"✅ Payment successful for Order #{order.id}")
+
+        elif outcome == 'failed' and order.payment_status not in ('completed', 'failed'):
+            # ❌ PAYMENT FAILED - hand the held stock back
+            release_reservations(order)
+            order.payment_status = 'failed'
+            order.status = 'cancelled'
+            order.save()
+            print(f"❌ Payment failed for Order #{order.id}")
+
+        else:
+            Order.objects.filter(pk=order.pk).update(payment_checked_at=order.payment_checked_at)
+
+    return order
+
+
+def status_is_fresh(order, now=None):
+    """True if the stored payment status can be served without asking Pesapal"""
+    if order.payment_status in FINAL_PAYMENT_STATUSES:
+        return True
+    if order.payment_checked_at is None:
+        return False
+    max_age = timedelta(seconds=settings.PAYMENT_STATUS_FRESH_SECONDS)
+    return (now or timezone.now()) - order.payment_checked_at < max_age
+
+
+def claim_reconcile_batch(batch_size, now=None):
+    """Lease up to batch_size unsettled orders that are due a status lookup"""
+    now = now or timezone.now()
+    window_start = now - timedelta(hours=settings.PAYMENT_RECONCILE_WINDOW_HOURS)
+    with transaction.atomic():
+        batch = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(next_payment_check_at__isnull=True) | Q(next_payment_check_at__lte=now),
+                payment_status__in=RECONCILE_PAYMENT_STATUSES,
+                pesapal_order_tracking_id__gt='',
+                created_at__gte=window_start,
+            )
+            .order_by(F('next_payment_check_at').asc(nulls_first=True))[:batch_size]
+        )
+        Order.objects.filter(pk__in=[o.pk for o in batch]).update(next_payment_check_at=now + RECONCILE_LEASE)
+    return batch
+
+
+def _schedule_next_check(order):
+    attempts = order.payment_check_attempts + 1
+    Order.objects.filter(pk=order.pk).update(
+        payment_check_attempts=attempts,
+        next_payment_check_at=timezone.now() + backoff_delay(attempts),
+    )
+
+
+def reconcile_payments(batch_size=100, concurrency=8):
+    """
+    Ask Pesapal about one batch of unsettled orders and apply the answers.
+
+    Lookups run `concurrency` at a time over the pooled client; the DB
+    updates stay on this thread. Orders still unsettled back off
+    exponentially. Returns (checked, settled, errors) counts.
+    """
+    batch = claim_reconcile_batch(batch_size)
+    checked = settled = errors = 0
+    if not batch:
+        return checked, settled, errors
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        lookups = {
+            pool.submit(pesapal_client.get_transaction_status, order.pesapal_order_tracking_id): order
+            for order in batch
+        }
+        for future in as_completed(lookups):
+            order = lookups[future]
+            try:
+                status_response = future.result()
+            except Exception as e:
+                print(f"⚠️ Status lookup failed for Order #{order.id}: {e}")
+                errors += 1
+                _schedule_next_check(order)
+                continue
+
+            checked += 1
+            # Pesapal may report an unpaid order as INVALID while the customer
+            # is still paying: only treat that as a failure once the hold expired
+            explicit_failure = (status_response.get('payment_status_description') or '').lower() == 'failed'
+            updated = apply_transaction_status(
+                order.pk, status_response,
+                apply_failure=explicit_failure or order.payment_status == 'expired'
+            )
+            if updated.payment_status in FINAL_PAYMENT_STATUSES:
+                settled += 1
+            else:
+                _schedule_next_check(order)
+
+    return checked, settled, errors
+
+
+def record_notification(order_tracking_id, merchant_reference='', notification_type=''):
+    """Store an incoming IPN, or count it against the one already stored"""
+    notification, created = PaymentNotification.objects.get_or_create(
+        order_tracking_id=order_tracking_id,
+        defaults={
+            'merchant_reference': merchant_reference or '',
+            'notification_type': notification_type or '',
+        },
+    )
+    if not created:
+        PaymentNotification.objects.filter(pk=notification.pk).update(
+            times_received=F('times_received') + 1, last_received_at=timezone.now()
+        )
+    return notification
+
+
+def claim_notification(notification):
+    """
+    Take the right to process a notification. A single conditional UPDATE,
+    so of N concurrent duplicates exactly one gets True.
+    """
+    now = timezone.now()
+    return PaymentNotification.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lte=now),
+        pk=notification.pk,
+    ).exclude(status=PaymentNotification.PROCESSED).update(
+        status=PaymentNotification.PROCESSING, locked_until=now + CLAIM_LEASE
+    ) == 1
+
+
+def finish_notification(notification, payment_status=None):
+    """
+    Release the claim. Once the order reached a final payment status the
+    notification is done; otherwise the next IPN retry may process it again.
+    """
+    done = payment_status in FINAL_PAYMENT_STATUSES
+    PaymentNotification.objects.filter(pk=notification.pk).update(
+        status=PaymentNotification.PROCESSED if done else PaymentNotification.RECEIVED,
+        payment_status=payment_status or '',
+        locked_until=None,
+        processed_at=timezone.now() if done else None,
+    )
@@ -1,7 +1,99 @@
+import asyncio
+import httpx
 import requests
 import json
-from datetime import datetime
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Pesapal tokens live ~5 minutes; refresh a bit before that so a request
+# never goes out with a token that expires in flight
+DEFAULT_TOKEN_LIFETIME = timedelta(minutes=5)
+TOKEN_REFRESH_MARGIN = timedelta(seconds=60)
+
+
+def _parse_expiry(value):
+    """Parse Pesapal's expiryDate (e.g. '2021-08-26T12:29:30.5177702Z')"""
+    try:
+        expires_at = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return datetime.now(timezone.utc) + DEFAULT_TOKEN_LIFETIME
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at
+
+
+ENDPOINTS = ('RequestToken', 'RegisterIPN', 'SubmitOrderRequest', 'GetTransactionStatus')
+metrics.register_timers(*(f'pesapal.{name}' for name in ENDPOINTS))
+
+
+def build_session():
+    """
+    Keep-alive session shared by every Pesapal call in this process.
+
+    Connection failures are retried for any method (nothing reached Pesapal);
+    read failures and 429/5xx responses only for GETs, which are idempotent.
+    Backoff is exponential with jitter so retries from many workers spread out.
+    """
+    retry = Retry(
+        total=settings.PESAPAL_MAX_RETRIES,
+        connect=settings.PESAPAL_MAX_RETRIES,
+        read=settings.PESAPAL_MAX_RETRIES,
+        status=settings.PESAPAL_MAX_RETRIES,
+        allowed_methods=frozenset({'GET'}),
+        status_forcelist=(429, 502, 503, 504),
+        backoff_factor=0.3,
+        backoff_jitter=0.3,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=2,  # sandbox + live hosts at most
+        pool_maxsize=settings.PESAPAL_POOL_MAXSIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'Accept': 'application/json',
+        'Content-Type': 'application/json',
+    })
+    return session
+
+
+def build_async_client():
+    """
+    httpx counterpart of build_session() for the async checkout path.
+
+    Only connection failures are retried by the transport; the async path
+    only submits orders (a POST), so nothing that reached Pesapal is resent.
+    """
+    transport = httpx.AsyncHTTPTransport(
+        retries=settings.PESAPAL_MAX_RETRIES,
+        limits=httpx.Limits(
+            max_connections=settings.PESAPAL_ASYNC_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.PESAPAL_POOL_MAXSIZE,
+        ),
+    )
+    return httpx.AsyncClient(
+        transport=transport,
+        timeout=httpx.Timeout(settings.PESAPAL_READ_TIMEOUT, connect=settings.PESAPAL_CONNECT_TIMEOUT),
+        headers={
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+        },
+    )
 
 
 class PesapalAPI:
@@ -16,15 +108,111 @@ class PesapalAPI:
             self.base_url = 'https://pay.pesapal.com/v3'
         
         self.access_token = None
+        self._token_lock = threading.Lock()
+        self.session = build_session()
+        self.timeout = (settings.PESAPAL_CONNECT_TIMEOUT, settings.PESAPAL_READ_TIMEOUT)
+
+        # The async client and its token lock belong to the event loop that
+        # created them; under uvicorn that is one loop per worker
+        self._async_client = None
+        self._async_token_lock = None
+        self._async_loop = None
+
+    def _send(self, method, url, **kwargs):
+        """Make one call over the pooled session, timing it per endpoint"""
+        endpoint = url.rstrip('/').rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        ok = False
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            ok = response.status_code < 500
+            return response
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            metrics.record_timing(f'pesapal.{endpoint}', elapsed_ms, ok=ok)
+            logger.info('Pesapal %s: %.0f ms', endpoint, elapsed_ms)
+
+    def _get_async_client(self):
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self._async_client = build_async_client()
+            self._async_token_lock = asyncio.Lock()
+            self._async_loop = loop
+        return self._async_client
+
+    async def _asend(self, method, url, **kwargs):
+        """Async _send(): many in-flight calls share one worker and one connection pool"""
+        client = self._get_async_client()
+        endpoint = url.rstrip('/').rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        ok = False
+        try:
+            response = await client.request(method, url, **kwargs)
+            ok = response.status_code < 500
+            return response
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            metrics.record_timing(f'pesapal.{endpoint}', elapsed_ms, ok=ok)
+            logger.info('Pesapal %s (async): %.0f ms', endpoint, elapsed_ms)
     
-    def get_access_token(self):
-        """Get OAuth access token from Pesapal"""
-        url = f'{self.base_url}/api/Auth/RequestToken'
+    @property
+    def token_cache_key(self):
+        # Stored in the Django cache: every thread of a process reuses one token,
+        # and every worker / --loop command too when CACHE_BACKEND is redis or
+        # file. Under the default locmem cache each process fetches its own.
+        key_hash = hashlib.sha256(self.consumer_key.encode()).hexdigest()[:16]
+        return f'pesapal:token:{self.environment}:{key_hash}'
 
-        headers = {
-            'Accept': 'application/json',
-            'Content-Type': 'application/json'
-        }
+    @staticmethod
+    def _valid_token(cached):
+        if cached and cached['expires_at'] - TOKEN_REFRESH_MARGIN > datetime.now(timezone.utc):
+            return cached['token']
+        return None
+
+    def _cached_token(self):
+        return self._valid_token(cache.get(self.token_cache_key))
+
+    def get_access_token(self, force_refresh=False):
+        """
+        Return a valid OAuth token, reusing the cached one until shortly
+        before its expiryDate. Only one thread per process refreshes at a time.
+        """
+        if not force_refresh:
+            token = self._cached_token()
+            if token:
+                self.access_token = token
+                return token
+
+        with self._token_lock:
+            # Another thread may have refreshed while we waited for the lock
+            token = None if force_refresh else self._cached_token()
+            if not token:
+                token = self.request_access_token()
+            self.access_token = token
+            return token
+
+    async def aget_access_token(self, force_refresh=False):
+        """Async get_access_token(): same shared cache, one refresh per event loop at a time"""
+        if not force_refresh:
+            token = self._valid_token(await cache.aget(self.token_cache_key))
+            if token:
+                self.access_token = token
+                return token
+
+        self._get_async_client()
+        async with self._async_token_lock:
+            token = None if force_refresh else self._valid_token(await cache.aget(self.token_cache_key))
+            if not token:
+                token = await self.arequest_access_token()
+            self.access_token = token
+            return token
+
+    def invalidate_access_token(self):
+        cache.delete(self.token_cache_key)
+        self.access_token = None
+
+    def _token_request(self):
+        url = f'{self.base_url}/api/Auth/RequestToken'
 
         payload = {
             'consumer_key': self.consumer_key,
@@ -34,68 +222,118 @@ class PesapalAPI:
         print(f"\n🔑 Requesting access token from: {url}")
         print(f"Consumer Key: {self.consumer_key[:10]}..." if self.consumer_key else "Consumer Key: NOT SET")
         print(f"Environment: {self.environment}")
+        return url, payload
 
+    def request_access_token(self):
+        """Request a new OAuth access token from Pesapal and cache it until it expires"""
+        url, payload = self._token_request()
         try:
-            response = requests.post(url, json=payload, headers=headers)
-            print(f"Status Code: {response.status_code}")
-            print(f"Response: {response.text}")
-
-            data = response.json()
-
-            # Check if response contains an error (Pesapal returns 200 even for errors)
-            # Note: error can be null (None) for successful requests
-            if data.get('error') is not None:
-                error_msg = data['error'].get('message', 'Unknown error')
-                error_code = data['error'].get('code', 'unknown')
-                print(f"\n❌ Pesapal API Error:")
-                print(f"   Code: {error_code}")
-                print(f"   Message: {error_msg}")
-
-                if error_code == 'invalid_consumer_key_or_secret_provided':
-                    print(f"\n💡 This means:")
-                    print(f"   - Your consumer key or secret is incorrect")
-                    print(f"   - OR you're using {self.environment} credentials but your keys are for {'sandbox' if self.environment == 'live' else 'live'}")
-                    print(f"\n   Double-check your Pesapal credentials in Railway environment variables:")
-                    print(f"   - PESAPAL_CONSUMER_KEY")
-                    print(f"   - PESAPAL_CONSUMER_SECRET")
-                    print(f"   - PESAPAL_ENVIRONMENT (currently: {self.environment})")
-
-                return None
-
-            response.raise_for_status()
-            self.access_token = data.get('token')
-
-            if not self.access_token:
-                print("⚠️  Warning: No token in response")
-                print(f"Response data: {data}")
-
-            return self.access_token
+            response = self._send('POST', url, json=payload)
+            entry = self._parse_token_response(response)
         except requests.exceptions.RequestException as e:
             print(f"❌ Error getting access token: {str(e)}")
             if 'response' in locals():
                 print(f"Response: {response.text}")
             raise
+        if entry is None:
+            return None
+        token, expires_at, ttl = entry
+        if ttl > 0:
+            cache.set(self.token_cache_key, {'token': token, 'expires_at': expires_at}, ttl)
+        return token
+
+    async def arequest_access_token(self):
+        """Async request_access_token()"""
+        url, payload = self._token_request()
+        try:
+            response = await self._asend('POST', url, json=payload)
+            entry = self._parse_token_response(response)
+        except httpx.HTTPError as e:
+            print(f"❌ Error getting access token: {str(e)}")
+            raise
+        if entry is None:
+            return None
+        token, expires_at, ttl = entry
+        if ttl > 0:
+            await cache.aset(self.token_cache_key, {'token': token, 'expires_at': expires_at}, ttl)
+        return token
+
+    def _parse_token_response(self, response):
+        """Return (token, expires_at, cache ttl) from a RequestToken response, or None on a Pesapal error"""
+        print(f"Status Code: {response.status_code}")
+        print(f"Response: {response.text}")
+
+        data = response.json()
+
+        # Check if response contains an error (Pesapal returns 200 even for errors)
+        # Note: error can be null (None) for successful requests
+        if data.get('error') is not None:
+            error_msg = data['error'].get('message', 'Unknown error')
+            error_code = data['error'].get('code', 'unknown')
+            print(f"\n❌ Pesapal API Error:")
+            print(f"   Code: {error_code}")
+            print(f"   Message: {error_msg}")
+
+            if error_code == 'invalid_consumer_key_or_secret_provided':
+                print(f"\n💡 This means:")
+                print(f"   - Your consumer key or secret is incorrect")
+                print(f"   - OR you're using {self.environment} credentials but your keys are for {'sandbox' if self.environment == 'live' else 'live'}")
+                print(f"\n   Double-check your Pesapal credentials in Railway environment variables:")
+                print(f"   - PESAPAL_CONSUMER_KEY")
+                print(f"   - PESAPAL_CONSUMER_SECRET")
+                print(f"   - PESAPAL_ENVIRONMENT (currently: {self.environment})")
+
+            return None
+
+        response.raise_for_status()
+        token = data.get('token')
+
+        if not token:
+            print("⚠️  Warning: No token in response")
+            print(f"Response data: {data}")
+            return None
+
+        expires_at = _parse_expiry(data.get('expiryDate'))
+        ttl = (expires_at - TOKEN_REFRESH_MARGIN - datetime.now(timezone.utc)).total_seconds()
+        return token, expires_at, int(ttl)
     
+    def _authorized_request(self, method, url, **kwargs):
+        """
+        Call an authenticated endpoint with the cached token. If Pesapal
+        rejects it (401) the token is refreshed and the call retried once.
+        """
+        for attempt in range(2):
+            headers = {'Authorization': f'Bearer {self.get_access_token(force_refresh=attempt > 0)}'}
+            response = self._send(method, url, headers=headers, **kwargs)
+            if response.status_code != 401:
+                break
+            print("🔑 Pesapal rejected the access token, refreshing")
+            self.invalidate_access_token()
+        return response
+
+    async def _aauthorized_request(self, method, url, **kwargs):
+        """Async _authorized_request()"""
+        for attempt in range(2):
+            token = await self.aget_access_token(force_refresh=attempt > 0)
+            response = await self._asend(method, url, headers={'Authorization': f'Bearer {token}'}, **kwargs)
+            if response.status_code != 401:
+                break
+            print("🔑 Pesapal rejected the access token, refreshing")
+            await cache.adelete(self.token_cache_key)
+            self.access_token = None
+        return response
+
     def register_ipn(self, ipn_url):
         """Register IPN (Instant Payment Notification) URL"""
-        if not self.access_token:
-            self.get_access_token()
-        
         url = f'{self.base_url}/api/URLSetup/RegisterIPN'
         
-        headers = {
-            'Accept': 'application/json',
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.access_token}'
-        }
-        
         payload = {
             'url': ipn_url,
             'ipn_notification_type': 'GET'
         }
         
         try:
-            response = requests.post(url, json=payload, headers=headers)
+            response = self._authorized_request('POST', url, json=payload)
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -104,23 +342,9 @@ class PesapalAPI:
                 print(f"Response: {response.text}")
             raise
     
-    def submit_order(self, order_id, amount, description, callback_url,
-                     customer_email, customer_phone, customer_name):
-        """
-        Submit order to Pesapal
-
-        Args:
-            order_id: Unique order reference
-            amount: Amount to charge
-            description: Order description
-            callback_url: URL to redirect after payment
-            customer_email: Customer email
-            customer_phone: Customer phone number
-            customer_name: Customer name
-        """
-        # Always get a fresh token to avoid expiration issues
-        self.get_access_token()
-
+    def _order_request(self, order_id, amount, description, callback_url,
+                       customer_email, customer_phone, customer_name):
+        """Build the SubmitOrderRequest url and payload (see submit_order)"""
         # Validate IPN ID is set
         if not settings.PESAPAL_IPN_ID:
             raise ValueError(
@@ -130,12 +354,6 @@ class PesapalAPI:
 
         url = f'{self.base_url}/api/Transactions/SubmitOrderRequest'
 
-        headers = {
-            'Accept': 'application/json',
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.access_token}'
-        }
-
         # Format phone number (remove + and ensure 254 format)
         if customer_phone.startswith('+'):
             customer_phone = customer_phone[1:]
@@ -165,62 +383,89 @@ class PesapalAPI:
                 'zip_code': ''
             }
         }
-        
-        try:
-            print("\n" + "=" * 60)
-            print("📤 SUBMITTING ORDER TO PESAPAL")
-            print("=" * 60)
-            print(f"URL: {url}")
-            print(f"\n📦 PAYLOAD BEING SENT:")
-            print(json.dumps(payload, indent=2))
-            print("=" * 60)
 
-            response = requests.post(url, json=payload, headers=headers)
+        print("\n" + "=" * 60)
+        print("📤 SUBMITTING ORDER TO PESAPAL")
+        print("=" * 60)
+        print(f"URL: {url}")
+        print(f"\n📦 PAYLOAD BEING SENT:")
+        print(json.dumps(payload, indent=2))
+        print("=" * 60)
+        return url, payload
 
-            print(f"\n📥 PESAPAL RESPONSE:")
-            print(f"Status Code: {response.status_code}")
-            print(f"Response Body: {response.text}")
-            print("=" * 60 + "\n")
+    def _parse_order_response(self, response):
+        print(f"\n📥 PESAPAL RESPONSE:")
+        print(f"Status Code: {response.status_code}")
+        print(f"Response Body: {response.text}")
+        print("=" * 60 + "\n")
 
-            data = response.json()
+        data = response.json()
 
-            # Check if response contains an error
-            if data.get('error') is not None:
-                error_msg = data['error'].get('message', 'Unknown error')
-                error_code = data['error'].get('code', 'unknown')
-                print(f"\n❌ Pesapal Order Submission Error:")
-                print(f"   Code: {error_code}")
-                print(f"   Message: {error_msg}")
+        # Check if response contains an error
+        if data.get('error') is not None:
+            error_msg = data['error'].get('message', 'Unknown error')
+            error_code = data['error'].get('code', 'unknown')
+            print(f"\n❌ Pesapal Order Submission Error:")
+            print(f"   Code: {error_code}")
+            print(f"   Message: {error_msg}")
 
-                raise ValueError(f"Pesapal API Error: {error_msg} (Code: {error_code})")
+            raise ValueError(f"Pesapal API Error: {error_msg} (Code: {error_code})")
 
-            response.raise_for_status()
-            return data
+        response.raise_for_status()
+        return data
+
+    def submit_order(self, order_id, amount, description, callback_url,
+                     customer_email, customer_phone, customer_name):
+        """
+        Submit order to Pesapal
+
+        Args:
+            order_id: Unique order reference
+            amount: Amount to charge
+            description: Order description
+            callback_url: URL to redirect after payment
+            customer_email: Customer email
+            customer_phone: Customer phone number
+            customer_name: Customer name
+        """
+        url, payload = self._order_request(
+            order_id, amount, description, callback_url,
+            customer_email, customer_phone, customer_name
+        )
+        try:
+            # Reuses the cached token: one upstream call per checkout, not two
+            response = self._authorized_request('POST', url, json=payload)
+            return self._parse_order_response(response)
         except requests.exceptions.RequestException as e:
             print(f"\n❌ ERROR: {str(e)}")
             if 'response' in locals():
                 print(f"Response text: {response.text}")
             raise
+
+    async def asubmit_order(self, order_id, amount, description, callback_url,
+                            customer_email, customer_phone, customer_name):
+        """Async submit_order(): the worker serves other requests while Pesapal responds"""
+        url, payload = self._order_request(
+            order_id, amount, description, callback_url,
+            customer_email, customer_phone, customer_name
+        )
+        try:
+            response = await self._aauthorized_request('POST', url, json=payload)
+            return self._parse_order_response(response)
+        except httpx.HTTPError as e:
+            print(f"\n❌ ERROR: {str(e)}")
+            raise
     
     def get_transaction_status(self, order_tracking_id):
         """Get transaction status"""
-        if not self.access_token:
-            self.get_access_token()
-        
         url = f'{self.base_url}/api/Transactions/GetTransactionStatus'
         
-        headers = {
-            'Accept': 'application/json',
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.access_token}'
-        }
-        
         params = {
             'orderTrackingId': order_tracking_id
         }
         
         try:
-            response = requests.get(url, params=params, headers=headers)
+            response = self._authorized_request('GET', url, params=params)
             response.raise_for_status()
             return response.json()
         except Exception as e:
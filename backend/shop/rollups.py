@@ -0,0 +1,110 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailySalesRollup, OrderItem
+
+
+def _order_buckets(orders):
+    """Group the orders' items by rollup key -> [order ids, units, revenue]"""
+    by_id = {order.pk: order for order in orders}
+    buckets = defaultdict(lambda: [set(), 0, Decimal('0')])
+    for item in OrderItem.objects.filter(order_id__in=by_id).select_related('product'):
+        order = by_id[item.order_id]
+        day = timezone.localdate(order.created_at)
+        key = (day, item.product.category, order.shipping_city, order.payment_method or '')
+        buckets[key][0].add(order.pk)
+        buckets[key][1] += item.quantity
+        buckets[key][2] += item.quantity * item.price
+    return buckets
+
+
+@transaction.atomic
+def _apply_orders(orders, sign):
+    for (day, category, city, payment_method), (order_ids, units, revenue) in _order_buckets(orders).items():
+        row, _ = DailySalesRollup.objects.get_or_create(
+            date=day, category=category, city=city, payment_method=payment_method
+        )
+        # F() increments so concurrent IPNs for different orders can't lose updates
+        DailySalesRollup.objects.filter(pk=row.pk).update(
+            order_count=F('order_count') + sign * len(order_ids),
+            units_sold=F('units_sold') + sign * units,
+            revenue=F('revenue') + sign * revenue,
+        )
+
+
+def record_order_completed(order):
+    """Add a newly paid order to the rollup"""
+    _apply_orders([order], 1)
+
+
+def record_order_cancelled(order):
+    """Take a paid order that has been cancelled back out of the rollup"""
+    _apply_orders([order], -1)
+
+
+def record_orders_completed(orders):
+    """record_order_completed for many orders, one write per rollup row touched"""
+    if orders:
+        _apply_orders(orders, 1)
+
+
+def record_orders_cancelled(orders):
+    if orders:
+        _apply_orders(orders, -1)
+
+
+def rebuild_rollup(start=None, end=None, batch_size=500):
+    """
+    Recompute the rollup from Order/OrderItem for [start, end] (inclusive,
+    either may be None for open-ended). Returns the number of rows written.
+    """
+    items = OrderItem.objects.filter(order__payment_status='completed').exclude(order__status='cancelled')
+    rows = DailySalesRollup.objects.all()
+    if start:
+        items = items.filter(order__created_at__date__gte=start)
+        rows = rows.filter(date__gte=start)
+    if end:
+        items = items.filter(order__created_at__date__lte=end)
+        rows = rows.filter(date__lte=end)
+
+    line_total = ExpressionWrapper(
+        F('quantity') * F('price'), output_field=DecimalField(max_digits=12, decimal_places=2)
+    )
+    grouped = (
+        items.annotate(day=TruncDate('order__created_at'))
+        .values('day', 'product__category', 'order__shipping_city', 'order__payment_method')
+        .annotate(
+            order_count=Count('order', distinct=True),
+            units_sold=Sum('quantity'),
+            revenue=Sum(line_total),
+        )
+        .order_by()
+    )
+
+    written = 0
+    with transaction.atomic():
+        rows.delete()
+        batch = []
+        for group in grouped.iterator():
+            batch.append(DailySalesRollup(
+                date=group['day'],
+                category=group['product__category'],
+                city=group['order__shipping_city'],
+                payment_method=group['order__payment_method'] or '',
+                order_count=group['order_count'],
+                units_sold=group['units_sold'],
+                revenue=group['revenue'],
+            ))
+            if len(batch) >= batch_size:
+                DailySalesRollup.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            DailySalesRollup.objects.bulk_create(batch)
+            written += len(batch)
+    return written
@@ -0,0 +1,184 @@
+"""
+Product search.
+
+PostgreSQL: a weighted tsvector kept in Product.search_vector by a trigger
+and a GIN index, plus a pg_trgm index on name so misspelt queries still
+match. SQLite (local/dev): an FTS5 table over name/description/category
+kept in sync by triggers, ranked with bm25. Any other backend falls back
+to icontains.
+
+install_search_index() creates whichever of these the database needs. It
+is idempotent and runs from migration 0014 and after every migrate (a
+SQLite table rebuild in a later migration drops the table's triggers).
+"""
+import re
+import time
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+
+from . import metrics
+
+SEARCH_CONFIG = 'english'
+MAX_TERMS = 8
+# SQLite bm25 column weights: name, description, category
+FTS_WEIGHTS = (10.0, 1.0, 4.0)
+
+metrics.register_timers('search.products')
+
+POSTGRES_SEARCH_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE OR REPLACE FUNCTION shop_product_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.category, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(NEW.description, '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS shop_product_search_vector_trg ON shop_product",
+    """
+    CREATE TRIGGER shop_product_search_vector_trg
+        BEFORE INSERT OR UPDATE OF name, description, category ON shop_product
+        FOR EACH ROW EXECUTE FUNCTION shop_product_search_vector()
+    """,
+    # Backfill rows written before the trigger existed
+    "UPDATE shop_product SET name = name WHERE search_vector IS NULL",
+    "CREATE INDEX IF NOT EXISTS product_search_vector_idx ON shop_product USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS product_name_trgm_idx ON shop_product USING gin (name gin_trgm_ops)",
+]
+
+SQLITE_SEARCH_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS shop_product_fts_ai AFTER INSERT ON shop_product BEGIN
+        INSERT INTO shop_product_fts(rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS shop_product_fts_ad AFTER DELETE ON shop_product BEGIN
+        INSERT INTO shop_product_fts(shop_product_fts, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS shop_product_fts_au AFTER UPDATE OF name, description, category ON shop_product BEGIN
+        INSERT INTO shop_product_fts(shop_product_fts, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+        INSERT INTO shop_product_fts(rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END
+    """,
+]
+
+
+def install_search_index(conn=None, rebuild=False):
+    """Create (or repair) the search index for this database"""
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            for sql in POSTGRES_SEARCH_SQL:
+                cursor.execute(sql)
+            if rebuild:
+                cursor.execute("UPDATE shop_product SET name = name")
+        elif conn.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'shop_product_fts'")
+            created = cursor.fetchone() is None
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS shop_product_fts USING fts5("
+                "name, description, category, content='shop_product', content_rowid='id', "
+                "tokenize='porter unicode61 remove_diacritics 2')"
+            )
+            for sql in SQLITE_SEARCH_SQL:
+                cursor.execute(sql)
+            if created or rebuild:
+                cursor.execute("INSERT INTO shop_product_fts(shop_product_fts) VALUES ('rebuild')")
+
+
+def _terms(text):
+    return re.findall(r'\w+', text.lower())[:MAX_TERMS]
+
+
+def _fts_match(terms, any_term=False):
+    """FTS5 query: every term as a prefix match (words only, so nothing to escape)"""
+    return (' OR ' if any_term else ' ').join(f'"{term}"*' for term in terms)
+
+
+def filter_products(queryset, text):
+    """Narrow queryset to products matching text (unranked, for filtered listings)"""
+    terms = _terms(text)
+    if not terms:
+        return queryset.none()
+
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+        return queryset.filter(Q(search_vector=query) | Q(name__trigram_similar=text))
+
+    if connection.vendor == 'sqlite':
+        return queryset.filter(pk__in=RawSQL(
+            "SELECT rowid FROM shop_product_fts WHERE shop_product_fts MATCH %s", [_fts_match(terms)]
+        ))
+
+    query = Q()
+    for term in terms:
+        query &= Q(name__icontains=term) | Q(description__icontains=term) | Q(category__icontains=term)
+    return queryset.filter(query)
+
+
+def _sqlite_ranked_ids(queryset, terms, limit):
+    """
+    Ids of the best `limit` matches within queryset. The queryset's filters
+    (active, category, ...) run inside the FTS query, before the LIMIT, so
+    matches outside them can't crowd out the ones the caller asked for.
+    """
+    scope_sql, scope_params = queryset.order_by().values('pk').query.sql_with_params()
+    sql = (
+        f"SELECT rowid FROM shop_product_fts WHERE shop_product_fts MATCH %s AND rowid IN ({scope_sql}) "
+        f"ORDER BY bm25(shop_product_fts, {', '.join(str(w) for w in FTS_WEIGHTS)}) LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [_fts_match(terms), *scope_params, limit])
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids and len(terms) > 1:
+            # Nothing has every word: fall back to products with any of them
+            cursor.execute(sql, [_fts_match(terms, any_term=True), *scope_params, limit])
+            ids = [row[0] for row in cursor.fetchall()]
+    return ids
+
+
+def search_products(queryset, text, limit=24):
+    """
+    Best matches for text within queryset, most relevant first.
+
+    Matching and ranking happen in the index (GIN / FTS5), so the cost
+    depends on the number of matches, not the size of the catalog.
+    """
+    started = time.perf_counter()
+    terms = _terms(text)
+    if not terms:
+        return []
+
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+        results = list(
+            queryset.annotate(
+                rank=SearchRank(F('search_vector'), query),
+                similarity=TrigramSimilarity('name', text),
+            )
+            .filter(Q(search_vector=query) | Q(name__trigram_similar=text))
+            .order_by('-rank', '-similarity', '-id')[:limit]
+        )
+    elif connection.vendor == 'sqlite':
+        ranked_ids = _sqlite_ranked_ids(queryset, terms, limit)
+        products = queryset.in_bulk(ranked_ids)
+        results = [products[pk] for pk in ranked_ids if pk in products]
+    else:
+        results = list(filter_products(queryset, text).order_by('-created_at', '-id')[:limit])
+
+    metrics.record_timing('search.products', (time.perf_counter() - started) * 1000)
+    return results
@@ -1,20 +1,28 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
-from .models import Product, Order, OrderItem, ProductImage, ProductVideo
+from django.db import transaction
+from .models import Product, Order, OrderItem, ProductImage, ProductVideo, CartItem
+from .inventory import InsufficientStock, commit_reservations, reserve_stock
+from . import media
 
 class ProductImageSerializer(serializers.ModelSerializer):
-    image = serializers.SerializerMethodField()  # Add this
+    image = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'order']
+        fields = ['id', 'image', 'thumbnail', 'srcset', 'order']
     
     def get_image(self, obj):
-        if obj.image:
-            # Get full Cloudinary URL
-            return f"https://res.cloudinary.com/dudqljqqc/{obj.image}"
-        return None
+        return media.image_url(obj.image, media.DETAIL_WIDTH)
+
+    def get_thumbnail(self, obj):
+        return media.image_url(obj.image, media.THUMBNAIL_WIDTH)
+
+    def get_srcset(self, obj):
+        return media.image_srcset(obj.image)
 
 class ProductVideoSerializer(serializers.ModelSerializer):
     video = serializers.SerializerMethodField()
@@ -25,31 +33,47 @@ class ProductVideoSerializer(serializers.ModelSerializer):
         fields = ['id', 'video', 'thumbnail']
     
     def get_video(self, obj):
-        if obj.video:
-            # For videos, use /video/upload/ instead of /image/upload/
-            return f"https://res.cloudinary.com/dudqljqqc/video/upload/{obj.video}"
-        return None
+        return media.video_url(obj.video)
     
     def get_thumbnail(self, obj):
-        if obj.thumbnail:
-            # Thumbnails are images, use /image/upload/
-            return f"https://res.cloudinary.com/dudqljqqc/image/upload/{obj.thumbnail}"
-        return None
+        return media.image_url(obj.thumbnail, media.VIDEO_POSTER_WIDTH)
 
 class ProductSerializer(serializers.ModelSerializer):
     additional_images = ProductImageSerializer(many=True, read_only=True)
     video = ProductVideoSerializer(read_only=True, allow_null=True)
-    image = serializers.SerializerMethodField()  # Add this
+    image = serializers.SerializerMethodField()
+    image_thumbnail = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ['search_vector']
     
     def get_image(self, obj):
-        if obj.image:
-            # Get full Cloudinary URL
-            return f"https://res.cloudinary.com/dudqljqqc/{obj.image}"
-        return None
+        return media.image_url(obj.image, media.DETAIL_WIDTH)
+
+    def get_image_thumbnail(self, obj):
+        return media.image_url(obj.image, media.THUMBNAIL_WIDTH)
+
+    def get_image_srcset(self, obj):
+        return media.image_srcset(obj.image)
+
+
+class ProductImportSerializer(serializers.ModelSerializer):
+    """Validates one row of a bulk product import (see shop.bulk_io)"""
+    id = serializers.IntegerField(required=False, min_value=1)
+    # Stored Cloudinary values ('image/upload/v1/products/x.jpg') or public ids
+    image = serializers.CharField(required=False, allow_blank=True, max_length=255)
+    additional_images = serializers.ListField(
+        child=serializers.CharField(max_length=255), required=False, max_length=20
+    )
+
+    class Meta:
+        model = Product
+        fields = [
+            'id', 'name', 'description', 'price', 'stock', 'category', 'size', 'condition',
+            'instagram_link', 'tiktok_link', 'is_active', 'image', 'additional_images',
+        ]
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -76,12 +100,31 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'is_staff'] 
 class OrderItemSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
-    product_image = serializers.ImageField(source='product.image', read_only=True)
+    product_image = serializers.SerializerMethodField()
     
     class Meta:
         model = OrderItem
         fields = ['id', 'product', 'product_name', 'product_image', 'quantity', 'price']
 
+    def get_product_image(self, obj):
+        return media.image_url(obj.product.image, media.ORDER_ITEM_WIDTH)
+
+class CartItemSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    product_image = serializers.SerializerMethodField()
+    stock = serializers.IntegerField(source='product.stock', read_only=True)
+    line_total = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CartItem
+        fields = ['product', 'product_name', 'product_image', 'unit_price', 'quantity', 'line_total', 'stock']
+
+    def get_product_image(self, obj):
+        return media.image_url(obj.product.image, media.THUMBNAIL_WIDTH)
+
+    def get_line_total(self, obj):
+        return str(obj.unit_price * obj.quantity)
+
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     user_username = serializers.CharField(source='user.username', read_only=True)
@@ -112,39 +155,32 @@ class OrderCreateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         items_data = validated_data.pop('items')
         user = self.context['request'].user
-        
-        # Calculate total
-        total_amount = 0
-        for item in items_data:
-            product = Product.objects.get(id=item['product_id'])
-            total_amount += product.price * item['quantity']
-        
-        # Create order
-        order = Order.objects.create(
-            user=user,
-            total_amount=total_amount,
-            **validated_data
-        )
-        
-        # Create order items and update stock
-        for item in items_data:
-            product = Product.objects.get(id=item['product_id'])
-            
-            # Check stock
-            if product.stock < item['quantity']:
-                order.delete()
-                raise serializers.ValidationError(f"Not enough stock for {product.name}")
-            
-            # Create order item
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                quantity=item['quantity'],
-                price=product.price
+
+        # One product query for the whole cart
+        products = Product.objects.in_bulk({item['product_id'] for item in items_data})
+        try:
+            lines = [(products[item['product_id']], item['quantity']) for item in items_data]
+        except KeyError:
+            raise serializers.ValidationError('Product not found')
+
+        with transaction.atomic():
+            order = Order.objects.create(
+                user=user,
+                total_amount=sum(product.price * quantity for product, quantity in lines),
+                **validated_data
             )
-            
-            # Update stock
-            product.stock -= item['quantity']
-            product.save()
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=quantity, price=product.price)
+                for product, quantity in lines
+            ])
+
+            # Take stock atomically (rolls the whole order back if any item is
+            # short). No payment is started here, so the stock is sold straight
+            # away as before rather than held for release_expired_reservations
+            try:
+                reserve_stock(order, lines)
+            except InsufficientStock as e:
+                raise serializers.ValidationError(f"Not enough stock for {e.product.name}")
+            commit_reservations(order)
         
-        return order
\ No newline at end of file
+        return order
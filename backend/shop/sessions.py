@@ -0,0 +1,24 @@
+"""
+Session housekeeping.
+
+purge_expired_sessions deletes expired django_session rows in small
+batches (clearsessions issues one unbounded DELETE), so it can run in a
+loop next to the web process without holding long locks. Engines that
+keep no rows (cache, signed_cookies) have nothing to purge; rows left
+over from before a switch are still removed.
+"""
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+
+PURGE_BATCH_SIZE = 1000
+
+
+def purge_expired_sessions(batch_size=PURGE_BATCH_SIZE, now=None):
+    """Delete expired session rows batch by batch. Returns how many were deleted."""
+    now = now or timezone.now()
+    deleted = 0
+    while True:
+        keys = list(Session.objects.filter(expire_date__lt=now).values_list('pk', flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        deleted += Session.objects.filter(pk__in=keys).delete()[0]
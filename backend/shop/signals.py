@@ -0,0 +1,77 @@
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .models import Product, ProductImage, ProductVideo, Order, DeliveryZone, MediaUpload
+from .stats import invalidate_dashboard_stats
+from .catalog_cache import invalidate_products
+from .delivery_zones import invalidate_delivery_zones
+from .search import install_search_index
+from .media_uploads import discard_staged_files
+from .cart import drop_product, reprice_products
+from .authentication import forget_tokens
+
+
+@receiver([post_save, post_delete], sender=Order)
+@receiver([post_save, post_delete], sender=Product)
+def clear_dashboard_stats(sender, **kwargs):
+    invalidate_dashboard_stats()
+
+
+@receiver([post_save, post_delete], sender=Product)
+def clear_cached_product(sender, instance, **kwargs):
+    invalidate_products(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def reprice_carts(sender, instance, created, update_fields=None, **kwargs):
+    # Carts keep running totals: move the ones holding this product onto its new price
+    if not created and (update_fields is None or 'price' in update_fields):
+        reprice_products([instance.pk])
+
+
+@receiver(pre_delete, sender=Product)
+def drop_from_carts(sender, instance, **kwargs):
+    # Before the cascade removes the cart lines, take them out of the cart totals
+    drop_product(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=ProductVideo)
+def clear_cached_product_media(sender, instance, **kwargs):
+    # Media is part of the product payload: move updated_at so ETags change
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+    invalidate_products(instance.product_id)
+
+
+@receiver(post_delete, sender=MediaUpload)
+def remove_staged_media(sender, instance, **kwargs):
+    # Covers superseded batches and products deleted before their uploads ran
+    discard_staged_files(instance)
+
+
+@receiver([post_save, post_delete], sender=DeliveryZone)
+def clear_cached_delivery_zones(sender, **kwargs):
+    invalidate_delivery_zones()
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    # Logout deletes the token: it must stop authenticating now, not at the cache TTL
+    forget_tokens(instance.key)
+
+
+@receiver(post_save, sender=User)
+def forget_changed_user_tokens(sender, instance, created, update_fields=None, **kwargs):
+    # Cached lookups hold a copy of the user, so is_active / is_staff edits apply at once
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    forget_tokens(*Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
+
+
+def ensure_search_index(sender, using, **kwargs):
+    """Recreate search triggers a SQLite table rebuild may have dropped (connected in ShopConfig.ready)"""
+    install_search_index(connections[using])
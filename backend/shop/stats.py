@@ -0,0 +1,56 @@
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import Product, Order
+
+DASHBOARD_STATS_CACHE_KEY = 'shop:admin_dashboard_stats'
+DASHBOARD_STATS_CACHE_TTL = 60  # seconds; signals clear it sooner when orders/products change
+
+
+def compute_dashboard_stats():
+    """Compute the admin dashboard numbers with one aggregate query per table"""
+    today = timezone.now().date()
+    completed = Q(payment_status='completed')
+    placed_today = Q(created_at__date=today)
+
+    # ✅ Revenue only counts COMPLETED (paid) orders
+    order_stats = Order.objects.aggregate(
+        total_orders=Count('id'),
+        completed_orders=Count('id', filter=completed),
+        pending_orders=Count('id', filter=Q(status='pending')),
+        today_orders=Count('id', filter=placed_today),
+        today_completed_orders=Count('id', filter=completed & placed_today),
+        today_revenue=Sum('total_amount', filter=completed & placed_today),
+        total_revenue=Sum('total_amount', filter=completed),
+        pending_payment_orders=Count('id', filter=Q(payment_status='pending')),
+    )
+    product_stats = Product.objects.filter(is_active=True).aggregate(
+        total_products=Count('id'),
+        low_stock_items=Count('id', filter=Q(stock__lte=2)),
+    )
+
+    return {
+        'total_products': product_stats['total_products'],
+        'total_orders': order_stats['total_orders'],
+        'completed_orders': order_stats['completed_orders'],
+        'pending_orders': order_stats['pending_orders'],
+        'today_orders': order_stats['today_orders'],
+        'today_completed_orders': order_stats['today_completed_orders'],
+        'today_revenue': order_stats['today_revenue'] or 0,
+        'low_stock_items': product_stats['low_stock_items'],
+        'total_revenue': order_stats['total_revenue'] or 0,
+        'pending_payment_orders': order_stats['pending_payment_orders'],
+    }
+
+
+def get_dashboard_stats():
+    stats = cache.get(DASHBOARD_STATS_CACHE_KEY)
+    if stats is None:
+        stats = compute_dashboard_stats()
+        cache.set(DASHBOARD_STATS_CACHE_KEY, stats, DASHBOARD_STATS_CACHE_TTL)
+    return stats
+
+
+def invalidate_dashboard_stats():
+    cache.delete(DASHBOARD_STATS_CACHE_KEY)
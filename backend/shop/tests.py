@@ -1,3 +1,1736 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import httpx
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .models import (
+    Product, ProductImage, ProductVideo, Order, OrderItem, DailySalesRollup, StockReservation,
+    OutboxEmail, PaymentNotification, DeliveryZone, MediaUpload, Cart
+)
+from .outbox import deliver_batch
+from .emails import queue_order_confirmation_email
+from . import metrics
+from .pesapal import PesapalAPI, build_session, pesapal_client
+from .bulk_ops import bulk_update_products
+from .cart import cart_totals
+from .checkout import place_order
+from .delivery_zones import zone_for
+from .sessions import purge_expired_sessions
+from .management.commands.benchmark_sessions import benchmark_engine
+from .inventory import release_expired_reservations, reserve_stock
+from .rollups import rebuild_rollup, record_order_completed
+from .payments import reconcile_payments
+from .media_uploads import MAX_ATTEMPTS, process_media_uploads
+
+
+def make_product(index, **kwargs):
+    defaults = {
+        'name': f'Product {index}',
+        'price': 100 + index,
+        'stock': 1,
+        'category': 'tops',
+    }
+    defaults.update(kwargs)
+    return Product.objects.create(**defaults)
+
+
+def make_order(user, products, **kwargs):
+    defaults = {
+        'user': user,
+        'total_amount': sum(p.price for p in products),
+        'shipping_address': '1 Moi Avenue',
+        'shipping_city': 'Nairobi',
+        'shipping_postal_code': '00100',
+        'shipping_country': 'Kenya',
+        'phone_number': '0700000000',
+    }
+    defaults.update(kwargs)
+    order = Order.objects.create(**defaults)
+    for product in products:
+        OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+    return order
+
+
+class ProductQueryCountTests(TestCase):
+    """Serializing products must not issue per-product queries for media"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user('admin', 'admin@example.com', is_staff=True)
+
+    def add_products(self, count):
+        for _ in range(count):
+            product = make_product(Product.objects.count())
+            ProductImage.objects.create(product=product, image='products/additional/a', order=0)
+            ProductImage.objects.create(product=product, image='products/additional/b', order=1)
+            ProductVideo.objects.create(product=product, video='products/videos/v')
+
+    def test_product_list_query_count_is_constant(self):
+        for count in (2, 10):
+            self.add_products(count)
+            # 1 for the ETag aggregate, 1 for the page of products (+ video join),
+            # 1 for additional images
+            with self.assertNumQueries(3):
+                response = self.client.get('/api/products/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), Product.objects.count())
+            self.assertEqual(len(response.data['results'][0]['additional_images']), 2)
+
+    def test_product_detail_query_count(self):
+        self.add_products(1)
+        product = Product.objects.get()
+        with self.assertNumQueries(3):  # updated_at for the ETag, product + video, images
+            response = self.client.get(f'/api/products/{product.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data['video'])
+
+    def test_admin_product_list_query_count_is_constant(self):
+        self.client.force_authenticate(self.admin)
+        for count in (2, 10):
+            self.add_products(count)
+            with self.assertNumQueries(2):
+                response = self.client.get('/api/admin/products/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data), Product.objects.count())
+
+
+class ProductListFilterTests(TestCase):
+    """Catalog filters, sort options and cursor paging on /api/products/"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.cheap = make_product(1, price=50, size='s', condition='new')
+        self.mid = make_product(2, price=150, size='m', condition='good', name='Alpha')
+        self.dear = make_product(3, price=300, size='l', condition='fair')
+
+    def ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [product['id'] for product in response.data['results']]
+
+    def test_size_and_condition_accept_comma_separated_or_repeated_values(self):
+        self.assertEqual(set(self.ids('/api/products/?size=s,m')), {self.cheap.pk, self.mid.pk})
+        self.assertEqual(set(self.ids('/api/products/?size=s&size=l')), {self.cheap.pk, self.dear.pk})
+        self.assertEqual(self.ids('/api/products/?condition=fair'), [self.dear.pk])
+        self.assertEqual(self.ids('/api/products/?size=s,m&condition=good'), [self.mid.pk])
+
+    def test_price_range(self):
+        self.assertEqual(set(self.ids('/api/products/?min_price=100')), {self.mid.pk, self.dear.pk})
+        self.assertEqual(self.ids('/api/products/?min_price=100&max_price=200'), [self.mid.pk])
+
+    def test_invalid_prices_are_rejected(self):
+        for query in ('min_price=abc', 'min_price=nan', 'max_price=Infinity', 'max_price=-inf', 'min_price=sNaN'):
+            response = self.client.get(f'/api/products/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn('price', response.data)
+
+    def test_sort_options(self):
+        self.assertEqual(self.ids('/api/products/?sort=price-low'), [self.cheap.pk, self.mid.pk, self.dear.pk])
+        self.assertEqual(self.ids('/api/products/?sort=price-high'), [self.dear.pk, self.mid.pk, self.cheap.pk])
+        self.assertEqual(self.ids('/api/products/?sort=name')[0], self.mid.pk)
+        self.assertEqual(self.ids('/api/products/?sort=newest'), [self.dear.pk, self.mid.pk, self.cheap.pk])
+        # Unknown keys fall back to newest
+        self.assertEqual(self.ids('/api/products/?sort=bogus'), [self.dear.pk, self.mid.pk, self.cheap.pk])
+
+    def test_cursor_next_walks_every_product_once(self):
+        for index in range(4, 8):
+            make_product(index, price=150)  # ties on price are broken by id
+        seen, url = [], '/api/products/?sort=price-low&page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen.extend(product['id'] for product in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, list(Product.objects.order_by('price', 'id').values_list('pk', flat=True)))
+
+
+class OrderQueryCountTests(TestCase):
+    """Order listings must cost a fixed number of queries however many orders/items exist"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user('admin', 'admin@example.com', is_staff=True)
+        self.products = [make_product(i) for i in range(3)]
+
+    def add_orders(self, count):
+        for _ in range(count):
+            user = User.objects.create_user(f'user{User.objects.count()}')
+            make_order(user, self.products)
+
+    def test_admin_orders_query_count_is_constant(self):
+        self.client.force_authenticate(self.admin)
+        for count in (2, 15):
+            self.add_orders(count)
+            # count, orders + users, items + products, status counts
+            with self.assertNumQueries(4):
+                response = self.client.get('/api/admin/orders/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], Order.objects.count())
+            self.assertEqual(len(response.data['results'][0]['items']), 3)
+
+    def test_admin_orders_are_paginated(self):
+        self.client.force_authenticate(self.admin)
+        self.add_orders(25)
+        response = self.client.get('/api/admin/orders/')
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_admin_orders_filter_and_search_run_on_the_server(self):
+        self.client.force_authenticate(self.admin)
+        self.add_orders(25)
+        shipped = Order.objects.order_by('id')[:3]
+        Order.objects.filter(pk__in=[order.pk for order in shipped]).update(status='shipped')
+        target = Order.objects.order_by('id').last()
+
+        response = self.client.get('/api/admin/orders/', {'status': 'shipped'})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual({order['status'] for order in response.data['results']}, {'shipped'})
+
+        response = self.client.get('/api/admin/orders/', {'search': target.user.username})
+        self.assertEqual([order['id'] for order in response.data['results']], [target.pk])
+        response = self.client.get('/api/admin/orders/', {'search': str(target.pk)})
+        self.assertIn(target.pk, [order['id'] for order in response.data['results']])
+
+    def test_status_counts_cover_every_order_not_just_the_page(self):
+        self.client.force_authenticate(self.admin)
+        self.add_orders(25)
+        Order.objects.filter(pk__in=Order.objects.order_by('id').values('pk')[:2]).update(status='delivered')
+        response = self.client.get('/api/admin/orders/', {'status': 'pending'})
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(response.data['status_counts'], {
+            'pending': 23, 'processing': 0, 'shipped': 0, 'delivered': 2, 'cancelled': 0,
+        })
+
+        shopper = User.objects.get(username='user1')
+        self.client.force_authenticate(shopper)
+        response = self.client.get('/api/orders/user/')
+        self.assertEqual(sum(response.data['status_counts'].values()), shopper.orders.count())
+
+    def test_user_orders_query_count_is_constant(self):
+        user = User.objects.create_user('shopper')
+        self.client.force_authenticate(user)
+        for count in (2, 10):
+            for _ in range(count):
+                make_order(user, self.products)
+            with self.assertNumQueries(4):  # the page as below, plus status counts
+                response = self.client.get('/api/orders/user/')
+            self.assertEqual(response.status_code, 200)
+            with self.assertNumQueries(3):
+                response = self.client.get('/api/orders/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], user.orders.count())
+
+
+class ProductSearchTests(TestCase):
+    """Full-text search (SQLite FTS5 here, PostgreSQL tsvector/trigram in production)"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.jacket = make_product(1, name='Vintage denim jacket', description='Classic blue wash')
+        self.dress = make_product(2, name='Floral summer dress', description='Light cotton, pairs with a denim jacket')
+        self.boots = make_product(3, name='Leather boots', category='shoes')
+        make_product(4, name='Denim skirt', is_active=False)
+
+    def search(self, q, **params):
+        return self.client.get('/api/products/search/', {'q': q, **params})
+
+    def names(self, response):
+        return [p['name'] for p in response.data['results']]
+
+    def test_name_matches_rank_above_description_matches(self):
+        response = self.search('denim jacket')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.names(response), ['Vintage denim jacket', 'Floral summer dress'])
+        self.assertNotIn('search_vector', response.data['results'][0])
+
+    def test_stemming_prefixes_and_categories_match(self):
+        self.assertEqual(self.names(self.search('dresses')), ['Floral summer dress'])
+        self.assertEqual(self.names(self.search('leath')), ['Leather boots'])
+        self.assertEqual(self.names(self.search('shoes')), ['Leather boots'])
+
+    def test_falls_back_to_any_term(self):
+        self.assertEqual(self.names(self.search('leather sandals')), ['Leather boots'])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.boots.name = 'Suede boots'
+        self.boots.save()
+        self.assertEqual(self.names(self.search('leather')), [])
+        self.assertEqual(self.names(self.search('suede')), ['Suede boots'])
+
+        self.boots.delete()
+        self.assertEqual(self.names(self.search('suede')), [])
+
+    def test_list_q_filter_uses_index(self):
+        response = self.client.get('/api/products/', {'q': 'denim'})
+        self.assertEqual(
+            {p['name'] for p in response.data['results']},
+            {'Vintage denim jacket', 'Floral summer dress'}
+        )
+
+    def test_category_filter_applies_before_the_limit(self):
+        # Many better-ranked matches elsewhere must not crowd out the category's
+        Product.objects.bulk_create([
+            Product(name=f'Leather jacket {i}', slug=f'leather-jacket-{i}', price=100, stock=1, category='tops')
+            for i in range(600)
+        ])
+        for i in range(35, 40):
+            make_product(i, name=f'Leather bag {i}', is_active=False, category='bags')
+        make_product(40, name='Canvas tote', description='Trimmed in leather', category='bags')
+        self.assertEqual(self.names(self.search('leather', category='bags', limit=1)), ['Canvas tote'])
+
+    def test_query_is_required(self):
+        self.assertEqual(self.search('').status_code, 400)
+
+    def test_query_count_does_not_grow_with_catalog(self):
+        for i in range(5, 45):
+            make_product(i, name=f'Denim item {i}')
+        # candidate ids, products, images prefetch (video is select_related)
+        with self.assertNumQueries(3):
+            response = self.search('denim', limit=100)
+        self.assertEqual(response.data['count'], 42)
+
+
+class CatalogCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.client = APIClient()
+        self.product = make_product(1, stock=3)
+        self.zone = DeliveryZone.objects.create(city='Nairobi', delivery_fee=200)
+
+    def test_repeat_reads_are_served_from_cache(self):
+        first = self.client.get('/api/products/', {'sort': 'price-low'})
+        self.client.get(f'/api/products/{self.product.pk}/')
+        with self.assertNumQueries(2):  # just the ETag lookups
+            second = self.client.get('/api/products/', {'sort': 'price-low'})
+            self.client.get(f'/api/products/{self.product.pk}/')
+        self.assertEqual(first.data, second.data)
+
+        counters = metrics.snapshot()['counters']
+        self.assertEqual((counters['cache.catalog.hit'], counters['cache.catalog.miss']), (2, 2))
+
+    def test_product_edit_invalidates_list_and_detail(self):
+        self.client.get('/api/products/')
+        self.client.get(f'/api/products/{self.product.pk}/')
+        self.product.name = 'Renamed'
+        self.product.save()
+
+        self.assertEqual(self.client.get('/api/products/').data['results'][0]['name'], 'Renamed')
+        self.assertEqual(self.client.get(f'/api/products/{self.product.pk}/').data['name'], 'Renamed')
+
+    def test_stock_changes_invalidate_detail(self):
+        self.client.get(f'/api/products/{self.product.pk}/')
+        order = make_order(User.objects.create_user('shopper'), [])
+        reserve_stock(order, [(self.product, 2)])
+        self.assertEqual(self.client.get(f'/api/products/{self.product.pk}/').data['stock'], 1)
+
+    def test_write_from_another_process_is_never_served_stale(self):
+        # A --loop worker under locmem: its invalidation never reaches this
+        # process's cache, but the row's updated_at (and so the ETag) moves
+        first_list = self.client.get('/api/products/')
+        first_detail = self.client.get(f'/api/products/{self.product.pk}/')
+        Product.objects.filter(pk=self.product.pk).update(stock=0, updated_at=timezone.now() + timedelta(seconds=1))
+
+        for url, first in (('/api/products/', first_list), (f'/api/products/{self.product.pk}/', first_detail)):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], first['ETag'])
+            body = response.data['results'][0] if 'results' in response.data else response.data
+            self.assertEqual(body['stock'], 0)
+
+    def test_delivery_zones_cached_until_changed(self):
+        self.client.get('/api/delivery-zones/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/delivery-zones/')
+
+        self.zone.delivery_fee = 250
+        self.zone.save()
+        self.assertEqual(self.client.get('/api/delivery-zones/').json()[0]['delivery_fee'], '250.00')
+
+
+class DeliveryZoneRegistryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.client = APIClient()
+        DeliveryZone.objects.create(city='Nairobi', delivery_fee=200, estimated_days=1)
+        DeliveryZone.objects.create(city='Kisumu', delivery_fee=400, is_active=False)
+
+    def test_lookups_are_in_memory_and_case_insensitive(self):
+        zone_for('Nairobi')
+        with self.assertNumQueries(0):
+            self.assertEqual(zone_for('  nairobi ').delivery_fee, 200)
+            self.assertIsNone(zone_for('Kisumu'))
+            self.assertIsNone(zone_for(''))
+        self.assertEqual(metrics.snapshot()['counters']['delivery_zones.reload'], 1)
+
+    def test_a_zone_edit_reaches_other_processes_through_the_version_key(self):
+        zone_for('Nairobi')
+        # Another worker edits a zone: only the shared version key moves here
+        DeliveryZone.objects.filter(city='Kisumu').update(is_active=True)
+        cache.set('shop:delivery_zones:version', 'edited-elsewhere')
+        self.assertEqual(zone_for('kisumu').delivery_fee, 400)
+
+        # A flushed cache also forces a reload rather than trusting old zones
+        DeliveryZone.objects.filter(city='Kisumu').update(delivery_fee=450)
+        cache.clear()
+        self.assertEqual(zone_for('Kisumu').delivery_fee, 450)
+
+    @override_settings(DELIVERY_ZONES_MAX_AGE=30)
+    def test_without_a_shared_cache_zones_reload_after_max_age(self):
+        # Under locmem another worker's edit never moves this process's version key
+        zone_for('Nairobi')
+        DeliveryZone.objects.filter(city='Nairobi').update(delivery_fee=260)
+        self.assertEqual(zone_for('Nairobi').delivery_fee, 200)
+
+        later = time.monotonic() + 31
+        with mock.patch('shop.delivery_zones.time.monotonic', return_value=later):
+            self.assertEqual(zone_for('Nairobi').delivery_fee, 260)
+            with self.assertNumQueries(0):
+                zone_for('Nairobi')
+
+    def test_zones_endpoint_serves_a_prebuilt_body(self):
+        first = self.client.get('/api/delivery-zones/')
+        self.assertEqual(first.json(), [{'city': 'Nairobi', 'delivery_fee': '200.00', 'estimated_days': 1}])
+        with self.assertNumQueries(0):
+            again = self.client.get('/api/delivery-zones/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+        nairobi = DeliveryZone.objects.get(city='Nairobi')
+        nairobi.delivery_fee = 250
+        nairobi.save()
+        self.assertEqual(self.client.get('/api/delivery-zones/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_checkout_matches_the_city_in_any_case(self):
+        user = User.objects.create_user('shopper', 'shopper@example.com')
+        self.client.force_authenticate(user)
+        payload = {**checkout_payload(make_product(1)), 'shipping_city': 'NAIROBI'}
+        with mock.patch('shop.views.pesapal_client') as pesapal:
+            pesapal.submit_order.return_value = PESAPAL_OK
+            response = self.client.post('/api/orders/create/', payload, format='json')
+        self.assertEqual((response.data['delivery_fee'], response.data['estimated_delivery_days']), ('200.00', 1))
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.product = make_product(1)
+        make_product(2)
+
+    def revalidate(self, url, response, **params):
+        return self.client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_catalog_answers_304_from_one_query(self):
+        first = self.client.get('/api/products/', {'category': 'tops'})
+        self.assertIn('max-age=30', first['Cache-Control'])
+        self.assertIn('Last-Modified', first)
+
+        with self.assertNumQueries(1):
+            second = self.revalidate('/api/products/', first, category='tops')
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_list_etag_changes_with_products(self):
+        first = self.client.get('/api/products/')
+        self.product.price = 50
+        self.product.save()
+        self.assertEqual(self.revalidate('/api/products/', first).status_code, 200)
+
+        second = self.client.get('/api/products/')
+        self.product.delete()
+        self.assertEqual(self.revalidate('/api/products/', second).status_code, 200)
+
+    def test_detail_etag_follows_stock_and_media(self):
+        url = f'/api/products/{self.product.pk}/'
+        first = self.client.get(url)
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+
+        later = timezone.now() + timedelta(seconds=1)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            ProductImage.objects.create(product=self.product, image='products/additional/a', order=0)
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_order_detail_is_private_and_conditional(self):
+        user = User.objects.create_user('shopper')
+        order = make_order(user, [self.product])
+        self.client.force_authenticate(user)
+        url = f'/api/orders/{order.pk}/'
+
+        first = self.client.get(url)
+        self.assertIn('private', first['Cache-Control'])
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+
+        order.status = 'shipped'
+        order.save()
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+
+class MediaUrlTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    @override_settings(CLOUDINARY_CLOUD_NAME='shopcloud')
+    def test_product_images_are_bounded_and_format_auto(self):
+        product = make_product(1, image='image/upload/v12/products/dress.jpg')
+        data = self.client.get(f'/api/products/{product.pk}/').data
+
+        base = 'https://res.cloudinary.com/shopcloud/image/upload/f_auto,q_auto,c_limit'
+        self.assertEqual(data['image'], f'{base},w_1280/v12/products/dress.jpg')
+        self.assertEqual(data['image_thumbnail'], f'{base},w_480/v12/products/dress.jpg')
+        self.assertIn(f'{base},w_320/v12/products/dress.jpg 320w', data['image_srcset'])
+
+    def test_missing_media_serializes_as_null(self):
+        product = make_product(1)
+        data = self.client.get(f'/api/products/{product.pk}/').data
+        self.assertIsNone(data['image'])
+        self.assertIsNone(data['image_srcset'])
+
+    def test_order_items_carry_a_small_absolute_image(self):
+        user = User.objects.create_user('shopper')
+        order = make_order(user, [make_product(1, image='products/dress.png')])
+        self.client.force_authenticate(user)
+
+        item = self.client.get(f'/api/orders/{order.pk}/').data['items'][0]
+        self.assertEqual(
+            item['product_image'],
+            f'https://res.cloudinary.com/{settings.CLOUDINARY_CLOUD_NAME}'
+            '/image/upload/f_auto,q_auto,c_limit,w_160/products/dress.png'
+        )
+
+
+class MediaUploadTests(TestCase):
+
+    def setUp(self):
+        self.staging = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.staging, ignore_errors=True)
+        settings_override = override_settings(MEDIA_UPLOAD_STAGING_DIR=self.staging)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+
+    def create_product(self, additional=2):
+        payload = {
+            'name': 'Denim jacket', 'price': '1500', 'stock': '1', 'category': 'jackets',
+            'image': SimpleUploadedFile('main.jpg', b'main'),
+            'additional_images': [SimpleUploadedFile(f'extra{i}.jpg', b'extra') for i in range(additional)],
+            'video': SimpleUploadedFile('clip.mp4', b'video'),
+            'video_thumbnail': SimpleUploadedFile('poster.jpg', b'poster'),
+        }
+        return self.client.post('/api/admin/products/create/', payload, format='multipart')
+
+    @staticmethod
+    def fake_upload(path, folder, resource_type):
+        return f'{resource_type}/upload/v1/{folder}/{os.path.basename(path)}'
+
+    def test_create_stages_media_without_uploading(self):
+        with mock.patch('shop.media_uploads.upload_to_cloudinary') as upload:
+            response = self.create_product()
+        upload.assert_not_called()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['media_status'], 'processing')
+
+        progress = self.client.get(f"/api/admin/products/{response.data['id']}/media/").data
+        self.assertEqual((progress['total'], progress['pending']), (4, 4))
+        # main, 2 extras, video + its thumbnail
+        self.assertEqual(len(os.listdir(self.staging)), 5)
+
+    def test_worker_attaches_uploads_and_marks_product_ready(self):
+        product_id = self.create_product().data['id']
+        with mock.patch('shop.media_uploads.upload_to_cloudinary', side_effect=self.fake_upload):
+            self.assertEqual(process_media_uploads(), (4, 0, 0))
+
+        product = Product.objects.get(pk=product_id)
+        self.assertEqual(product.media_status, 'ready')
+        self.assertTrue(str(product.image).startswith('products/'))
+        self.assertTrue(str(product.image).endswith('_main'))
+        self.assertEqual(product.additional_images.count(), 2)
+        self.assertIn('video_thumbnails', str(product.video.thumbnail))
+        self.assertEqual(os.listdir(self.staging), [])
+        self.assertEqual(self.client.get(f'/api/admin/products/{product_id}/media/').data['done'], 4)
+
+    def test_uploads_run_in_parallel(self):
+        self.create_product(additional=3)
+        # Every upload waits for two others: a serial worker would time out here
+        barrier = threading.Barrier(3, timeout=5)
+
+        def upload(path, folder, resource_type):
+            if folder == 'products/additional':
+                barrier.wait()
+            return self.fake_upload(path, folder, resource_type)
+
+        with mock.patch('shop.media_uploads.upload_to_cloudinary', side_effect=upload):
+            done, retried, failed = process_media_uploads(concurrency=4)
+        self.assertEqual((done, retried, failed), (5, 0, 0))
+
+    def test_failing_upload_backs_off_then_gives_up(self):
+        product_id = self.create_product(additional=0).data['id']
+        with mock.patch('shop.media_uploads.upload_to_cloudinary', side_effect=RuntimeError('timeout')):
+            self.assertEqual(process_media_uploads(), (0, 2, 0))
+            self.assertEqual(Product.objects.get(pk=product_id).media_status, 'processing')
+
+            MediaUpload.objects.update(attempts=MAX_ATTEMPTS - 1, next_attempt_at=timezone.now())
+            self.assertEqual(process_media_uploads(), (0, 0, 2))
+
+        self.assertEqual(Product.objects.get(pk=product_id).media_status, 'failed')
+        progress = self.client.get(f'/api/admin/products/{product_id}/media/').data
+        self.assertEqual(progress['failed'], 2)
+        self.assertEqual(progress['uploads'][0]['error'], 'timeout')
+        # Kept for a retry from the admin, removed with the product
+        self.assertTrue(os.listdir(self.staging))
+        Product.objects.filter(pk=product_id).delete()
+        self.assertEqual(os.listdir(self.staging), [])
+
+
+class DirectUploadTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, MEDIA_DIRECT_UPLOAD_BACKEND='local')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+        self.product = make_product(1)
+
+    def upload(self, kind, name):
+        grant = self.client.post('/api/admin/uploads/sign/', {'kind': kind}, format='json').data['uploads'][0]
+        # Storage is reached without the admin's credentials
+        stored = APIClient().post(
+            grant['upload_url'], {**grant['fields'], grant['file_field']: SimpleUploadedFile(name, b'bytes')},
+            format='multipart'
+        )
+        self.assertEqual(stored.status_code, 201)
+        return {'upload_token': grant['upload_token'], 'version': stored.data['version'], 'format': stored.data['format']}
+
+    def finalize(self, uploads, **extra):
+        return self.client.post(
+            f'/api/admin/products/{self.product.pk}/media/finalize/', {'uploads': uploads, **extra}, format='json'
+        )
+
+    def test_signed_upload_then_finalize_attaches_media(self):
+        uploads = [
+            self.upload('image', 'main.jpg'),
+            self.upload('additional_image', 'back.png'),
+            self.upload('additional_image', 'label.png'),
+            self.upload('video', 'clip.mp4'),
+            self.upload('video_thumbnail', 'poster.jpg'),
+        ]
+        response = self.finalize(uploads)
+        self.assertEqual(response.status_code, 200)
+
+        self.product.refresh_from_db()
+        self.assertTrue(str(self.product.image).startswith('products/'))
+        self.assertEqual(
+            [image.image.format for image in self.product.additional_images.all()], ['png', 'png']
+        )
+        self.assertEqual(self.product.video.video.resource_type, 'video')
+        self.assertIn('/video/upload/q_auto/', response.data['video']['video'])
+
+        # A retried finalize doesn't duplicate anything
+        self.assertEqual(self.finalize(uploads).status_code, 200)
+        self.assertEqual(self.product.additional_images.count(), 2)
+
+    def test_finalize_only_accepts_issued_uploads(self):
+        upload = self.upload('image', 'main.jpg')
+        tampered = {**upload, 'upload_token': upload['upload_token'][:-2] + 'xx'}
+        self.assertEqual(self.finalize([tampered]).status_code, 400)
+
+        grant = self.client.post('/api/admin/uploads/sign/', {'kind': 'image'}, format='json').data['uploads'][0]
+        never_uploaded = {'upload_token': grant['upload_token'], 'version': 1, 'format': 'jpg'}
+        self.assertEqual(self.finalize([never_uploaded]).status_code, 400)
+
+        with override_settings(DIRECT_UPLOAD_TTL_SECONDS=-1):
+            expired = self.client.post('/api/admin/uploads/sign/', {'kind': 'image'}, format='json').data['uploads'][0]
+            stored = self.client.post(
+                '/api/admin/uploads/local/',
+                {'upload_token': expired['upload_token'], 'file': SimpleUploadedFile('late.jpg', b'x')},
+                format='multipart'
+            )
+        self.assertEqual(stored.status_code, 400)
+
+        self.client.force_authenticate(User.objects.create_user('shopper'))
+        self.assertEqual(self.finalize([upload]).status_code, 403)
+
+    @override_settings(
+        MEDIA_DIRECT_UPLOAD_BACKEND='cloudinary', CLOUDINARY_API_KEY='key', CLOUDINARY_API_SECRET='secret',
+        CLOUDINARY_CLOUD_NAME='shopcloud',
+    )
+    def test_cloudinary_grants_are_signed_for_one_public_id(self):
+        from cloudinary.utils import api_sign_request
+
+        grants = self.client.post(
+            '/api/admin/uploads/sign/', {'kind': 'additional_image', 'count': 2}, format='json'
+        ).data['uploads']
+        self.assertEqual(len(grants), 2)
+        fields = grants[0]['fields']
+        self.assertEqual(grants[0]['upload_url'], 'https://api.cloudinary.com/v1_1/shopcloud/image/upload')
+        self.assertTrue(fields['public_id'].startswith('products/additional/'))
+        self.assertNotEqual(fields['public_id'], grants[1]['fields']['public_id'])
+        self.assertEqual(
+            fields['signature'],
+            api_sign_request({'public_id': fields['public_id'], 'timestamp': fields['timestamp']}, 'secret')
+        )
+        self.assertEqual(self.client.post('/api/admin/uploads/local/', {}).status_code, 404)
+
+
+class BulkImportExportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+
+    def csv_file(self, rows, name='drop.csv'):
+        header = 'id,name,price,stock,category,size,additional_images\n'
+        return SimpleUploadedFile(name, (header + ''.join(f'{row}\n' for row in rows)).encode())
+
+    def import_file(self, upload, **extra):
+        return self.client.post('/api/admin/products/import/', {'file': upload, **extra}, format='multipart')
+
+    def test_csv_import_creates_and_updates_in_batches(self):
+        existing = make_product(1)
+        rows = [f',Jacket {i},{1000 + i},1,jackets,m,products/additional/j{i}a|products/additional/j{i}b' for i in range(3)]
+        rows.append(f'{existing.pk},,80,,,,')
+        report = self.import_file(self.csv_file(rows)).data
+
+        self.assertEqual((report['created'], report['updated'], report['failed']), (3, 1, 0))
+        jacket = Product.objects.get(name='Jacket 2')
+        self.assertTrue(jacket.slug.startswith('jacket-2-'))
+        self.assertEqual(jacket.additional_images.count(), 2)
+        existing.refresh_from_db()
+        # Only the filled-in column changed
+        self.assertEqual((existing.price, existing.name), (Decimal('80'), 'Product 1'))
+        # Bulk writes still feed the search index triggers
+        self.assertEqual(self.client.get('/api/products/search/', {'q': 'jacket'}).data['count'], 3)
+
+    def test_import_query_count_does_not_grow_with_rows(self):
+        def queries_for(count, offset):
+            rows = [f',Dress {offset + i},500,1,dresses,s,products/additional/d{offset + i}' for i in range(count)]
+            with CaptureQueriesContext(connection) as ctx:
+                self.import_file(self.csv_file(rows))
+            return len(ctx.captured_queries)
+
+        self.assertEqual(queries_for(5, 0), queries_for(50, 100))
+        self.assertEqual(Product.objects.filter(category='dresses').count(), 55)
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        jsonl = '\n'.join([
+            json.dumps({'name': 'Skirt', 'price': '300', 'stock': 2, 'category': 'skirts'}),
+            json.dumps({'name': 'No price', 'category': 'skirts'}),
+            '{not json',
+            json.dumps({'id': 99999, 'price': '10'}),
+            json.dumps({'name': 'Bad size', 'price': '5', 'category': 'skirts', 'size': 'huge'}),
+        ])
+        report = self.import_file(SimpleUploadedFile('drop.jsonl', jsonl.encode())).data
+
+        self.assertEqual((report['rows'], report['created'], report['failed']), (5, 1, 4))
+        errors = {error['line']: error['errors'] for error in report['errors']}
+        self.assertIn('price', errors[2])
+        self.assertIn('row', errors[3])
+        self.assertIn('id', errors[4])
+        self.assertIn('size', errors[5])
+
+    def test_dry_run_writes_nothing(self):
+        report = self.import_file(self.csv_file([',Coat,900,1,coats,l,']), dry_run='true').data
+        self.assertEqual(report['created'], 1)
+        self.assertFalse(Product.objects.exists())
+
+    def test_export_streams_a_file_that_imports_back(self):
+        product = make_product(1, image='image/upload/v3/products/tee.jpg')
+        ProductImage.objects.create(product=product, image='image/upload/v4/products/additional/back.jpg', order=0)
+        make_product(2)
+
+        response = self.client.get('/api/admin/products/export/', {'output': 'jsonl'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(json.loads(lines[0])['image'], 'image/upload/v3/products/tee.jpg')
+        self.assertEqual(json.loads(lines[0])['additional_images'], ['image/upload/v4/products/additional/back.jpg'])
+
+        exported = self.client.get('/api/admin/products/export/')
+        self.assertEqual(exported['Content-Type'], 'text/csv; charset=utf-8')
+        upload = SimpleUploadedFile('products.csv', b''.join(exported.streaming_content))
+        report = self.import_file(upload).data
+        self.assertEqual((report['updated'], report['failed']), (2, 0))
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(product.additional_images.count(), 1)
+
+    def test_commands_round_trip_through_a_file(self):
+        make_product(1)
+        path = os.path.join(tempfile.mkdtemp(), 'products.jsonl')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        call_command('export_data', 'products', format='jsonl', output=path)
+
+        out = io.StringIO()
+        call_command('import_products', path, stdout=out)
+        self.assertIn('updated 1, failed 0 of 1 rows', out.getvalue())
+
+    def test_import_from_stdin_leaves_stdin_open(self):
+        stdin = io.StringIO('{"name": "Piped", "price": "10", "stock": 1, "category": "tops"}\n')
+        out = io.StringIO()
+        with mock.patch('sys.stdin', stdin):
+            call_command('import_products', '-', format='jsonl', stdout=out)
+        self.assertIn('Created 1', out.getvalue())
+        self.assertFalse(stdin.closed)
+
+    def test_order_export_filters_by_status(self):
+        user = User.objects.create_user('shopper')
+        make_order(user, [make_product(1), make_product(2)], status='shipped')
+        make_order(user, [make_product(3)], status='pending')
+
+        response = self.client.get('/api/admin/orders/export/', {'status': 'shipped'})
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual({row['status'] for row in rows}, {'shipped'})
+        self.assertEqual(rows[0]['username'], 'shopper')
+
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.get('/api/admin/orders/export/').status_code, 403)
+
+
+class BulkAdminOperationsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+        self.shopper = User.objects.create_user('shopper', 'shopper@example.com')
+
+    def bulk_status(self, ids, new_status):
+        return self.client.post('/api/admin/orders/bulk-status/', {'ids': ids, 'status': new_status}, format='json')
+
+    def test_bulk_ship_is_constant_queries_and_queues_emails(self):
+        def ship(count):
+            orders = [make_order(self.shopper, [make_product(i)], status='processing') for i in range(count)]
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.bulk_status([o.pk for o in orders], 'shipped')
+            self.assertEqual(response.data['updated'], count)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(ship(3), ship(30))
+        self.assertEqual(Order.objects.filter(status='shipped').count(), 33)
+        self.assertEqual(OutboxEmail.objects.count(), 33)
+
+    def test_bulk_cancel_returns_stock_set_based(self):
+        shirt = make_product(1, stock=5, category='tops')
+        paid = make_order(self.shopper, [shirt], status='processing', payment_status='completed')
+        record_order_completed(paid)
+        unpaid = make_order(self.shopper, [shirt])
+        reserve_stock(unpaid, [(shirt, 2)])
+        already = make_order(self.shopper, [shirt], status='cancelled')
+
+        response = self.bulk_status([paid.pk, unpaid.pk, already.pk], 'cancelled')
+        self.assertEqual((response.data['updated'], response.data['unchanged']), (2, 1))
+
+        shirt.refresh_from_db()
+        # 3 held - 2 reserved + 2 released + 1 restocked from the paid order
+        self.assertEqual(shirt.stock, 6)
+        self.assertEqual(StockReservation.objects.get(order=unpaid).status, StockReservation.RELEASED)
+        self.assertEqual(DailySalesRollup.objects.get().order_count, 0)
+
+        # Un-cancelling the paid order puts it back in the rollup
+        self.bulk_status([paid.pk], 'processing')
+        self.assertEqual(DailySalesRollup.objects.get().order_count, 1)
+
+    def test_unknown_order_changes_nothing(self):
+        order = make_order(self.shopper, [make_product(1)])
+        response = self.bulk_status([order.pk, 99999], 'shipped')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['details'], {'missing_ids': [99999]})
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending')
+        self.assertEqual(self.bulk_status([order.pk], 'lost').status_code, 400)
+
+    def test_bulk_product_updates(self):
+        products = [make_product(i, stock=3) for i in range(4)]
+        response = self.client.post(
+            '/api/admin/products/bulk-update/',
+            {'ids': [p.pk for p in products[:3]], 'changes': {'is_active': False}}, format='json'
+        )
+        self.assertEqual(response.data['updated'], 3)
+        self.assertEqual(Product.objects.filter(is_active=True).count(), 1)
+
+        response = self.client.post('/api/admin/products/bulk-update/', {'updates': [
+            {'id': products[0].pk, 'price': '50'},
+            {'id': products[1].pk, 'price': 'cheap'},
+            {'id': products[2].pk, 'slug': 'hijack'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['details']], [1, 2])
+        # All or nothing: the valid first update was not applied either
+        products[0].refresh_from_db()
+        self.assertEqual(products[0].price, Decimal('100'))
+
+
+class DashboardStatsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_user('admin', 'admin@example.com', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        self.products = [make_product(i, stock=i) for i in range(4)]
+        make_order(self.admin, self.products[:2], payment_status='completed', status='processing')
+        make_order(self.admin, self.products[2:])
+
+    def test_stats_are_aggregated_in_two_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/admin/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_products'], 4)
+        self.assertEqual(response.data['low_stock_items'], 3)
+        self.assertEqual(response.data['total_orders'], 2)
+        self.assertEqual(response.data['completed_orders'], 1)
+        self.assertEqual(response.data['pending_orders'], 1)
+        self.assertEqual(response.data['today_orders'], 2)
+        self.assertEqual(response.data['total_revenue'], Decimal('201.00'))
+        self.assertEqual(response.data['today_revenue'], Decimal('201.00'))
+
+    def test_stats_are_cached_until_an_order_changes(self):
+        self.client.get('/api/admin/stats/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/admin/stats/')
+
+        make_order(self.admin, self.products[:1], payment_status='completed')
+        response = self.client.get('/api/admin/stats/')
+        self.assertEqual(response.data['completed_orders'], 2)
+
+
+class DailySalesRollupTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user('admin', 'admin@example.com', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        self.tops = make_product(1, category='tops', stock=5)
+        self.shoes = make_product(2, category='shoes', stock=5)
+        self.order = make_order(self.admin, [self.tops, self.shoes], pesapal_order_tracking_id='track-1')
+
+    def pay(self, order):
+        with mock.patch('shop.views.pesapal_client') as client:
+            client.get_transaction_status.return_value = {
+                'payment_status_description': 'Completed', 'payment_method': 'MpesaKE',
+            }
+            return self.client.get('/api/pesapal/callback/', {'OrderTrackingId': order.pesapal_order_tracking_id})
+
+    def snapshot(self):
+        return sorted(DailySalesRollup.objects.values_list('category', 'city', 'payment_method', 'order_count', 'units_sold', 'revenue'))
+
+    def test_payment_and_cancellation_update_rollup_incrementally(self):
+        self.pay(self.order)
+        self.pay(self.order)  # duplicate IPN must not double count
+        self.assertEqual(self.snapshot(), [
+            ('shoes', 'Nairobi', 'MpesaKE', 1, 1, Decimal('102.00')),
+            ('tops', 'Nairobi', 'MpesaKE', 1, 1, Decimal('101.00')),
+        ])
+
+        self.client.put(f'/api/admin/orders/{self.order.pk}/status/', {'status': 'cancelled'}, format='json')
+        self.assertEqual([row[3:] for row in self.snapshot()], [(0, 0, Decimal('0.00'))] * 2)
+
+    def test_rebuild_matches_incremental_rollup(self):
+        self.pay(self.order)
+        incremental = self.snapshot()
+        DailySalesRollup.objects.all().delete()
+        rebuild_rollup()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_sales_report_groups_rollup_rows(self):
+        self.pay(self.order)
+        response = self.client.get('/api/admin/sales/', {'group_by': 'category'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals']['revenue'], Decimal('203.00'))
+        self.assertEqual([row['category'] for row in response.data['rows']], ['shoes', 'tops'])
+
+
+def checkout_payload(product, quantity=1):
+    return {
+        'items': [{'product_id': product.pk, 'quantity': quantity, 'price': str(product.price)}],
+        'total_amount': str(product.price * quantity),
+        'shipping_address': '1 Moi Avenue',
+        'shipping_city': 'Nairobi',
+        'shipping_country': 'Kenya',
+        'phone_number': '0700000000',
+    }
+
+
+PESAPAL_OK = {'status': '200', 'order_tracking_id': 'track', 'redirect_url': 'https://pay.example/'}
+
+
+@mock.patch('shop.views.pesapal_client')
+class StockReservationTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('shopper', 'shopper@example.com')
+        self.client.force_authenticate(self.user)
+        self.product = make_product(1, stock=2)
+
+    def checkout(self, quantity=1):
+        return self.client.post('/api/orders/create/', checkout_payload(self.product, quantity), format='json')
+
+    def test_checkout_holds_stock(self, pesapal):
+        pesapal.submit_order.return_value = PESAPAL_OK
+        response = self.checkout(2)
+        self.assertEqual(response.status_code, 201)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(StockReservation.objects.get().status, StockReservation.HELD)
+
+        response = self.checkout(1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_failed_payment_initiation_releases_hold(self, pesapal):
+        pesapal.submit_order.return_value = {'status': '500'}
+        self.assertEqual(self.checkout(2).status_code, 400)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+        self.assertFalse(Order.objects.exists())
+
+    def test_paid_order_commits_hold_without_touching_stock_again(self, pesapal):
+        pesapal.submit_order.return_value = PESAPAL_OK
+        order_id = self.checkout(1).data['id']
+        pesapal.get_transaction_status.return_value = {'payment_status_description': 'Completed'}
+        self.client.get('/api/pesapal/callback/', {'OrderTrackingId': 'track'})
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+        self.assertEqual(Order.objects.get(pk=order_id).payment_status, 'completed')
+        self.assertEqual(StockReservation.objects.get().status, StockReservation.COMMITTED)
+
+    def test_expired_hold_is_released(self, pesapal):
+        pesapal.submit_order.return_value = PESAPAL_OK
+        order_id = self.checkout(2).data['id']
+
+        self.assertEqual(release_expired_reservations(), 0)
+        later = timezone.now() + timedelta(minutes=31)
+        self.assertEqual(release_expired_reservations(now=later), 1)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+        order = Order.objects.get(pk=order_id)
+        self.assertEqual((order.status, order.payment_status), ('cancelled', 'expired'))
+
+
+    def test_plain_order_create_takes_stock_for_good(self, pesapal):
+        # POST /api/orders/ starts no payment: nothing is held, so nothing expires
+        payload = {**checkout_payload(self.product, 2), 'shipping_postal_code': '00100'}
+        response = self.client.post('/api/orders/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(StockReservation.objects.get().status, StockReservation.COMMITTED)
+
+        self.assertEqual(release_expired_reservations(now=timezone.now() + timedelta(minutes=31)), 0)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(Order.objects.get().status, 'pending')
+
+
+@mock.patch('shop.views.pesapal_client')
+class CheckoutQueryCountTests(TestCase):
+    """Checkout cost must not grow with the number of items in the cart"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('shopper', 'shopper@example.com')
+        self.client.force_authenticate(self.user)
+
+    def cart(self, count):
+        products = [make_product(i, stock=5) for i in range(count)]
+        payload = checkout_payload(products[0])
+        payload['items'] = [{'product_id': p.pk, 'quantity': 2, 'price': str(p.price)} for p in products]
+        return products, payload
+
+    def checkout_queries(self, count):
+        products, payload = self.cart(count)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/orders/create/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['items']), count)
+        return len(ctx.captured_queries)
+
+    def test_twenty_item_cart_costs_the_same_as_one(self, pesapal):
+        pesapal.submit_order.return_value = PESAPAL_OK
+        one, twenty = self.checkout_queries(1), self.checkout_queries(20)
+        self.assertEqual(one, twenty)
+
+        order = Order.objects.order_by('-pk').first()
+        self.assertEqual(order.items.count(), 20)
+        self.assertEqual(StockReservation.objects.filter(order=order).count(), 20)
+        self.assertTrue(order.pesapal_merchant_reference.startswith('KT-'))
+        self.assertEqual(order.pesapal_order_tracking_id, 'track')
+
+    def test_place_order_query_budget(self, pesapal):
+        _, payload = self.cart(20)
+        zone_for('Nairobi')  # zones are loaded once per process
+        # products, order, items, one stock UPDATE, holds, reload
+        # (order + items), outbox email, and 4 savepoint statements
+        with self.assertNumQueries(12):
+            place_order(self.user, payload)
+
+    def test_short_item_rolls_everything_back(self, pesapal):
+        products, payload = self.cart(3)
+        payload['items'][1]['quantity'] = 6
+        response = self.client.post('/api/orders/create/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], f'Insufficient stock for {products[1].name}')
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(sorted(Product.objects.values_list('stock', flat=True)), [5, 5, 5])
+
+        payload['items'][1]['product_id'] = 99999
+        self.assertEqual(self.client.post('/api/orders/create/', payload, format='json').status_code, 404)
+
+
+@mock.patch('shop.views.pesapal_client')
+class CartTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('shopper', 'shopper@example.com')
+        self.client.force_authenticate(self.user)
+        self.shirt = make_product(1, price=500, stock=3)
+        self.jeans = make_product(2, price=1200, stock=2)
+        DeliveryZone.objects.create(city='Nakuru', delivery_fee=300, estimated_days=2)
+
+    def add(self, product, quantity=1):
+        return self.client.post('/api/cart/items/', {'product_id': product.pk, 'quantity': quantity}, format='json')
+
+    def assert_totals_match_items(self):
+        cart = Cart.objects.get(user=self.user)
+        items = list(cart.items.all())
+        self.assertEqual(cart.subtotal, sum(item.unit_price * item.quantity for item in items))
+        self.assertEqual(cart.item_count, sum(item.quantity for item in items))
+
+    def test_incremental_add_update_remove(self, pesapal):
+        self.add(self.shirt, 2)
+        response = self.add(self.jeans)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['subtotal'], response.data['item_count']), ('2200.00', 3))
+
+        response = self.client.put(f'/api/cart/items/{self.shirt.pk}/', {'quantity': 1}, format='json')
+        self.assertEqual(response.data['subtotal'], '1700.00')
+        response = self.client.delete(f'/api/cart/items/{self.jeans.pk}/')
+        self.assertEqual((response.data['subtotal'], response.data['item_count']), ('500.00', 1))
+        self.assert_totals_match_items()
+
+        self.assertEqual(self.add(self.shirt, 3).status_code, 400)
+        self.assertEqual(self.client.post('/api/cart/items/', {'product_id': 99999}, format='json').status_code, 404)
+
+    def test_totals_with_delivery_are_one_query(self, pesapal):
+        products = [make_product(10 + i, stock=5) for i in range(15)]
+        self.client.post('/api/cart/items/', {'items': [{'product_id': p.pk, 'quantity': 2} for p in products]}, format='json')
+        self.client.put('/api/cart/', {'shipping_city': 'Nakuru'}, format='json')
+
+        with self.assertNumQueries(1):
+            totals = cart_totals(self.user)
+        subtotal = sum(p.price * 2 for p in products)
+        self.assertEqual(totals['subtotal'], subtotal)
+        self.assertEqual((totals['delivery_fee'], totals['estimated_days']), (300, 2))
+        self.assertEqual(totals['total'], subtotal + 300)
+
+        quote = self.client.get('/api/cart/', {'city': 'Mombasa'}).data
+        self.assertEqual((quote['delivery_available'], quote['delivery_fee'], quote['estimated_days']), (False, '0', 3))
+
+    def test_price_changes_and_deletes_move_cart_totals(self, pesapal):
+        self.add(self.shirt, 2)
+        self.add(self.jeans)
+
+        self.shirt.price = 450
+        self.shirt.save()
+        self.assertEqual(Cart.objects.get().subtotal, 2100)
+        bulk_update_products([{'id': self.jeans.pk, 'price': '1000'}])
+        self.assertEqual(Cart.objects.get().subtotal, 1900)
+        self.assert_totals_match_items()
+
+        self.jeans.delete()
+        cart = Cart.objects.get()
+        self.assertEqual((cart.subtotal, cart.item_count), (900, 2))
+
+    def test_checkout_from_cart_prices_on_the_server(self, pesapal):
+        pesapal.submit_order.return_value = {'status': '500'}
+        self.add(self.shirt, 2)
+        self.client.put('/api/cart/', {'shipping_city': 'Nakuru'}, format='json')
+        payload = {**checkout_payload(self.shirt), 'total_amount': '1', 'shipping_city': ''}
+        del payload['items']
+
+        # Payment never started: the cart is left as it was
+        self.assertEqual(self.client.post('/api/orders/create/', payload, format='json').status_code, 400)
+        self.assertEqual(Cart.objects.get().item_count, 2)
+
+        pesapal.submit_order.return_value = PESAPAL_OK
+        response = self.client.post('/api/orders/create/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['shipping_city'], 'Nakuru')
+        self.assertEqual((response.data['delivery_fee'], response.data['total_amount']), ('300.00', '1300.00'))
+        self.assertEqual(pesapal.submit_order.call_args.kwargs['amount'], 1300.0)
+        cart = Cart.objects.get()
+        self.assertEqual((cart.item_count, cart.subtotal, cart.items.count()), (0, 0, 0))
+
+    def test_cart_checkout_charges_current_prices(self, pesapal):
+        pesapal.submit_order.return_value = PESAPAL_OK
+        self.add(self.shirt, 2)
+        # The sale ends without going through Product.save (no cart repricing)
+        Product.objects.filter(pk=self.shirt.pk).update(price=650)
+        payload = {**checkout_payload(self.shirt), 'shipping_city': 'Nakuru'}
+        del payload['items']
+
+        response = self.client.post('/api/orders/create/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['items'][0]['price'], '650.00')
+        self.assertEqual(response.data['total_amount'], '1600.00')
+
+    def test_quantity_can_be_lowered_below_a_dropped_stock(self, pesapal):
+        self.add(self.shirt, 3)
+        Product.objects.filter(pk=self.shirt.pk).update(stock=1)
+        response = self.client.put(f'/api/cart/items/{self.shirt.pk}/', {'quantity': 2}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['item_count'], 2)
+        response = self.client.put(f'/api/cart/items/{self.shirt.pk}/', {'quantity': 3}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_item_checkout_ignores_client_prices(self, pesapal):
+        pesapal.submit_order.return_value = PESAPAL_OK
+        payload = checkout_payload(self.jeans)
+        payload['items'][0]['price'] = '1'
+        payload.update(total_amount='1', shipping_city='Nakuru')
+        response = self.client.post('/api/orders/create/', payload, format='json')
+        self.assertEqual(response.data['total_amount'], '1500.00')
+        self.assertEqual(response.data['items'][0]['price'], '1200.00')
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Parallel checkouts for a one-off item: exactly one may win"""
+
+    CHECKOUTS = 12
+
+    def test_single_stock_item_is_never_oversold(self):
+        product = make_product(1, stock=1)
+        users = [User.objects.create_user(f'shopper{i}') for i in range(self.CHECKOUTS)]
+        barrier = threading.Barrier(self.CHECKOUTS)
+        results = []
+
+        def checkout(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            barrier.wait()
+            try:
+                response = client.post('/api/orders/create/', checkout_payload(product), format='json')
+                results.append(response.status_code)
+            finally:
+                connection.close()
+
+        with mock.patch('shop.views.pesapal_client') as pesapal:
+            pesapal.submit_order.return_value = PESAPAL_OK
+            threads = [threading.Thread(target=checkout, args=(user,)) for user in users]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(results.count(201), 1)
+        self.assertEqual(len(results), self.CHECKOUTS)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(StockReservation.objects.filter(status=StockReservation.HELD).count(), 1)
+
+
+PESAPAL_PAID = {'payment_status_description': 'Completed', 'payment_method': 'M-Pesa', 'status_code': 1}
+
+
+@mock.patch('shop.views.pesapal_client')
+class PaymentNotificationTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('shopper', 'shopper@example.com')
+        self.client.force_authenticate(self.user)
+        self.product = make_product(1, stock=3)
+
+    def place_order(self, pesapal):
+        pesapal.submit_order.return_value = PESAPAL_OK
+        return self.client.post('/api/orders/create/', checkout_payload(self.product, 2), format='json').data['id']
+
+    def ipn(self):
+        return self.client.get('/api/pesapal/callback/', {
+            'OrderTrackingId': 'track', 'OrderNotificationType': 'IPNCHANGE'
+        })
+
+    def test_duplicate_ipns_cost_one_lookup_and_one_stock_update(self, pesapal):
+        order_id = self.place_order(pesapal)
+        pesapal.get_transaction_status.return_value = PESAPAL_PAID
+
+        responses = [self.ipn() for _ in range(5)]
+
+        self.assertTrue(all(r.status_code == 200 for r in responses))
+        self.assertEqual(responses[-1].data['orderTrackingId'], 'track')
+        self.assertEqual(pesapal.get_transaction_status.call_count, 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+        self.assertEqual(Order.objects.get(pk=order_id).payment_status, 'completed')
+        self.assertEqual(DailySalesRollup.objects.get().units_sold, 2)
+
+        notification = PaymentNotification.objects.get()
+        self.assertEqual(notification.times_received, 5)
+        self.assertEqual(notification.status, PaymentNotification.PROCESSED)
+
+    def test_pending_status_is_looked_up_again_on_retry(self, pesapal):
+        order_id = self.place_order(pesapal)
+        pesapal.get_transaction_status.return_value = {'payment_status_description': 'Pending', 'status_code': 0}
+        self.ipn()
+        self.assertEqual(PaymentNotification.objects.get().status, PaymentNotification.RECEIVED)
+
+        pesapal.get_transaction_status.return_value = PESAPAL_PAID
+        self.ipn()
+        self.assertEqual(pesapal.get_transaction_status.call_count, 2)
+        self.assertEqual(Order.objects.get(pk=order_id).payment_status, 'completed')
+
+    def test_failed_payment_retried_on_the_same_order_completes(self, pesapal):
+        order_id = self.place_order(pesapal)
+        pesapal.get_transaction_status.return_value = {'payment_status_description': 'Failed', 'status_code': 2}
+        self.ipn()
+        order = Order.objects.get(pk=order_id)
+        self.assertEqual((order.payment_status, order.status), ('failed', 'cancelled'))
+        self.assertEqual(PaymentNotification.objects.get().status, PaymentNotification.RECEIVED)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+
+        # The customer pays on the same Pesapal order; the next IPN applies it
+        pesapal.get_transaction_status.return_value = PESAPAL_PAID
+        self.ipn()
+        order.refresh_from_db()
+        self.assertEqual((order.payment_status, order.status), ('completed', 'processing'))
+        self.assertEqual(PaymentNotification.objects.get().status, PaymentNotification.PROCESSED)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+
+    def test_verify_payment_asks_pesapal_about_failed_orders(self, pesapal):
+        order_id = self.place_order(pesapal)
+        Order.objects.filter(pk=order_id).update(payment_status='failed', status='cancelled')
+        pesapal.get_transaction_status.return_value = PESAPAL_PAID
+        response = self.client.get(f'/api/orders/{order_id}/verify-payment/')
+        self.assertFalse(response.data['cached'])
+        self.assertEqual(response.data['order']['payment_status'], 'completed')
+
+    def test_verify_payment_after_ipn_does_not_commit_again(self, pesapal):
+        order_id = self.place_order(pesapal)
+        pesapal.get_transaction_status.return_value = PESAPAL_PAID
+        self.ipn()
+        self.client.get(f'/api/orders/{order_id}/verify-payment/')
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+        self.assertEqual(DailySalesRollup.objects.get().order_count, 1)
+
+
+@mock.patch('shop.payments.pesapal_client')
+class PaymentReconciliationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', 'shopper@example.com')
+        self.statuses = {
+            'track-paid': PESAPAL_PAID,
+            'track-pending': {'payment_status_description': 'INVALID', 'status_code': 0},
+        }
+        self.paid = make_order(self.user, [make_product(1)], pesapal_order_tracking_id='track-paid')
+        self.pending = make_order(self.user, [make_product(2)], pesapal_order_tracking_id='track-pending')
+        make_order(self.user, [make_product(3)])  # payment never initiated
+
+    def lookup(self, tracking_id):
+        return self.statuses[tracking_id]
+
+    def test_reconcile_settles_paid_orders_and_backs_off_pending(self, pesapal):
+        pesapal.get_transaction_status.side_effect = self.lookup
+
+        self.assertEqual(reconcile_payments(), (2, 1, 0))
+        self.paid.refresh_from_db()
+        self.assertEqual((self.paid.payment_status, self.paid.status), ('completed', 'processing'))
+
+        # INVALID before the hold expired: still pending, checked again later
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.payment_status, 'pending')
+        self.assertEqual(self.pending.payment_check_attempts, 1)
+        self.assertGreater(self.pending.next_payment_check_at, timezone.now())
+
+        self.assertEqual(reconcile_payments(), (0, 0, 0))
+        self.assertEqual(pesapal.get_transaction_status.call_count, 2)
+
+    def test_reconcile_picks_up_failed_orders_paid_later(self, pesapal):
+        Order.objects.filter(pk=self.paid.pk).update(payment_status='failed', status='cancelled')
+        pesapal.get_transaction_status.side_effect = self.lookup
+
+        self.assertEqual(reconcile_payments(), (2, 1, 0))
+        self.paid.refresh_from_db()
+        self.assertEqual((self.paid.payment_status, self.paid.status), ('completed', 'processing'))
+
+    def test_lookup_errors_back_off(self, pesapal):
+        pesapal.get_transaction_status.side_effect = RuntimeError('timeout')
+        self.assertEqual(reconcile_payments(), (0, 0, 2))
+        self.assertEqual(reconcile_payments(), (0, 0, 0))
+
+    def test_verify_payment_serves_fresh_status_from_db(self, pesapal):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        Order.objects.filter(pk=self.pending.pk).update(payment_checked_at=timezone.now())
+
+        with mock.patch('shop.views.pesapal_client') as live_pesapal:
+            response = client.get(f'/api/orders/{self.pending.pk}/verify-payment/')
+            self.assertTrue(response.data['cached'])
+            self.assertFalse(live_pesapal.get_transaction_status.called)
+
+            Order.objects.filter(pk=self.pending.pk).update(
+                payment_checked_at=timezone.now() - timedelta(minutes=5)
+            )
+            live_pesapal.get_transaction_status.return_value = PESAPAL_PAID
+            response = client.get(f'/api/orders/{self.pending.pk}/verify-payment/')
+            self.assertFalse(response.data['cached'])
+            self.assertEqual(response.data['order']['payment_status'], 'completed')
+
+
+class ConcurrentPaymentNotificationTests(TransactionTestCase):
+    """An IPN storm from real threads; Pesapal is patched inside the test so the threads share one mock"""
+
+    CALLBACKS = 8
+
+    def test_ipn_storm_is_processed_once(self):
+        product = make_product(1, stock=1)
+        user = User.objects.create_user('shopper')
+        client = APIClient()
+        client.force_authenticate(user)
+        barrier = threading.Barrier(self.CALLBACKS)
+        results = []
+
+        def callback():
+            barrier.wait()
+            try:
+                response = APIClient().get('/api/pesapal/callback/', {'OrderTrackingId': 'track'})
+                results.append(response.status_code)
+            finally:
+                connection.close()
+
+        with mock.patch('shop.views.pesapal_client') as pesapal:
+            pesapal.submit_order.return_value = PESAPAL_OK
+            pesapal.get_transaction_status.return_value = PESAPAL_PAID
+            self.assertEqual(client.post('/api/orders/create/', checkout_payload(product), format='json').status_code, 201)
+
+            threads = [threading.Thread(target=callback) for _ in range(self.CALLBACKS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(results, [200] * self.CALLBACKS)
+        self.assertEqual(pesapal.get_transaction_status.call_count, 1)
+        self.assertEqual(PaymentNotification.objects.get().times_received, self.CALLBACKS)
+        self.assertEqual(Order.objects.get().payment_status, 'completed')
+        self.assertEqual(DailySalesRollup.objects.get().units_sold, 1)
+
+
+@mock.patch('shop.views.pesapal_client')
+class EmailOutboxTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user('shopper', 'shopper@example.com')
+        self.client.force_authenticate(self.user)
+        self.product = make_product(1, stock=1)
+
+    def test_checkout_queues_confirmation_instead_of_sending(self, pesapal):
+        pesapal.submit_order.return_value = PESAPAL_OK
+        response = self.client.post('/api/orders/create/', checkout_payload(self.product), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.PENDING)
+
+        self.assertEqual(deliver_batch(), (1, 0, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['shopper@example.com'])
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.SENT)
+
+    def test_failed_delivery_is_retried_with_backoff(self, pesapal):
+        order = make_order(self.user, [self.product])
+        email = queue_order_confirmation_email(order)
+
+        with mock.patch('shop.outbox.EmailMultiAlternatives.send', side_effect=OSError('SMTP down')):
+            self.assertEqual(deliver_batch(), (0, 1, 0))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.PENDING, 1))
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertIn('SMTP down', email.last_error)
+
+        # Not due yet
+        self.assertEqual(deliver_batch(), (0, 0, 0))
+
+
+def fake_response(status_code=200, data=None):
+    response = mock.Mock(status_code=status_code, text=str(data))
+    response.json.return_value = data or {}
+    return response
+
+
+class PesapalTokenCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        expiry = (timezone.now() + timedelta(minutes=5)).isoformat()
+        self.token_response = fake_response(data={'token': 'tok-1', 'expiryDate': expiry, 'error': None})
+        self.token_calls = []
+        self.api_responses = []
+        self.api_calls = []
+
+        # One fake pooled session shared by every client instance
+        self.session = mock.Mock()
+        self.session.request.side_effect = self.route
+        patcher = mock.patch('shop.pesapal.build_session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.api = PesapalAPI()
+
+    def route(self, method, url, **kwargs):
+        if url.endswith('/RequestToken'):
+            self.token_calls.append(kwargs)
+            return self.token_response
+        self.api_calls.append(kwargs)
+        return self.api_responses.pop(0) if self.api_responses else fake_response(data={'status': '200'})
+
+    def test_token_is_reused_until_expiry(self):
+        self.api.get_transaction_status('track-1')
+        PesapalAPI().get_transaction_status('track-2')  # another client instance shares the cache
+
+        self.assertEqual(len(self.token_calls), 1)
+        self.assertEqual(len(self.api_calls), 2)
+
+    def test_token_refreshed_when_near_expiry(self):
+        soon = (timezone.now() + timedelta(seconds=30)).isoformat()
+        self.token_response = fake_response(data={'token': 'tok-1', 'expiryDate': soon, 'error': None})
+        self.api.get_access_token()
+        self.api.get_access_token()
+        self.assertEqual(len(self.token_calls), 2)
+
+    def test_401_refreshes_token_and_retries_once(self):
+        self.api_responses = [fake_response(401), fake_response(data={'status': '200'})]
+
+        self.assertEqual(self.api.get_transaction_status('track-1'), {'status': '200'})
+        self.assertEqual(len(self.token_calls), 2)
+
+    def test_calls_use_timeouts_and_record_latency(self):
+        self.api.get_transaction_status('track-1')
+
+        for kwargs in self.token_calls + self.api_calls:
+            self.assertEqual(kwargs['timeout'], (settings.PESAPAL_CONNECT_TIMEOUT, settings.PESAPAL_READ_TIMEOUT))
+        timers = metrics.snapshot()['timers']
+        self.assertEqual(timers['pesapal.RequestToken']['count'], 1)
+        self.assertEqual(timers['pesapal.GetTransactionStatus']['count'], 1)
+        self.assertEqual(timers['pesapal.SubmitOrderRequest']['count'], 0)
+
+    def test_a_timing_is_one_cache_write(self):
+        with mock.patch.object(metrics, '_incr') as incr:
+            metrics.record_timing('pesapal.GetTransactionStatus', 300, ok=False)
+        incr.assert_called_once()
+        metrics.record_timing('pesapal.GetTransactionStatus', 300, ok=False)
+        metrics.record_timing('pesapal.GetTransactionStatus', 40)
+        timer = metrics.snapshot()['timers']['pesapal.GetTransactionStatus']
+        self.assertEqual((timer['count'], timer['errors']), (2, 1))
+        self.assertEqual((timer['histogram_ms']['100'], timer['histogram_ms']['500']), (1, 1))
+
+    def test_session_retries_only_idempotent_requests(self):
+        retry = build_session().get_adapter('https://pay.pesapal.com').max_retries
+        self.assertTrue(retry.is_retry('GET', 503))
+        self.assertFalse(retry.is_retry('POST', 503))
+
+
+class SessionStorageTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def make_sessions(self, prefix, count, expire_date):
+        Session.objects.bulk_create([
+            Session(session_key=f'{prefix}-{i}', session_data='', expire_date=expire_date)
+            for i in range(count)
+        ])
+
+    def test_purge_removes_only_expired_rows_in_batches(self):
+        self.make_sessions('expired', 25, timezone.now() - timedelta(days=1))
+        self.make_sessions('live', 3, timezone.now() + timedelta(days=1))
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(purge_expired_sessions(batch_size=10), 25)
+        self.assertEqual(Session.objects.count(), 3)
+        # 25 rows in batches of 10
+        self.assertEqual(len([q for q in ctx.captured_queries if q['sql'].startswith('DELETE')]), 3)
+
+        out = io.StringIO()
+        call_command('purge_sessions', stdout=out)
+        self.assertEqual(out.getvalue(), '')
+
+    def test_cached_db_reads_skip_the_database(self):
+        result = benchmark_engine('cached_db', requests=5)
+        db = benchmark_engine('db', requests=5)
+        # Every request still writes through; only db reads the row back as well
+        self.assertLess(result['queries_per_request'], db['queries_per_request'])
+        self.assertEqual(benchmark_engine('cache', requests=5)['queries_per_request'], 0)
+        self.assertFalse(Session.objects.exists())
+
+    def test_benchmark_command_reports_each_engine(self):
+        out = io.StringIO()
+        call_command('benchmark_sessions', 'db', 'signed_cookies', '--requests', '3', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines[2:]], ['db', 'signed_cookies'])
+
+
+@override_settings(AUTH_TOKEN_CACHE_TTL=300)
+class TokenAuthCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.user = User.objects.create_user('shopper', 'shopper@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_repeat_requests_authenticate_from_cache(self):
+        self.assertEqual(self.client.get('/api/auth/user/').status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/auth/user/')
+        self.assertEqual(response.data['username'], 'shopper')
+        counters = metrics.snapshot()['counters']
+        self.assertEqual((counters['cache.auth.hit'], counters['cache.auth.miss']), (1, 1))
+        self.assertFalse(any(self.token.key in str(key) for key in cache._cache))
+
+    def test_logout_revokes_the_cached_token(self):
+        self.client.get('/api/auth/user/')
+        self.assertEqual(self.client.post('/api/auth/logout/').status_code, 200)
+        self.assertEqual(self.client.get('/api/auth/user/').status_code, 401)
+
+    def test_user_changes_apply_immediately(self):
+        self.client.get('/api/auth/user/')
+        self.user.is_staff = True
+        self.user.save()
+        self.assertTrue(self.client.get('/api/auth/user/').data['is_staff'])
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/user/').status_code, 401)
+
+    def test_unknown_token_is_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token not-a-real-token')
+        self.assertEqual(self.client.get('/api/auth/user/').status_code, 401)
+
+    @override_settings(AUTH_TOKEN_CACHE_TTL=0)
+    def test_without_a_ttl_a_token_deleted_elsewhere_is_rejected_next_request(self):
+        self.assertEqual(self.client.get('/api/auth/user/').status_code, 200)
+        # Another worker logs the token out; its cache invalidation never reaches this one
+        with mock.patch('shop.signals.forget_tokens'):
+            self.token.delete()
+        self.assertEqual(self.client.get('/api/auth/user/').status_code, 401)
+        self.assertEqual(metrics.snapshot()['counters']['cache.auth.miss'], 0)
+        self.assertFalse(any(key.startswith(':1:shop:auth:') for key in cache._cache))
+
+
+@override_settings(PESAPAL_IPN_ID='ipn-1')
+class AsyncCheckoutTests(TestCase):
+    """create_order_async / PesapalAPI.asubmit_order against a mocked Pesapal"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('shopper', 'shopper@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.product = make_product(1, stock=2)
+        self.order_response = PESAPAL_OK
+        self.requests = []
+        patcher = mock.patch('shop.pesapal.build_async_client', side_effect=self.build_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def build_client(self):
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+
+    async def handle(self, request):
+        self.requests.append(request)
+        if request.url.path.endswith('/RequestToken'):
+            expiry = (timezone.now() + timedelta(minutes=5)).isoformat()
+            return httpx.Response(200, json={'token': 'tok-1', 'expiryDate': expiry, 'error': None})
+        await asyncio.sleep(0.2)  # a slow provider
+        return httpx.Response(200, json=self.order_response)
+
+    def checkout(self, quantity=1, **headers):
+        headers.setdefault('HTTP_AUTHORIZATION', f'Token {self.token.key}')
+        return self.client.post(
+            '/api/orders/create-async/', checkout_payload(self.product, quantity),
+            content_type='application/json', **headers
+        )
+
+    def test_async_checkout_holds_stock_and_returns_payment_url(self):
+        response = self.checkout(2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['payment_url'], 'https://pay.example/')
+
+        order = Order.objects.get()
+        self.assertEqual(order.pesapal_order_tracking_id, 'track')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(self.requests[-1].headers['Authorization'], 'Bearer tok-1')
+
+    def test_async_checkout_requires_token(self):
+        self.assertEqual(self.checkout(HTTP_AUTHORIZATION='').status_code, 401)
+        self.assertFalse(Order.objects.exists())
+
+    def test_rejected_submission_releases_hold(self):
+        self.order_response = {'status': '500'}
+        self.assertEqual(self.checkout(2).status_code, 400)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+        self.assertFalse(Order.objects.exists())
+
+    def test_submissions_are_multiplexed_on_one_loop(self):
+        async def submit_many(count):
+            return await asyncio.gather(*(
+                pesapal_client.asubmit_order(
+                    f'KT-{i}', 100, 'Order', 'https://shop.example/cb',
+                    'a@example.com', '0700000000', 'A Shopper'
+                )
+                for i in range(count)
+            ))
+
+        started = time.perf_counter()
+        results = asyncio.run(submit_many(10))
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(len(results), 10)
+        self.assertLess(elapsed, 1.0)  # 10 x 0.2s in flight together, not back to back
+        token_requests = [r for r in self.requests if r.url.path.endswith('/RequestToken')]
+        self.assertEqual(len(token_requests), 1)
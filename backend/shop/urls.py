@@ -3,14 +3,20 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     ProductViewSet, OrderViewSet, register, login, logout, get_user,
     google_login, google_callback_redirect,test_cloudinary,
+    # Cart views
+    cart_detail, cart_add_items, cart_item,
     # Order views
-    get_delivery_zones, create_order, user_orders,
+    get_delivery_zones, create_order, create_order_async, user_orders,
     # Pesapal views
     pesapal_callback, verify_payment,
     # Admin views
     check_admin, admin_dashboard_stats, admin_all_products,
-    admin_update_product, admin_delete_product, admin_create_product,
-    admin_all_orders, admin_update_order_status
+    admin_update_product, admin_delete_product, admin_create_product, admin_product_media_status,
+    admin_sign_uploads, admin_local_upload, admin_finalize_product_media,
+    admin_import_products, admin_export_products, admin_export_orders,
+    admin_bulk_update_products, admin_bulk_order_status,
+    admin_all_orders, admin_update_order_status, admin_sales_report,
+    admin_metrics
 )
 
 router = DefaultRouter()
@@ -30,8 +36,14 @@ urlpatterns = [
     # Delivery zones (BEFORE router)
     path('delivery-zones/', get_delivery_zones, name='delivery_zones'),
     
+    # Server-side cart (BEFORE router)
+    path('cart/', cart_detail, name='cart_detail'),
+    path('cart/items/', cart_add_items, name='cart_add_items'),
+    path('cart/items/<int:product_id>/', cart_item, name='cart_item'),
+    
     # Order management (BEFORE router) - IMPORTANT!
     path('orders/create/', create_order, name='create_order'),
+    path('orders/create-async/', create_order_async, name='create_order_async'),
     path('orders/<int:order_id>/verify-payment/', verify_payment, name='verify_payment'),
     path('orders/user/', user_orders, name='user-orders'),
     # Pesapal payment endpoints (BEFORE router)
@@ -42,10 +54,21 @@ urlpatterns = [
     path('admin/stats/', admin_dashboard_stats, name='admin_stats'),
     path('admin/products/', admin_all_products, name='admin_all_products'),
     path('admin/products/create/', admin_create_product, name='admin_create_product'),
+    path('admin/products/bulk-update/', admin_bulk_update_products, name='admin_bulk_update_products'),
+    path('admin/products/import/', admin_import_products, name='admin_import_products'),
+    path('admin/products/export/', admin_export_products, name='admin_export_products'),
     path('admin/products/<int:pk>/update/', admin_update_product, name='admin_update_product'),
     path('admin/products/<int:pk>/delete/', admin_delete_product, name='admin_delete_product'),
+    path('admin/products/<int:pk>/media/', admin_product_media_status, name='admin_product_media_status'),
+    path('admin/products/<int:pk>/media/finalize/', admin_finalize_product_media, name='admin_finalize_product_media'),
+    path('admin/uploads/sign/', admin_sign_uploads, name='admin_sign_uploads'),
+    path('admin/uploads/local/', admin_local_upload, name='admin_local_upload'),
     path('admin/orders/', admin_all_orders, name='admin_all_orders'),
+    path('admin/orders/bulk-status/', admin_bulk_order_status, name='admin_bulk_order_status'),
+    path('admin/orders/export/', admin_export_orders, name='admin_export_orders'),
     path('admin/orders/<int:pk>/status/', admin_update_order_status, name='admin_update_order_status'),
+    path('admin/sales/', admin_sales_report, name='admin_sales_report'),
+    path('admin/metrics/', admin_metrics, name='admin_metrics'),
     
     # Router endpoints (LAST!) - These catch everything else
     path('', include(router.urls)),
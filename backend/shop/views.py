@@ -1,21 +1,30 @@
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
 from decouple import config
 from .pesapal import pesapal_client
+from . import metrics
 from django.conf import settings
 from allauth.socialaccount.models import SocialToken
 from django.shortcuts import redirect 
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
+from django.db.models import Count, Max, Q, Sum
+from decimal import Decimal, InvalidOperation
 import cloudinary.uploader
+import csv
+import json
 
 def test_cloudinary(request):
     """Test endpoint to verify Cloudinary upload"""
@@ -40,15 +49,42 @@ def test_cloudinary(request):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
-from .models import Product, Order, OrderItem, ProductImage, ProductVideo, DeliveryZone
+from .models import Product, Order, DailySalesRollup, Cart
 from .serializers import (
     ProductSerializer, RegisterSerializer, UserSerializer,
-    OrderSerializer, OrderCreateSerializer
+    OrderSerializer, OrderCreateSerializer, CartItemSerializer
+)
+from .pagination import ProductCursorPagination, OrderPagination
+from .authentication import CachedTokenAuthentication
+from .stats import get_dashboard_stats
+from .search import filter_products, search_products
+from .catalog_cache import get_or_build, product_list_key, product_detail_key
+from .delivery_zones import registry as delivery_zone_registry
+from .media_uploads import stage_product_media, media_progress
+from .bulk_ops import BulkOperationError, bulk_update_products, bulk_update_order_status
+from .bulk_io import format_for, import_products, text_stream, export_products, export_orders, streaming_export
+from .direct_uploads import DirectUploadError, grant_uploads, store_local_upload, finalize_uploads
+from .conditional import (
+    collection_validators, object_validators, conditional_response,
+    PRODUCT_LIST_CACHE, PRODUCT_DETAIL_CACHE, ORDER_DETAIL_CACHE, DELIVERY_ZONES_CACHE
+)
+from .rollups import record_order_completed, record_order_cancelled
+from .inventory import release_reservations, restock_order
+from .cart import (
+    CartError, add_items, set_quantity, remove_item, set_shipping_city,
+    clear_cart, cart_totals, cart_lines
+)
+from .checkout import (
+    CheckoutError, place_order, payment_request,
+    apply_payment_response, abandon_order
+)
+from .payments import (
+    apply_transaction_status, status_is_fresh, record_notification,
+    claim_notification, finish_notification
 )
 from .emails import (
-    send_welcome_email,
-    send_order_confirmation_email,
-    send_order_status_email
+    queue_welcome_email,
+    queue_order_status_email
 )
 def google_callback_redirect(request):
     """
@@ -68,22 +104,166 @@ def google_callback_redirect(request):
         frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:5173')
         return redirect(f'{frontend_url}/login')
     
+def _query_param_list(request, name):
+    """Read a multi-value filter given as ?size=s&size=m or ?size=s,m"""
+    values = []
+    for raw in request.query_params.getlist(name):
+        values.extend(v.strip() for v in raw.split(',') if v.strip())
+    return values
+
+
+def _price_param(raw):
+    """A finite decimal price filter; NaN / Infinity parse but can't be compared"""
+    try:
+        value = Decimal(raw)
+    except InvalidOperation:
+        value = None
+    if value is None or not value.is_finite():
+        raise ValidationError({'price': 'min_price and max_price must be numbers'})
+    return value
+
+
 class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.filter(is_active=True)
+    """
+    Public catalog.
+
+    GET /api/products/ is cursor-paginated and filtered in the database:
+        ?q=          full-text match on name / description / category
+        ?category=   exact category
+        ?size=       one or more sizes (comma separated or repeated)
+        ?condition=  one or more conditions (comma separated or repeated)
+        ?min_price= / ?max_price=
+        ?sort=       newest | price-low | price-high | name
+        ?page_size=  items per page (max 100)
+
+    GET /api/products/search/?q= returns the best matches, ranked.
+    """
+    queryset = Product.objects.filter(is_active=True).with_media()
     serializer_class = ProductSerializer
+    pagination_class = ProductCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+
+        params = self.request.query_params
+
+        query = params.get('q', '').strip()
+        if query:
+            queryset = filter_products(queryset, query)
+
+        category = params.get('category')
+        if category and category != 'all':
+            queryset = queryset.filter(category=category)
+
+        sizes = _query_param_list(self.request, 'size')
+        if sizes:
+            queryset = queryset.filter(size__in=sizes)
+
+        conditions = _query_param_list(self.request, 'condition')
+        if conditions:
+            queryset = queryset.filter(condition__in=conditions)
+
+        for name, lookup in (('min_price', 'price__gte'), ('max_price', 'price__lte')):
+            if params.get(name):
+                queryset = queryset.filter(**{lookup: _price_param(params[name])})
+
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        # A returning client with a current copy gets a 304 from one aggregate
+        # query; otherwise the page payload is cached per URL, tied to that ETag
+        # (shop.catalog_cache)
+        etag, last_modified = collection_validators(request, self.filter_queryset(self.get_queryset()))
+
+        def build():
+            return Response(get_or_build(
+                product_list_key(request), etag,
+                lambda: super(ProductViewSet, self).list(request, *args, **kwargs).data
+            ))
+        return conditional_response(request, etag, last_modified, PRODUCT_LIST_CACHE, build)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_field)
+        if not str(pk).isdigit():
+            return super().retrieve(request, *args, **kwargs)
+        updated_at = self.get_queryset().filter(pk=pk).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            return super().retrieve(request, *args, **kwargs)  # 404
+        etag, last_modified = object_validators(f'product:{pk}', updated_at)
+
+        def build():
+            return Response(get_or_build(
+                product_detail_key(pk), etag,
+                lambda: super(ProductViewSet, self).retrieve(request, *args, **kwargs).data
+            ))
+        return conditional_response(request, etag, last_modified, PRODUCT_DETAIL_CACHE, build)
+
+    @action(detail=False, methods=['get'])
+    def categories(self, request):
+        """Distinct categories of active products (for the filter dropdown)"""
+        categories = (
+            Product.objects.filter(is_active=True)
+            .order_by('category')
+            .values_list('category', flat=True)
+            .distinct()
+        )
+        return Response([c for c in categories if c])
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Ranked full-text search: ?q= (required), ?category=, ?limit= (default 24, max 100)"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 24)), 1), 100)
+        except ValueError:
+            return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.get_queryset()
+        category = request.query_params.get('category')
+        if category and category != 'all':
+            queryset = queryset.filter(category=category)
+
+        results = search_products(queryset, query, limit=limit)
+        return Response({
+            'query': query,
+            'count': len(results),
+            'results': self.get_serializer(results, many=True).data,
+        })
 
 
 class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
-    
+    pagination_class = OrderPagination
+
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return Order.objects.filter(user=self.request.user).with_details()
     
     def get_serializer_class(self):
         if self.action == 'create':
             return OrderCreateSerializer
         return OrderSerializer
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_field)
+        if not str(pk).isdigit():
+            return super().retrieve(request, *args, **kwargs)
+        # Item product names/images are part of the payload, so their edits count too
+        stamps = self.get_queryset().filter(pk=pk).aggregate(
+            order_updated=Max('updated_at'), products_updated=Max('items__product__updated_at')
+        )
+        if stamps['order_updated'] is None:
+            return super().retrieve(request, *args, **kwargs)  # 404
+        last_modified = max(filter(None, stamps.values()))
+        etag, last_modified = object_validators(f'order:{pk}', last_modified)
+        return conditional_response(
+            request, etag, last_modified, ORDER_DETAIL_CACHE,
+            lambda: super(OrderViewSet, self).retrieve(request, *args, **kwargs)
+        )
     
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -102,10 +282,10 @@ def register(request):
         user = serializer.save()
         token, created = Token.objects.get_or_create(user=user)
         
-        # ✅ SEND WELCOME EMAIL
+        # ✅ QUEUE WELCOME EMAIL (delivered by send_queued_emails)
         try:
-            send_welcome_email(user)
-            print(f"✅ Welcome email sent to {user.email}")
+            queue_welcome_email(user)
+            print(f"✅ Welcome email queued for {user.email}")
         except Exception as e:
             print(f"❌ Email error: {e}")
         
@@ -229,29 +409,7 @@ def admin_dashboard_stats(request):
     if not (request.user.is_staff or request.user.is_superuser):
         return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
     
-    from django.utils import timezone
-    from datetime import timedelta
-    
-    today = timezone.now().date()
-    
-    # ✅ ONLY COUNT COMPLETED ORDERS (paid orders)
-    completed_orders = Order.objects.filter(payment_status='completed')
-    today_completed_orders = completed_orders.filter(created_at__date=today)
-    
-    # Statistics
-    stats = {
-        'total_products': Product.objects.filter(is_active=True).count(),
-        'total_orders': Order.objects.count(),  # All orders
-        'completed_orders': completed_orders.count(),  # Paid orders only
-        'pending_orders': Order.objects.filter(status='pending').count(),
-        'today_orders': Order.objects.filter(created_at__date=today).count(),  # All today
-        'today_completed_orders': today_completed_orders.count(),  # Paid today
-        'today_revenue': sum(order.total_amount for order in today_completed_orders),  # ✅ Only paid
-        'low_stock_items': Product.objects.filter(stock__lte=2, is_active=True).count(),
-        'total_revenue': sum(order.total_amount for order in completed_orders),  # ✅ Only paid
-        'pending_payment_orders': Order.objects.filter(payment_status='pending').count(),  # NEW
-    }
-    
+    stats = get_dashboard_stats()
     return Response(stats)
 
 @api_view(['GET'])
@@ -261,10 +419,160 @@ def admin_all_products(request):
     if not (request.user.is_staff or request.user.is_superuser):
         return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
     
-    products = Product.objects.all().order_by('-created_at')
+    products = Product.objects.with_media().order_by('-created_at')
     serializer = ProductSerializer(products, many=True)
     return Response(serializer.data)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def admin_product_media_status(request, pk):
+    """Progress of a product's background media uploads"""
+    if not (request.user.is_staff or request.user.is_superuser):
+        return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        product = Product.objects.get(pk=pk)
+    except Product.DoesNotExist:
+        return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response(media_progress(product))
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def admin_bulk_update_products(request):
+    """
+    Update many products in one transaction, all or nothing.
+    {"updates": [{"id": 1, "price": "900"}, ...]} or {"ids": [...], "changes": {"is_active": false}}
+    """
+    if not (request.user.is_staff or request.user.is_superuser):
+        return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+    
+    updates = request.data.get('updates')
+    if updates is None:
+        ids, changes = request.data.get('ids'), request.data.get('changes')
+        if not isinstance(ids, list) or not isinstance(changes, dict):
+            return Response({'error': 'Send updates, or ids and changes'}, status=status.HTTP_400_BAD_REQUEST)
+        updates = [{**changes, 'id': pk} for pk in ids]
+    
+    try:
+        products = bulk_update_products(updates)
+    except BulkOperationError as e:
+        return Response(e.as_dict(), status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({'updated': len(products), 'ids': [product.pk for product in products]})
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def admin_import_products(request):
+    """Bulk create/update products from an uploaded CSV or JSONL file (file, format, dry_run)"""
+    if not (request.user.is_staff or request.user.is_superuser):
+        return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+    
+    uploaded = request.FILES.get('file')
+    if not uploaded:
+        return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        fmt = format_for(uploaded.name, request.data.get('format'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true')
+    try:
+        report = import_products(text_stream(uploaded), fmt, dry_run=dry_run)
+    except (UnicodeDecodeError, csv.Error) as e:
+        return Response({'error': f'Could not read file: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(report.as_dict())
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def admin_export_products(request):
+    """Stream the whole catalog as CSV or JSONL (?output=csv|jsonl)"""
+    if not (request.user.is_staff or request.user.is_superuser):
+        return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        fmt = format_for('', request.query_params.get('output', 'csv'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return streaming_export(request, export_products(fmt), fmt, 'products')
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def admin_export_orders(request):
+    """
+    Stream order items with their order details as CSV or JSONL.
+    ?output=csv|jsonl&status=...&start=YYYY-MM-DD&end=YYYY-MM-DD
+    """
+    if not (request.user.is_staff or request.user.is_superuser):
+        return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+    
+    from datetime import date
+    try:
+        fmt = format_for('', request.query_params.get('output', 'csv'))
+        start = date.fromisoformat(request.query_params['start']) if request.query_params.get('start') else None
+        end = date.fromisoformat(request.query_params['end']) if request.query_params.get('end') else None
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    chunks = export_orders(fmt, status=request.query_params.get('status'), start=start, end=end)
+    return streaming_export(request, chunks, fmt, 'orders')
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def admin_sign_uploads(request):
+    """Signed parameters to upload media straight to storage (kind, count)"""
+    if not (request.user.is_staff or request.user.is_superuser):
+        return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        count = int(request.data.get('count', 1))
+        grants = grant_uploads(request, request.data.get('kind'), count)
+    except (TypeError, ValueError) as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({'uploads': grants})
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def admin_local_upload(request):
+    """Local stand-in for the storage upload API (the signed upload_token is the credential)"""
+    if settings.MEDIA_DIRECT_UPLOAD_BACKEND != 'local':
+        return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+    if 'file' not in request.FILES:
+        return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        stored = store_local_upload(request.data.get('upload_token', ''), request.FILES['file'])
+    except DirectUploadError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(stored, status=status.HTTP_201_CREATED)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def admin_finalize_product_media(request, pk):
+    """Attach directly uploaded files to a product (uploads: [{upload_token, version, format}])"""
+    if not (request.user.is_staff or request.user.is_superuser):
+        return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        product = Product.objects.get(pk=pk)
+    except Product.DoesNotExist:
+        return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    uploads = request.data.get('uploads')
+    if not isinstance(uploads, list) or not all(isinstance(u, dict) for u in uploads):
+        return Response({'error': 'uploads must be a list of objects'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        finalize_uploads(product, uploads, replace_images=request.data.get('replace_images') in (True, 'true'))
+    except DirectUploadError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    product = Product.objects.with_media().get(pk=pk)
+    return Response(ProductSerializer(product).data)
+
 @api_view(['PUT', 'PATCH'])
 @permission_classes([IsAuthenticated])
 def admin_update_product(request, pk):
@@ -292,37 +600,16 @@ def admin_update_product(request, pk):
         if 'is_active' in request.data:
             product.is_active = request.data.get('is_active', 'true').lower() == 'true'
         
-        # Update image if provided
-        if 'image' in request.FILES:
-            product.image = request.FILES['image']
-        
         product.save()
         
-        # Handle additional images if provided
-        if 'additional_images' in request.FILES:
-            # Delete old additional images if replacing
-            if request.data.get('replace_images') == 'true':
-                product.additional_images.all().delete()
-            
-            additional_images = request.FILES.getlist('additional_images')
-            for index, image_file in enumerate(additional_images):
-                ProductImage.objects.create(
-                    product=product,
-                    image=image_file,
-                    order=index
-                )
+        # Delete old additional images if replacing
+        if 'additional_images' in request.FILES and request.data.get('replace_images') == 'true':
+            product.additional_images.all().delete()
         
-        # Handle video if provided
-        if 'video' in request.FILES:
-            # Delete old video if exists
-            if hasattr(product, 'video'):
-                product.video.delete()
-            
-            ProductVideo.objects.create(
-                product=product,
-                video=request.FILES['video'],
-                thumbnail=request.FILES.get('video_thumbnail')
-            )
+        # New image / additional images / video are uploaded in the background
+        # and swapped in as each lands (an old video stays until its
+        # replacement is ready)
+        stage_product_media(product, request.FILES)
         
         serializer = ProductSerializer(product)
         return Response(serializer.data)
@@ -363,27 +650,12 @@ def admin_create_product(request):
             condition=request.data.get('condition', 'good'),
             instagram_link=request.data.get('instagram_link', ''),
             tiktok_link=request.data.get('tiktok_link', ''),
-            image=request.FILES.get('image'),
             is_active=request.data.get('is_active', 'true').lower() == 'true'
         )
         
-        # Handle additional images
-        additional_images = request.FILES.getlist('additional_images')
-        for index, image_file in enumerate(additional_images):
-            ProductImage.objects.create(
-                product=product,
-                image=image_file,
-                order=index
-            )
-        
-        # Handle video
-        video_file = request.FILES.get('video')
-        if video_file:
-            ProductVideo.objects.create(
-                product=product,
-                video=video_file,
-                thumbnail=request.FILES.get('video_thumbnail')
-            )
+        # Image, additional images and video go to Cloudinary in the
+        # background (process_media_uploads); poll admin/products/<id>/media/
+        stage_product_media(product, request.FILES)
         
         serializer = ProductSerializer(product)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -391,6 +663,28 @@ def admin_create_product(request):
         print(f"Error creating product: {str(e)}")
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+
+def _filter_orders(request, orders):
+    status_filter = request.query_params.get('status')
+    if status_filter and status_filter != 'all':
+        orders = orders.filter(status=status_filter)
+    return orders
+
+
+def _order_page(request, orders, scope):
+    """
+    One page of orders plus `status_counts` over the whole scope (one
+    GROUP BY), so per-status totals don't depend on which pages the
+    client has loaded.
+    """
+    paginator = OrderPagination()
+    page = paginator.paginate_queryset(orders, request)
+    response = paginator.get_paginated_response(OrderSerializer(page, many=True).data)
+    counts = dict(scope.order_by().values_list('status').annotate(total=Count('id')))
+    response.data['status_counts'] = {key: counts.get(key, 0) for key, _ in Order.STATUS_CHOICES}
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def admin_all_orders(request):
@@ -398,9 +692,16 @@ def admin_all_orders(request):
     if not (request.user.is_staff or request.user.is_superuser):
         return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
     
-    orders = Order.objects.all().order_by('-created_at')
-    serializer = OrderSerializer(orders, many=True)
-    return Response(serializer.data)
+    orders = _filter_orders(request, Order.objects.with_details().order_by('-created_at'))
+
+    search = request.query_params.get('search', '').strip()
+    if search:
+        match = Q(user__username__icontains=search) | Q(shipping_address__icontains=search)
+        if search.isdigit():
+            match |= Q(pk=int(search))
+        orders = orders.filter(match)
+
+    return _order_page(request, orders, Order.objects.all())
 
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
@@ -420,170 +721,267 @@ def admin_update_order_status(request, pk):
         order.status = new_status
         order.save()
         
-        # ✅ SEND STATUS UPDATE EMAIL
+        # ✅ QUEUE STATUS UPDATE EMAIL
         if new_status != old_status:
             try:
-                send_order_status_email(order, old_status)
-                print(f"✅ Status email sent for Order #{order.id}: {old_status} → {new_status}")
+                queue_order_status_email(order, old_status)
+                print(f"✅ Status email queued for Order #{order.id}: {old_status} → {new_status}")
             except Exception as e:
                 print(f"❌ Email error: {e}")
         
         # Restore stock if cancelled
         if new_status == 'cancelled' and old_status != 'cancelled' and order.payment_status == 'completed':
-            for item in order.items.all():
-                product = item.product
-                product.stock += item.quantity
-                product.save()
-                print(f"✅ Restored stock for {product.name}: {item.quantity} units")
+            restock_order(order)
+            record_order_cancelled(order)
+        elif new_status == 'cancelled' and old_status != 'cancelled':
+            # Unpaid order: hand back whatever stock checkout is still holding
+            release_reservations(order)
+        elif old_status == 'cancelled' and new_status != 'cancelled' and order.payment_status == 'completed':
+            # Un-cancelling a paid order puts its sales back in the rollup
+            record_order_completed(order)
         
         serializer = OrderSerializer(order)
         return Response(serializer.data)
     
     return Response({'error': 'Invalid status'}, status=status.HTTP_400_BAD_REQUEST)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def admin_bulk_order_status(request):
+    """Set the status of many orders at once ({"ids": [...], "status": "shipped"})"""
+    if not (request.user.is_staff or request.user.is_superuser):
+        return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        orders, changed, emails = bulk_update_order_status(request.data.get('ids'), request.data.get('status'))
+    except BulkOperationError as e:
+        return Response(e.as_dict(), status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'status': request.data.get('status'),
+        'updated': changed,
+        'unchanged': len(orders) - changed,
+        'emails_queued': emails,
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def admin_sales_report(request):
+    """
+    Revenue analytics served from DailySalesRollup.
+
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD (default: last 30 days)
+    ?group_by=date,category,city,payment_method (any combination, default: date)
+    """
+    if not (request.user.is_staff or request.user.is_superuser):
+        return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+
+    from django.utils import timezone
+    from datetime import date, timedelta
+
+    try:
+        end = date.fromisoformat(request.query_params['end']) if request.query_params.get('end') else timezone.localdate()
+        start = date.fromisoformat(request.query_params['start']) if request.query_params.get('start') else end - timedelta(days=29)
+    except ValueError:
+        return Response({'error': 'start and end must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+
+    group_by = [g.strip() for g in request.query_params.get('group_by', 'date').split(',') if g.strip()]
+    allowed = {'date', 'category', 'city', 'payment_method'}
+    if not group_by or not set(group_by) <= allowed:
+        return Response(
+            {'error': f'group_by must be a comma separated subset of {sorted(allowed)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    rollup = DailySalesRollup.objects.filter(date__gte=start, date__lte=end)
+    totals = rollup.aggregate(order_count=Sum('order_count'), units_sold=Sum('units_sold'), revenue=Sum('revenue'))
+    rows = (
+        rollup.values(*group_by)
+        .annotate(order_count=Sum('order_count'), units_sold=Sum('units_sold'), revenue=Sum('revenue'))
+        .order_by(*group_by)
+    )
+
+    return Response({
+        'start': start,
+        'end': end,
+        'group_by': group_by,
+        'totals': {key: value or 0 for key, value in totals.items()},
+        'rows': list(rows),
+    })
+
 @api_view(['GET'])
 def get_delivery_zones(request):
-    """Get all active delivery zones"""
-    zones = DeliveryZone.objects.filter(is_active=True)
-    data = [
-        {
-            'city': zone.city,
-            'delivery_fee': str(zone.delivery_fee),
-            'estimated_days': zone.estimated_days
-        }
-        for zone in zones
-    ]
-    return Response(data)
+    """Get all active delivery zones (a JSON body built once per process until a zone changes)"""
+    zones = delivery_zone_registry()
+    return conditional_response(
+        request, zones.etag, None, DELIVERY_ZONES_CACHE,
+        lambda: HttpResponse(zones.body, content_type='application/json'),
+    )
+
+def _cart_response(user, city=None, status_code=status.HTTP_200_OK):
+    totals = cart_totals(user, city)
+    cart_id = totals.pop('cart_id')
+    items = cart_lines(cart_id) if cart_id else []
+    for key in ('subtotal', 'delivery_fee', 'total'):
+        totals[key] = str(totals[key])
+    return Response({**totals, 'items': CartItemSerializer(items, many=True).data}, status=status_code)
+
+
+@api_view(['GET', 'PUT', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def cart_detail(request):
+    """
+    GET: the cart and its totals (?city= quotes delivery to another city)
+    PUT: save the shipping city ({shipping_city}); DELETE: empty the cart
+    """
+    if request.method == 'PUT':
+        set_shipping_city(request.user, request.data.get('shipping_city', ''))
+    elif request.method == 'DELETE':
+        cart = Cart.objects.filter(user=request.user).first()
+        if cart:
+            clear_cart(cart.pk)
+    return _cart_response(request.user, request.query_params.get('city') if request.method == 'GET' else None)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def cart_add_items(request):
+    """Add {product_id, quantity} to the cart, or several at once ({items: [...]}, e.g. a guest cart after login)"""
+    entries = request.data.get('items')
+    if entries is None:
+        entries = [request.data]
+    if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+        return Response({'error': 'items must be a list of objects'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        add_items(request.user, [(entry.get('product_id'), entry.get('quantity', 1)) for entry in entries])
+    except CartError as e:
+        return Response(e.as_dict(), status=e.status_code)
+    return _cart_response(request.user, status_code=status.HTTP_201_CREATED)
+
+
+@api_view(['PUT', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def cart_item(request, product_id):
+    """Set a line's quantity ({quantity}, 0 removes it) or remove it"""
+    try:
+        if request.method == 'PUT':
+            set_quantity(request.user, product_id, request.data.get('quantity'))
+        else:
+            remove_item(request.user, product_id)
+    except CartError as e:
+        return Response(e.as_dict(), status=e.status_code)
+    return _cart_response(request.user)
+
+
+def _payment_callback_url(request):
+    # Get callback URL (where Pesapal redirects after payment)
+    frontend_url = request.build_absolute_uri('/').replace('/api/', '').rstrip('/')
+    return f"{frontend_url}/payment-callback"
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_order(request):
     """Create order and initiate Pesapal payment"""
     try:
-        items_data = request.data.get('items', [])
-        
-        if not items_data:
-            return Response({'error': 'No items in order'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Get delivery zone
-        city = request.data.get('shipping_city')
-        try:
-            delivery_zone = DeliveryZone.objects.get(city=city, is_active=True)
-            delivery_fee = delivery_zone.delivery_fee
-            estimated_days = delivery_zone.estimated_days
-        except DeliveryZone.DoesNotExist:
-            delivery_fee = 0
-            estimated_days = 3
-        
-        # Create order
-        order = Order.objects.create(
-            user=request.user,
-            total_amount=request.data.get('total_amount'),
-            shipping_address=request.data.get('shipping_address'),
-            shipping_city=city,
-            shipping_postal_code=request.data.get('shipping_postal_code', ''),
-            shipping_country=request.data.get('shipping_country'),
-            phone_number=request.data.get('phone_number'),
-            whatsapp_number=request.data.get('whatsapp_number', ''),
-            delivery_fee=delivery_fee,
-            estimated_delivery_days=estimated_days,
-            status='pending',
-            payment_status='pending'
-        )
-        
-        # Create order items - DON'T reduce stock yet!
-        for item in items_data:
-            product = Product.objects.get(id=item['product_id'])
-            
-            # Check stock availability
-            if product.stock < item['quantity']:
-                order.delete()
-                return Response(
-                    {'error': f'Insufficient stock for {product.name}'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Create order item (don't reduce stock yet)
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                quantity=item['quantity'],
-                price=item['price']
-            )
-        
-        # Create unique merchant reference
-        merchant_ref = f"KT-{order.id}-{int(order.created_at.timestamp())}"
-        order.pesapal_merchant_reference = merchant_ref
-        order.save()
-        
-        # ✅ SEND ORDER CONFIRMATION EMAIL (FIXED INDENTATION)
-        try:
-            send_order_confirmation_email(order)
-            print(f"✅ Order confirmation sent for Order #{order.id}")
-        except Exception as e:
-            print(f"❌ Email error: {e}")
-        
-        # Initiate Pesapal payment
-        try:
-            # Get callback URL (where Pesapal redirects after payment)
-            frontend_url = request.build_absolute_uri('/').replace('/api/', '').rstrip('/')
-            callback_url = f"{frontend_url}/payment-callback"
-            
-            # Format customer name
-            customer_name = f"{request.user.first_name} {request.user.last_name}".strip()
-            if not customer_name:
-                customer_name = request.user.username
-            
-            # Submit order to Pesapal
-            pesapal_response = pesapal_client.submit_order(
-                order_id=merchant_ref,
-                amount=float(order.total_amount),
-                description=f"Kadi Thrift Order #{order.id}",
-                callback_url=callback_url,
-                customer_email=request.user.email,
-                customer_phone=request.data.get('phone_number'),
-                customer_name=customer_name
-            )
-            
-            print("Pesapal response:", pesapal_response)
-            
-            # Check if order submission was successful
-            if pesapal_response.get('status') == '200':
-                order_tracking_id = pesapal_response.get('order_tracking_id')
-                redirect_url = pesapal_response.get('redirect_url')
-                
-                order.pesapal_order_tracking_id = order_tracking_id
-                order.save()
-                
-                serializer = OrderSerializer(order)
-                return Response({
-                    **serializer.data,
-                    'payment_url': redirect_url,
-                    'message': 'Order created successfully. Redirecting to payment...'
-                }, status=status.HTTP_201_CREATED)
-            else:
-                # Payment initiation failed
-                order.delete()  # Rollback
-                return Response({
-                    'error': 'Failed to initiate payment',
-                    'details': pesapal_response
-                }, status=status.HTTP_400_BAD_REQUEST)
-                
-        except Exception as payment_error:
-            print(f"Pesapal error: {str(payment_error)}")
-            import traceback
-            traceback.print_exc()
-            order.delete()  # Rollback
-            return Response({
-                'error': 'Payment initiation failed',
-                'details': str(payment_error)
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-    except Product.DoesNotExist:
-        return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+        order = place_order(request.user, request.data)
+    except CheckoutError as e:
+        return Response(e.as_dict(), status=e.status_code)
     except Exception as e:
         print(f"Error creating order: {str(e)}")
         import traceback
         traceback.print_exc()
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Initiate Pesapal payment
+    try:
+        pesapal_response = pesapal_client.submit_order(
+            **payment_request(order, request.user, request.data, _payment_callback_url(request))
+        )
+        redirect_url = apply_payment_response(order, pesapal_response)
+    except CheckoutError as e:
+        return Response(e.as_dict(), status=e.status_code)
+    except Exception as payment_error:
+        print(f"Pesapal error: {str(payment_error)}")
+        import traceback
+        traceback.print_exc()
+        abandon_order(order)
+        return Response({
+            'error': 'Payment initiation failed',
+            'details': str(payment_error)
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = OrderSerializer(order)
+    return Response({
+        **serializer.data,
+        'payment_url': redirect_url,
+        'message': 'Order created successfully. Redirecting to payment...'
+    }, status=status.HTTP_201_CREATED)
+
+
+async def _atoken_user(request):
+    """Resolve the DRF auth token on a plain (non-DRF) async view"""
+    try:
+        result = await sync_to_async(CachedTokenAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+@csrf_exempt
+async def create_order_async(request):
+    """
+    create_order for ASGI workers.
+
+    The ORM work runs in a thread, but the Pesapal submission is awaited
+    on the event loop: a slow provider no longer pins a worker thread per
+    checkout, so many payments can be in flight on one worker. Token auth
+    only (no session/CSRF), same request and response body as create_order.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+    user = await _atoken_user(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+
+    try:
+        order = await sync_to_async(place_order)(user, data)
+    except CheckoutError as e:
+        return JsonResponse(e.as_dict(), status=e.status_code)
+    except Exception as e:
+        print(f"Error creating order: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({'error': str(e)}, status=400)
+
+    try:
+        pesapal_response = await pesapal_client.asubmit_order(
+            **payment_request(order, user, data, _payment_callback_url(request))
+        )
+        redirect_url = await sync_to_async(apply_payment_response)(order, pesapal_response)
+    except CheckoutError as e:
+        return JsonResponse(e.as_dict(), status=e.status_code)
+    except Exception as payment_error:
+        print(f"Pesapal error: {str(payment_error)}")
+        import traceback
+        traceback.print_exc()
+        await sync_to_async(abandon_order)(order)
+        return JsonResponse({
+            'error': 'Payment initiation failed',
+            'details': str(payment_error)
+        }, status=400)
+
+    order_data = await sync_to_async(lambda: OrderSerializer(order).data)()
+    return JsonResponse({
+        **order_data,
+        'payment_url': redirect_url,
+        'message': 'Order created successfully. Redirecting to payment...'
+    }, status=201)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_order(request, pk):
@@ -604,9 +1002,9 @@ def get_order(request, pk):
 def user_orders(request):
     """Get all orders for the authenticated user"""
     try:
-        orders = Order.objects.filter(user=request.user).order_by('-created_at')
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        mine = Order.objects.filter(user=request.user)
+        orders = _filter_orders(request, mine.with_details().order_by('-created_at'))
+        return _order_page(request, orders, mine)
     except Exception as e:
         print(f"Error fetching user orders: {str(e)}")
         return Response(
@@ -616,74 +1014,58 @@ def user_orders(request):
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def pesapal_callback(request):
-    """Handle Pesapal payment callback (IPN)"""
+    """
+    Handle Pesapal payment callback (IPN)
+
+    Every notification is recorded in PaymentNotification. Only the first
+    of a burst of duplicates looks the status up and updates the order;
+    the others are acknowledged straight away.
+    """
+    order_tracking_id = request.GET.get('OrderTrackingId')
+    merchant_reference = request.GET.get('OrderMerchantReference')
+    notification_type = request.GET.get('OrderNotificationType', '')
+
+    print(f"Pesapal callback - Tracking ID: {order_tracking_id}, Ref: {merchant_reference}")
+
+    if not order_tracking_id:
+        return Response({'error': 'Missing order tracking ID'}, status=400)
+
+    # Acknowledgement body Pesapal expects back from an IPN
+    ack = {
+        'orderNotificationType': notification_type or 'IPNCHANGE',
+        'orderTrackingId': order_tracking_id,
+        'orderMerchantReference': merchant_reference,
+        'status': 200,
+    }
+
     try:
-        order_tracking_id = request.GET.get('OrderTrackingId')
-        merchant_reference = request.GET.get('OrderMerchantReference')
-        
-        print(f"Pesapal callback - Tracking ID: {order_tracking_id}, Ref: {merchant_reference}")
-        
-        if not order_tracking_id:
-            return Response({'error': 'Missing order tracking ID'}, status=400)
-        
-        # Get transaction status from Pesapal
+        notification = record_notification(order_tracking_id, merchant_reference, notification_type)
+        if not claim_notification(notification):
+            print(f"🔁 Duplicate IPN for {order_tracking_id}, already handled")
+            return Response(ack)
+
+        payment_status = None
         try:
+            # Find order
+            if merchant_reference:
+                order = Order.objects.get(pesapal_merchant_reference=merchant_reference)
+            else:
+                order = Order.objects.get(pesapal_order_tracking_id=order_tracking_id)
+
+            # Get transaction status from Pesapal
             status_response = pesapal_client.get_transaction_status(order_tracking_id)
             print("Transaction status:", status_response)
-            
-            # Find order
-            try:
-                if merchant_reference:
-                    order = Order.objects.get(pesapal_merchant_reference=merchant_reference)
-                else:
-                    order = Order.objects.get(pesapal_order_tracking_id=order_tracking_id)
-                
-                # Update order based on payment status
-                payment_status = status_response.get('payment_status_description', '').lower()
-                payment_method = status_response.get('payment_method', '')
-                
-                if payment_status == 'completed' or status_response.get('status_code') == 1:
-                    # ✅ PAYMENT SUCCESSFUL - NOW REDUCE STOCK!
-                    if order.payment_status != 'completed':  # Only reduce stock once
-                        for item in order.items.all():
-                            product = item.product
-                            
-                            # Check if stock is still available
-                            if product.stock >= item.quantity:
-                                product.stock -= item.quantity
-                                product.save()
-                                print(f"✅ Reduced stock for {product.name}: {item.quantity} units")
-                            else:
-                                print(f"⚠️ Warning: Insufficient stock for {product.name}")
-                    
-                    order.payment_status = 'completed'
-                    order.status = 'processing'
-                    order.payment_method = payment_method
-                    order.save()
-                    print(f"✅ Payment successful for Order #{order.id}")
-                    
-                elif payment_status in ['failed', 'invalid']:
-                    # ❌ PAYMENT FAILED - No stock reduction
-                    order.payment_status = 'failed'
-                    order.status = 'cancelled'
-                    order.save()
-                    print(f"❌ Payment failed for Order #{order.id}")
-                
-                return Response({
-                    'status': 'success',
-                    'message': 'Payment status updated',
-                    'order_id': order.id,
-                    'payment_status': order.payment_status
-                })
-                
-            except Order.DoesNotExist:
-                print(f"Order not found: {merchant_reference or order_tracking_id}")
-                return Response({'error': 'Order not found'}, status=404)
-                
-        except Exception as status_error:
-            print(f"Error getting transaction status: {str(status_error)}")
-            return Response({'error': str(status_error)}, status=400)
-        
+
+            order = apply_transaction_status(order.pk, status_response)
+            payment_status = order.payment_status
+        finally:
+            finish_notification(notification, payment_status)
+
+        return Response({**ack, 'order_id': order.id, 'payment_status': order.payment_status})
+
+    except Order.DoesNotExist:
+        print(f"Order not found: {merchant_reference or order_tracking_id}")
+        return Response({'error': 'Order not found'}, status=404)
     except Exception as e:
         print(f"Callback error: {str(e)}")
         import traceback
@@ -709,37 +1091,28 @@ def verify_payment(request, order_id):
                 'error': 'No payment initiated for this order'
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        # Settled, or looked up moments ago by the IPN / reconcile_payments:
+        # answer from the DB instead of calling Pesapal on every poll
+        if status_is_fresh(order):
+            serializer = OrderSerializer(order)
+            return Response({
+                'order': serializer.data,
+                'pesapal_status': None,
+                'cached': True
+            })
+
         # Get transaction status from Pesapal
         try:
             status_response = pesapal_client.get_transaction_status(order.pesapal_order_tracking_id)
-            
-            payment_status = status_response.get('payment_status_description', '').lower()
-            payment_method = status_response.get('payment_method', '')
-            
+
             # Update order if payment successful
-            if payment_status == 'completed' or status_response.get('status_code') == 1:
-                # ✅ PAYMENT SUCCESSFUL - NOW REDUCE STOCK!
-                if order.payment_status != 'completed':  # Only reduce stock once
-                    for item in order.items.all():
-                        product = item.product
-                        
-                        # Check if stock is still available
-                        if product.stock >= item.quantity:
-                            product.stock -= item.quantity
-                            product.save()
-                            print(f"✅ Reduced stock for {product.name}: {item.quantity} units")
-                        else:
-                            print(f"⚠️ Warning: Insufficient stock for {product.name}")
-                
-                order.payment_status = 'completed'
-                order.status = 'processing'
-                order.payment_method = payment_method
-                order.save()
-            
+            order = apply_transaction_status(order.pk, status_response, apply_failure=False)
+
             serializer = OrderSerializer(order)
             return Response({
                 'order': serializer.data,
-                'pesapal_status': status_response
+                'pesapal_status': status_response,
+                'cached': False
             })
             
         except Exception as e:
@@ -750,4 +1123,14 @@ def verify_payment(request, order_id):
         
     except Exception as e:
         print(f"Verification error: {str(e)}")
-        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def admin_metrics(request):
+    """Outbound call latency histograms and counters (see shop.metrics)"""
+    if not (request.user.is_staff or request.user.is_superuser):
+        return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+
+    return Response(metrics.snapshot())
@@ -1,12 +1,13 @@
 import { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
+import toast from 'react-hot-toast';
 import { useCart } from '../context/CartContext';
 import { useAuth } from '../context/AuthContext';
 import { createOrder, getDeliveryZones } from '../services/api';
 
 function Checkout() {
   const navigate = useNavigate();
-  const { cartItems, getCartTotal, clearCart } = useCart();
+  const { cartItems, serverCart, getCartTotal, setShippingCity } = useCart();
   const { user } = useAuth();
   
   const [loading, setLoading] = useState(false);
@@ -48,6 +49,8 @@ function Checkout() {
     if (name === 'shipping_city') {
       const zone = deliveryZones.find(z => z.city === value);
       setSelectedZone(zone || null);
+      // The backend prices delivery from the city saved on the cart
+      setShippingCity(value);
     }
   };
 
@@ -56,6 +59,9 @@ function Checkout() {
   };
 
   const getDeliveryFee = () => {
+    if (serverCart && formData.shipping_city) {
+      return parseFloat(serverCart.delivery_fee);
+    }
     return selectedZone ? parseFloat(selectedZone.delivery_fee) : 0;
   };
 
@@ -71,15 +77,9 @@ function Checkout() {
   const loadingToast = toast.loading('Creating your order... 📦');
 
     try {
-      const orderData = {
-        ...formData,
-        items: cartItems.map(item => ({
-          product_id: item.id,
-          quantity: item.quantity,
-          price: item.price
-        })),
-        total_amount: getTotalWithDelivery()
-      };
+      // No items or amounts: the order is placed from the server-side
+      // cart and priced there
+      const orderData = { ...formData };
 
       console.log('Submitting order:', orderData);
 
@@ -80,7 +80,7 @@ function OrderConfirmation() {
             <div key={item.id} className="flex items-center gap-4 p-3 border rounded">
               {item.product_image && (
                 <img
-                  src={`http://127.0.0.1:8000${item.product_image}`}
+                  src={item.product_image}
                   alt={item.product_name}
                   className="w-16 h-16 object-cover rounded"
                 />
@@ -1,11 +1,12 @@
 import { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
-import { getOrders } from '../services/api';
+import { getOrders, getOrdersPage } from '../services/api';
 
 function Orders() {
   const { isAuthenticated } = useAuth();
   const [orders, setOrders] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
@@ -17,7 +18,8 @@ function Orders() {
   const fetchOrders = async () => {
     try {
       const response = await getOrders();
-      setOrders(response.data);
+      setOrders(response.data.results);
+      setNextPage(response.data.next);
     } catch (error) {
       console.error('Error fetching orders:', error);
     } finally {
@@ -25,6 +27,17 @@ function Orders() {
     }
   };
 
+  const loadMore = async () => {
+    if (!nextPage) return;
+    try {
+      const response = await getOrdersPage(nextPage);
+      setOrders(prev => [...prev, ...response.data.results]);
+      setNextPage(response.data.next);
+    } catch (error) {
+      console.error('Error fetching orders:', error);
+    }
+  };
+
   if (!isAuthenticated) {
     return (
       <div className="max-w-7xl mx-auto px-4 py-16 text-center">
@@ -106,7 +119,7 @@ function Orders() {
                   <div key={item.id} className="flex items-center gap-3 p-2 border rounded">
                     {item.product_image && (
                       <img
-                        src={`http://127.0.0.1:8000${item.product_image}`}
+                        src={item.product_image}
                         alt={item.product_name}
                         className="w-12 h-12 object-cover rounded"
                       />
@@ -131,6 +144,17 @@ function Orders() {
           </div>
         ))}
       </div>
+
+      {nextPage && (
+        <div className="mt-6 text-center">
+          <button
+            onClick={loadMore}
+            className="bg-blue-600 text-white px-6 py-3 rounded-lg hover:bg-blue-700"
+          >
+            Load More Orders
+          </button>
+        </div>
+      )}
     </div>
   );
 }
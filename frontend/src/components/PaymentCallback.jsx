@@ -3,6 +3,9 @@ import { useNavigate, useSearchParams } from 'react-router-dom';
 import { useCart } from '../context/CartContext';
 import api from '../services/api';
 
+const MAX_PENDING_POLLS = 10;
+const PENDING_POLL_INTERVAL_MS = 3000;
+
 function PaymentCallback() {
   const [searchParams] = useSearchParams();
   const navigate = useNavigate();
@@ -34,8 +37,13 @@ function PaymentCallback() {
         return;
       }
 
-      // Verify payment with backend
-      const response = await api.get(`/orders/${orderId}/verify-payment/`);
+      // Verify payment with backend. The IPN or the reconcile worker usually
+      // settles the order within seconds, so keep polling while it's pending.
+      let response = await api.get(`/orders/${orderId}/verify-payment/`);
+      for (let attempt = 0; attempt < MAX_PENDING_POLLS && response.data.order.payment_status === 'pending'; attempt++) {
+        await new Promise((resolve) => setTimeout(resolve, PENDING_POLL_INTERVAL_MS));
+        response = await api.get(`/orders/${orderId}/verify-payment/`);
+      }
 
       if (response.data.order.payment_status === 'completed') {
         setStatus('success');
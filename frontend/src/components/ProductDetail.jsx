@@ -44,7 +44,9 @@ function ProductDetail() {
     if (productData.image) {
       images.push({
         type: 'image',
-        url: getFullUrl(productData.image)
+        url: getFullUrl(productData.image),
+        thumbnail: productData.image_thumbnail,
+        srcset: productData.image_srcset
       });
     }
     
@@ -52,7 +54,9 @@ function ProductDetail() {
       productData.additional_images.forEach(img => {
         images.push({
           type: 'image',
-          url: getFullUrl(img.image)
+          url: getFullUrl(img.image),
+          thumbnail: img.thumbnail,
+          srcset: img.srcset
         });
       });
     }
@@ -261,6 +265,8 @@ function ProductDetail() {
               ) : (
                 <img
                   src={currentMedia.url}
+                  srcSet={currentMedia.srcset || undefined}
+                  sizes="(min-width: 1024px) 50vw, 100vw"
                   alt={product.name}
                   className="w-full h-96 object-contain bg-gray-100"
                   onError={(e) => {
@@ -312,7 +318,7 @@ function ProductDetail() {
                     </div>
                   ) : (
                     <img
-                      src={media.url}
+                      src={media.thumbnail || media.url}
                       alt={`Thumbnail ${index + 1}`}
                       className="w-full h-20 object-cover"
                     />
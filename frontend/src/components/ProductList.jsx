@@ -1,11 +1,13 @@
 import { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
-import { getProducts } from '../services/api';
+import { getProducts, getProductsPage, getProductCategories } from '../services/api';
 
 function ProductList() {
   const [products, setProducts] = useState([]);
-  const [filteredProducts, setFilteredProducts] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
+  const [categoryOptions, setCategoryOptions] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState(null);
 
   // Filter states
@@ -17,24 +19,39 @@ function ProductList() {
   const [sortBy, setSortBy] = useState('newest');
   const [showFilters, setShowFilters] = useState(false);
 
-  // Get unique categories from products
-  const categories = ['all', ...new Set(products.map(p => p.category).filter(Boolean))];
+  const categories = ['all', ...categoryOptions];
   const sizes = ['xs', 's', 'm', 'l', 'xl', 'xxl', 'one_size'];
   const conditions = ['new', 'like_new', 'good', 'fair'];
 
   useEffect(() => {
-    fetchProducts();
+    getProductCategories()
+      .then((response) => setCategoryOptions(response.data))
+      .catch((err) => console.error(err));
   }, []);
 
   useEffect(() => {
-    filterAndSortProducts();
-  }, [products, searchQuery, selectedCategory, selectedSizes, selectedConditions, priceRange, sortBy]);
+    // Debounce so typing in the search box doesn't fire a request per keystroke
+    const timer = setTimeout(fetchProducts, searchQuery ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [searchQuery, selectedCategory, selectedSizes, selectedConditions, priceRange, sortBy]);
+
+  const buildParams = () => {
+    const params = { sort: sortBy };
+    if (searchQuery) params.q = searchQuery;
+    if (selectedCategory !== 'all') params.category = selectedCategory;
+    if (selectedSizes.length > 0) params.size = selectedSizes.join(',');
+    if (selectedConditions.length > 0) params.condition = selectedConditions.join(',');
+    if (priceRange.min > 0) params.min_price = priceRange.min;
+    if (priceRange.max < 10000) params.max_price = priceRange.max;
+    return params;
+  };
 
   const fetchProducts = async () => {
     try {
-      const response = await getProducts();
-      setProducts(response.data);
-      setFilteredProducts(response.data);
+      const response = await getProducts(buildParams());
+      setProducts(response.data.results);
+      setNextPage(response.data.next);
+      setError(null);
     } catch (err) {
       setError('Failed to fetch products');
       console.error(err);
@@ -43,55 +60,18 @@ function ProductList() {
     }
   };
 
-  const filterAndSortProducts = () => {
-    let filtered = [...products];
-
-    // Search filter
-    if (searchQuery) {
-      filtered = filtered.filter(product =>
-        product.name.toLowerCase().includes(searchQuery.toLowerCase()) ||
-        product.description?.toLowerCase().includes(searchQuery.toLowerCase())
-      );
-    }
-
-    // Category filter
-    if (selectedCategory !== 'all') {
-      filtered = filtered.filter(product => product.category === selectedCategory);
-    }
-
-    // Size filter
-    if (selectedSizes.length > 0) {
-      filtered = filtered.filter(product => selectedSizes.includes(product.size));
-    }
-
-    // Condition filter
-    if (selectedConditions.length > 0) {
-      filtered = filtered.filter(product => selectedConditions.includes(product.condition));
-    }
-
-    // Price range filter
-    filtered = filtered.filter(product =>
-      product.price >= priceRange.min && product.price <= priceRange.max
-    );
-
-    // Sort
-    switch (sortBy) {
-      case 'price-low':
-        filtered.sort((a, b) => a.price - b.price);
-        break;
-      case 'price-high':
-        filtered.sort((a, b) => b.price - a.price);
-        break;
-      case 'name':
-        filtered.sort((a, b) => a.name.localeCompare(b.name));
-        break;
-      case 'newest':
-      default:
-        filtered.sort((a, b) => b.id - a.id);
-        break;
+  const loadMore = async () => {
+    if (!nextPage) return;
+    setLoadingMore(true);
+    try {
+      const response = await getProductsPage(nextPage);
+      setProducts(prev => [...prev, ...response.data.results]);
+      setNextPage(response.data.next);
+    } catch (err) {
+      console.error(err);
+    } finally {
+      setLoadingMore(false);
     }
-
-    setFilteredProducts(filtered);
   };
 
   const handleSizeToggle = (size) => {
@@ -427,11 +407,11 @@ function ProductList() {
             <div className="h-1 w-24 mt-2 rounded" style={{ backgroundColor: '#FFB6C1' }}></div>
           </div>
           <div className="text-sm px-4 py-2 rounded-full" style={{ backgroundColor: '#FFB6C1', color: '#000' }}>
-            {filteredProducts.length} {filteredProducts.length === 1 ? 'item' : 'items'}
+            {products.length} {products.length === 1 ? 'item' : 'items'}
           </div>
         </div>
 
-        {filteredProducts.length === 0 ? (
+        {products.length === 0 ? (
           <div className="text-center py-16 bg-white rounded-2xl shadow-lg">
             <div className="text-6xl mb-4">🔍</div>
             <p className="text-xl text-gray-700 font-medium mb-2">No items found</p>
@@ -448,7 +428,7 @@ function ProductList() {
           </div>
         ) : (
           <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-6">
-            {filteredProducts.map((product) => (
+            {products.map((product) => (
               <Link
                 key={product.id}
                 to={`/product/${product.id}`}
@@ -457,7 +437,10 @@ function ProductList() {
                 <div className="bg-white rounded-2xl shadow-md hover:shadow-2xl transition-all duration-300 overflow-hidden transform hover:-translate-y-2 border-2 border-transparent hover:border-pink-300">
                   <div className="relative overflow-hidden aspect-square bg-gray-100">
                     <img
-                      src={product.image?.replace('http://localhost:8000', 'http://127.0.0.1:8000')}
+                      src={product.image_thumbnail || product.image}
+                      srcSet={product.image_srcset || undefined}
+                      sizes="(min-width: 1280px) 25vw, (min-width: 768px) 33vw, 50vw"
+                      loading="lazy"
                       alt={product.name}
                       className="w-full h-full object-cover group-hover:scale-110 transition-transform duration-500"
                       onError={(e) => {
@@ -554,6 +537,19 @@ function ProductList() {
             ))}
           </div>
         )}
+
+        {nextPage && (
+          <div className="text-center mt-10">
+            <button
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="px-8 py-3 rounded-xl font-bold text-white border-2 border-black transition-all disabled:opacity-60"
+              style={{ background: 'linear-gradient(135deg, #E85D45 0%, #FFB6C1 100%)' }}
+            >
+              {loadingMore ? 'Loading...' : 'Load More 🐆'}
+            </button>
+          </div>
+        )}
       </div>
 
       {/* Trust Section */}
@@ -6,6 +6,8 @@ import { getUserOrders } from '../services/api';
 function UserDashboard() {
   const { user } = useAuth();
   const [orders, setOrders] = useState([]);
+  const [orderCount, setOrderCount] = useState(0);
+  const [statusCounts, setStatusCounts] = useState({});
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
 
@@ -16,7 +18,9 @@ function UserDashboard() {
   const fetchOrders = async () => {
     try {
       const response = await getUserOrders();
-      setOrders(response.data);
+      setOrders(response.data.results);
+      setOrderCount(response.data.count);
+      setStatusCounts(response.data.status_counts);
     } catch (err) {
       console.error('Error fetching orders:', err);
       setError('Failed to load orders');
@@ -116,7 +120,7 @@ function UserDashboard() {
             <div className="flex items-center justify-between">
               <div>
                 <p className="text-stone-600 text-sm font-semibold mb-1">Total Orders</p>
-                <p className="text-4xl font-bold text-stone-900">{orders.length}</p>
+                <p className="text-4xl font-bold text-stone-900">{orderCount}</p>
               </div>
               <div className="w-16 h-16 bg-gradient-to-br from-amber-700 to-amber-900 rounded-full flex items-center justify-center">
                 <span className="text-3xl">📦</span>
@@ -130,7 +134,7 @@ function UserDashboard() {
               <div>
                 <p className="text-stone-600 text-sm font-semibold mb-1">Delivered</p>
                 <p className="text-4xl font-bold text-stone-900">
-                  {orders.filter(o => o.status === 'delivered').length}
+                  {statusCounts.delivered || 0}
                 </p>
               </div>
               <div className="w-16 h-16 bg-gradient-to-br from-green-600 to-green-800 rounded-full flex items-center justify-center">
@@ -145,7 +149,7 @@ function UserDashboard() {
               <div>
                 <p className="text-stone-600 text-sm font-semibold mb-1">In Progress</p>
                 <p className="text-4xl font-bold text-stone-900">
-                  {orders.filter(o => ['pending', 'processing', 'shipped'].includes(o.status)).length}
+                  {['pending', 'processing', 'shipped'].reduce((sum, key) => sum + (statusCounts[key] || 0), 0)}
                 </p>
               </div>
               <div className="w-16 h-16 bg-gradient-to-br from-blue-600 to-blue-800 rounded-full flex items-center justify-center">
@@ -1,6 +1,6 @@
 import { useState } from 'react';
 import { useNavigate, Link } from 'react-router-dom';
-import { createProduct } from '../../services/adminApi';
+import { createProduct, uploadProductMedia } from '../../services/adminApi';
 
 function AddProduct() {
   const navigate = useNavigate();
@@ -95,24 +95,13 @@ function AddProduct() {
       data.append('tiktok_link', formData.tiktok_link);
     }
     
-    // Main image
-    if (imageFile) {
-      data.append('image', imageFile);
-    }
-
-    // Additional images
-    if (additionalImages.length > 0) {
-      additionalImages.forEach((image) => {
-        data.append('additional_images', image);
-      });
-    }
-
-    // Video
-    if (videoFile) {
-      data.append('video', videoFile);
-    }
-    
-    await createProduct(data);
+    const response = await createProduct(data);
+    // Photos and video upload straight to storage, in parallel
+    await uploadProductMedia(response.data.id, {
+      image: imageFile,
+      additionalImages,
+      video: videoFile,
+    });
     alert('Product added successfully!');
     navigate('/admin/products');
   } catch (err) {
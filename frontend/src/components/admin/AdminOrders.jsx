@@ -1,22 +1,31 @@
 import { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
-import { getAdminOrders, updateOrderStatus } from '../../services/api';
+import { getAdminOrders, getOrdersPage, updateOrderStatus } from '../../services/api';
 
 function AdminOrders() {
   const [orders, setOrders] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
+  const [totalOrders, setTotalOrders] = useState(0);
+  const [statusCounts, setStatusCounts] = useState({});
   const [loading, setLoading] = useState(true);
   const [filterStatus, setFilterStatus] = useState('all');
   const [searchTerm, setSearchTerm] = useState('');
   const [selectedOrder, setSelectedOrder] = useState(null);
 
+  // Filtering and search run on the server, so they cover every order and
+  // not just the pages loaded so far; typing is debounced
   useEffect(() => {
-    fetchOrders();
-  }, []);
+    const timer = setTimeout(fetchOrders, searchTerm ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [filterStatus, searchTerm]);
 
   const fetchOrders = async () => {
     try {
-      const response = await getAdminOrders();
-      setOrders(response.data);
+      const response = await getAdminOrders({ status: filterStatus, search: searchTerm.trim() || undefined });
+      setOrders(response.data.results);
+      setNextPage(response.data.next);
+      setTotalOrders(response.data.count);
+      setStatusCounts(response.data.status_counts);
     } catch (error) {
       console.error('Error fetching orders:', error);
     } finally {
@@ -24,13 +33,37 @@ function AdminOrders() {
     }
   };
 
+  const loadMore = async () => {
+    if (!nextPage) return;
+    try {
+      const response = await getOrdersPage(nextPage);
+      setOrders(prev => [...prev, ...response.data.results]);
+      setNextPage(response.data.next);
+    } catch (error) {
+      console.error('Error fetching orders:', error);
+    }
+  };
+
   const handleStatusUpdate = async (orderId, newStatus) => {
     try {
       await updateOrderStatus(orderId, { status: newStatus });
       
-      setOrders(orders.map(order => 
-        order.id === orderId ? { ...order, status: newStatus } : order
-      ));
+      const previous = orders.find(order => order.id === orderId)?.status;
+      if (filterStatus !== 'all' && newStatus !== filterStatus) {
+        setOrders(orders.filter(order => order.id !== orderId));
+        setTotalOrders(total => total - 1);
+      } else {
+        setOrders(orders.map(order => 
+          order.id === orderId ? { ...order, status: newStatus } : order
+        ));
+      }
+      if (previous && previous !== newStatus) {
+        setStatusCounts(counts => ({
+          ...counts,
+          [previous]: (counts[previous] || 0) - 1,
+          [newStatus]: (counts[newStatus] || 0) + 1,
+        }));
+      }
       
       alert('Order status updated successfully!');
       setSelectedOrder(null);
@@ -62,24 +95,14 @@ function AdminOrders() {
     return icons[status] || '📋';
   };
 
-  // Filter orders
-  const filteredOrders = orders.filter(order => {
-    const matchesStatus = filterStatus === 'all' || order.status === filterStatus;
-    const matchesSearch = 
-      order.id.toString().includes(searchTerm) ||
-      (order.user?.username || '').toLowerCase().includes(searchTerm.toLowerCase()) ||
-      (order.shipping_address || '').toLowerCase().includes(searchTerm.toLowerCase());
-    return matchesStatus && matchesSearch;
-  });
-
-  // Calculate statistics
+  // Counts over every order, from the server (not just the loaded pages)
   const stats = {
-    total: orders.length,
-    pending: orders.filter(o => o.status === 'pending').length,
-    processing: orders.filter(o => o.status === 'processing').length,
-    shipped: orders.filter(o => o.status === 'shipped').length,
-    delivered: orders.filter(o => o.status === 'delivered').length,
-    cancelled: orders.filter(o => o.status === 'cancelled').length,
+    total: Object.values(statusCounts).reduce((sum, count) => sum + count, 0),
+    pending: statusCounts.pending || 0,
+    processing: statusCounts.processing || 0,
+    shipped: statusCounts.shipped || 0,
+    delivered: statusCounts.delivered || 0,
+    cancelled: statusCounts.cancelled || 0,
   };
 
   if (loading) {
@@ -170,19 +193,19 @@ function AdminOrders() {
             </div>
           </div>
           <div className="mt-4 text-sm text-gray-600 font-medium">
-            Showing {filteredOrders.length} of {orders.length} orders
+            Showing {orders.length} of {totalOrders} orders
           </div>
         </div>
 
         {/* Orders List */}
         <div className="space-y-4">
-          {filteredOrders.length === 0 ? (
+          {orders.length === 0 ? (
             <div className="bg-white rounded-xl shadow-lg p-12 text-center border-2" style={{ borderColor: '#C19A6B' }}>
               <div className="text-6xl mb-4">📦</div>
               <p className="text-gray-500 text-lg font-semibold">No orders found</p>
             </div>
           ) : (
-            filteredOrders.map((order) => (
+            orders.map((order) => (
               <div key={order.id} className="bg-white rounded-xl shadow-lg overflow-hidden border-2 hover:shadow-2xl transition-all" style={{ borderColor: '#C19A6B' }}>
                 <div className="p-6">
                   {/* Order Header */}
@@ -325,6 +348,18 @@ function AdminOrders() {
           )}
         </div>
 
+        {nextPage && (
+          <div className="mt-6 text-center">
+            <button
+              onClick={loadMore}
+              className="px-6 py-3 rounded-xl font-bold text-white border-2 border-black"
+              style={{ background: 'linear-gradient(135deg, #E85D45 0%, #FFB6C1 100%)' }}
+            >
+              Load More Orders
+            </button>
+          </div>
+        )}
+
         {/* Back Button */}
         <div className="mt-8">
           <Link
@@ -1,6 +1,8 @@
 import { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
-import { getAllProducts, deleteProduct, updateProduct } from '../../services/adminApi';
+import { getAllProducts, deleteProduct, updateProduct, importProducts, exportProducts } from '../../services/adminApi';
+
+const MEDIA_POLL_INTERVAL = 3000;
 
 function AdminProducts() {
   const [products, setProducts] = useState([]);
@@ -12,6 +14,13 @@ function AdminProducts() {
     fetchProducts();
   }, []);
 
+  // Refresh while background media uploads are still running
+  useEffect(() => {
+    if (!products.some(p => p.media_status === 'processing')) return;
+    const timer = setTimeout(fetchProducts, MEDIA_POLL_INTERVAL);
+    return () => clearTimeout(timer);
+  }, [products]);
+
   const fetchProducts = async () => {
     try {
       const response = await getAllProducts();
@@ -23,6 +32,21 @@ function AdminProducts() {
     }
   };
 
+  const handleImport = async (e) => {
+    const file = e.target.files[0];
+    e.target.value = '';
+    if (!file) return;
+    try {
+      const { data } = await importProducts(file);
+      const problems = data.errors.slice(0, 10).map((err) => `Line ${err.line}: ${JSON.stringify(err.errors)}`);
+      alert([`Created ${data.created}, updated ${data.updated}, failed ${data.failed}`, ...problems].join('\n'));
+      fetchProducts();
+    } catch (error) {
+      console.error('Error importing products:', error);
+      alert(error.response?.data?.error || 'Import failed');
+    }
+  };
+
   const handleDelete = async (id) => {
     if (!window.confirm('Are you sure you want to delete this product?')) {
       return;
@@ -97,6 +121,17 @@ function AdminProducts() {
             <h1 className="text-4xl font-bold text-gray-800 mb-2">📦 Product Management</h1>
             <p className="text-gray-600">Manage your thrift inventory</p>
           </div>
+          <div className="flex items-center gap-3">
+          <label className="bg-white border border-gray-300 text-gray-700 px-4 py-3 rounded-lg hover:bg-gray-50 transition-colors font-semibold cursor-pointer">
+            Import CSV/JSONL
+            <input type="file" accept=".csv,.jsonl,.ndjson" onChange={handleImport} className="hidden" />
+          </label>
+          <button
+            onClick={() => exportProducts('csv')}
+            className="bg-white border border-gray-300 text-gray-700 px-4 py-3 rounded-lg hover:bg-gray-50 transition-colors font-semibold"
+          >
+            Export CSV
+          </button>
           <Link
             to="/admin/products/new"
             className="bg-blue-600 text-white px-6 py-3 rounded-lg hover:bg-blue-700 transition-colors font-semibold flex items-center gap-2"
@@ -106,6 +141,7 @@ function AdminProducts() {
             </svg>
             Add New Product
           </Link>
+          </div>
         </div>
 
         {/* Search and Filter */}
@@ -192,7 +228,7 @@ function AdminProducts() {
                         <div className="flex items-center">
                           {product.image ? (
                             <img
-                              src={`http://127.0.0.1:8000${product.image}`}
+                              src={product.image_thumbnail || product.image}
                               alt={product.name}
                               className="h-12 w-12 rounded object-cover"
                             />
@@ -240,6 +276,16 @@ function AdminProducts() {
                         }`}>
                           {product.is_active ? 'Active' : 'Inactive'}
                         </span>
+                        {product.media_status === 'processing' && (
+                          <span className="ml-2 px-2 py-1 inline-flex text-xs leading-5 font-semibold rounded-full bg-blue-100 text-blue-800">
+                            Uploading media…
+                          </span>
+                        )}
+                        {product.media_status === 'failed' && (
+                          <span className="ml-2 px-2 py-1 inline-flex text-xs leading-5 font-semibold rounded-full bg-red-100 text-red-800">
+                            Media upload failed
+                          </span>
+                        )}
                       </td>
 
                       {/* Actions */}
@@ -1,7 +1,7 @@
 import { useState, useEffect } from 'react';
 import { useNavigate, useParams, Link } from 'react-router-dom';
 import { getProduct } from '../../services/api';
-import { updateProduct } from '../../services/adminApi';
+import { updateProduct, uploadProductMedia } from '../../services/adminApi';
 
 function EditProduct() {
   const { id } = useParams();
@@ -99,11 +99,8 @@ function EditProduct() {
       data.append('tiktok_link', formData.tiktok_link);
     }
     
-    if (imageFile) {
-      data.append('image', imageFile);
-    }
-
     await updateProduct(id, data);
+    await uploadProductMedia(id, { image: imageFile });
     alert('Product updated successfully!');
     navigate('/admin/products');
   } catch (err) {
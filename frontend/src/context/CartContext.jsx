@@ -1,66 +1,138 @@
 import { createContext, useContext, useState, useEffect } from 'react';
 import toast from 'react-hot-toast';
+import { useAuth } from './AuthContext';
+import {
+  getCart, addCartItems, setCartItemQuantity, removeCartItem, setCartCity, emptyCart,
+} from '../services/api';
 
 const CartContext = createContext();
 
+// Server cart lines in the shape the cart components already use
+const fromServer = (cart) => cart.items.map((item) => ({
+  id: item.product,
+  name: item.product_name,
+  image: item.product_image,
+  price: parseFloat(item.unit_price),
+  quantity: item.quantity,
+  stock: item.stock,
+}));
+
 export function CartProvider({ children }) {
+  const { isAuthenticated } = useAuth();
   const [cartItems, setCartItems] = useState([]);
+  // Totals priced by the backend (signed-in shoppers only)
+  const [serverCart, setServerCart] = useState(null);
+
+  const applyServerCart = (cart) => {
+    setServerCart(cart);
+    setCartItems(fromServer(cart));
+  };
 
-  // Load cart from localStorage on mount
+  // Guests keep the cart in localStorage; signed-in shoppers use the server
+  // cart, which picks up whatever the guest cart held at login
   useEffect(() => {
-    const savedCart = localStorage.getItem('cart');
-    if (savedCart) {
+    if (!isAuthenticated) {
+      setServerCart(null);
+      const savedCart = localStorage.getItem('cart');
       try {
-        setCartItems(JSON.parse(savedCart));
+        setCartItems(savedCart ? JSON.parse(savedCart) : []);
       } catch (error) {
         console.error('Error loading cart:', error);
         setCartItems([]);
       }
+      return;
     }
-  }, []);
 
-  // Save cart to localStorage whenever it changes
+    const syncCart = async () => {
+      try {
+        const guestItems = JSON.parse(localStorage.getItem('cart') || '[]');
+        const response = guestItems.length
+          ? await addCartItems(guestItems.map((item) => ({ product_id: item.id, quantity: item.quantity })))
+          : await getCart();
+        localStorage.removeItem('cart');
+        applyServerCart(response.data);
+      } catch (error) {
+        console.error('Error loading cart:', error);
+        const response = await getCart();
+        applyServerCart(response.data);
+      }
+    };
+    syncCart();
+  }, [isAuthenticated]);
+
+  // Save the guest cart to localStorage whenever it changes
   useEffect(() => {
-    localStorage.setItem('cart', JSON.stringify(cartItems));
-  }, [cartItems]);
+    if (!isAuthenticated) {
+      localStorage.setItem('cart', JSON.stringify(cartItems));
+    }
+  }, [cartItems, isAuthenticated]);
+
+  const serverAction = async (request) => {
+    try {
+      const response = await request();
+      applyServerCart(response.data);
+      return true;
+    } catch (error) {
+      toast.error(error.response?.data?.error || 'Could not update your cart');
+      return false;
+    }
+  };
+
+  const addToCart = async (product) => {
+    const existingItem = cartItems.find((item) => item.id === product.id);
+
+    if (isAuthenticated) {
+      if (!(await serverAction(() => addCartItems([{ product_id: product.id, quantity: 1 }])))) {
+        return;
+      }
+    } else {
+      setCartItems((prevCart) => (
+        prevCart.some((item) => item.id === product.id)
+          ? prevCart.map((item) =>
+              item.id === product.id ? { ...item, quantity: item.quantity + 1 } : item
+            )
+          : [...prevCart, { ...product, quantity: 1 }]
+      ));
+    }
 
-  const addToCart = (product) => {
-  setCartItems((prevCart) => {
-    const existingItem = prevCart.find((item) => item.id === product.id);
-    
     if (existingItem) {
       toast.success(`${product.name} quantity updated! 🛒`, {
         icon: '✨',
       });
-      return prevCart.map((item) =>
-        item.id === product.id
-          ? { ...item, quantity: item.quantity + 1 }
-          : item
-      );
     } else {
       toast.success(`${product.name} added to cart! 🐆`, {
         icon: '🛍️',
       });
-      return [...prevCart, { ...product, quantity: 1 }];
     }
-  });
-};
-
-  const removeFromCart = (productId) => {
-  const item = cart.find(item => item.id === productId);
-  
-  setCartItems((prevCart) => prevCart.filter((item) => item.id !== productId));
-  
-  toast.success(`${item.name} removed from cart`, {
-    icon: '🗑️',
-  });
-};
-  const updateQuantity = (productId, newQuantity) => {
+  };
+
+  const removeFromCart = async (productId) => {
+    const item = cartItems.find((item) => item.id === productId);
+
+    if (isAuthenticated) {
+      if (!(await serverAction(() => removeCartItem(productId)))) {
+        return;
+      }
+    } else {
+      setCartItems((prevCart) => prevCart.filter((item) => item.id !== productId));
+    }
+
+    toast.success(`${item.name} removed from cart`, {
+      icon: '🗑️',
+    });
+  };
+
+  const updateQuantity = async (productId, newQuantity) => {
     if (newQuantity <= 0) {
       removeFromCart(productId);
       return;
     }
 
+    if (isAuthenticated) {
+      await serverAction(() => setCartItemQuantity(productId, newQuantity));
+      return;
+    }
+
     setCartItems((prevItems) =>
       prevItems.map((item) =>
         item.id === productId ? { ...item, quantity: newQuantity } : item
@@ -68,15 +140,28 @@ export function CartProvider({ children }) {
     );
   };
 
+  // Shipping city for the server-side delivery fee and estimate
+  const setShippingCity = (city) => serverAction(() => setCartCity(city));
+
   const getCartTotal = () => {
+    if (serverCart) {
+      return parseFloat(serverCart.subtotal);
+    }
     return cartItems.reduce((total, item) => total + item.price * item.quantity, 0);
   };
 
   const getCartCount = () => {
+    if (serverCart) {
+      return serverCart.item_count;
+    }
     return cartItems.reduce((count, item) => count + item.quantity, 0);
   };
 
-  const clearCart = () => {
+  const clearCart = async () => {
+    if (isAuthenticated) {
+      await serverAction(emptyCart);
+      return;
+    }
     setCartItems([]);
     localStorage.removeItem('cart');
   };
@@ -85,9 +170,11 @@ export function CartProvider({ children }) {
     <CartContext.Provider
       value={{
         cartItems,
+        serverCart,
         addToCart,
         removeFromCart,
         updateQuantity,
+        setShippingCity,
         getCartTotal,
         getCartCount,
         clearCart,
@@ -104,4 +191,4 @@ export function useCart() {
     throw new Error('useCart must be used within a CartProvider');
   }
   return context;
-}
\ No newline at end of file
+}
@@ -45,10 +45,65 @@ export const updateProduct = (id, data) => {
   return adminApi.put(`/products/${id}/update/`, data, config);  // ✅ Fixed: added ( before backtick
 };
 
+// Direct uploads: files go straight to storage with a signed grant, then
+// finalize attaches them to the product (bytes never pass through Django)
+const uploadWithGrant = async (file, grant) => {
+  const form = new FormData();
+  Object.entries(grant.fields).forEach(([key, value]) => form.append(key, value));
+  form.append(grant.file_field, file);
+  // Plain axios: storage must not receive our auth token
+  const { data } = await axios.post(grant.upload_url, form);
+  return { upload_token: grant.upload_token, version: data.version, format: data.format };
+};
+
+export const uploadProductMedia = async (productId, { image, additionalImages = [], video, videoThumbnail, replaceImages = false }) => {
+  const files = [
+    ['image', image],
+    ...additionalImages.map((file) => ['additional_image', file]),
+    ['video', video],
+    ['video_thumbnail', videoThumbnail],
+  ].filter(([, file]) => file);
+  if (files.length === 0) return null;
+
+  const uploads = await Promise.all(files.map(async ([kind, file]) => {
+    const { data } = await adminApi.post('/uploads/sign/', { kind });
+    return uploadWithGrant(file, data.uploads[0]);
+  }));
+  return adminApi.post(`/products/${productId}/media/finalize/`, { uploads, replace_images: replaceImages });
+};
+
+// Background media upload progress for a product
+export const getProductMediaStatus = (id) => adminApi.get(`/products/${id}/media/`);
+
 export const deleteProduct = (id) => adminApi.delete(`/products/${id}/delete/`);  // ✅ Fixed: added ( before backtick
 
 export const getAllOrders = () => adminApi.get('/orders/');
 
+// Bulk product import (CSV / JSONL); the response lists per-row errors
+export const importProducts = (file, dryRun = false) => {
+  const data = new FormData();
+  data.append('file', file);
+  data.append('dry_run', dryRun);
+  return adminApi.post('/products/import/', data, { headers: { 'Content-Type': 'multipart/form-data' } });
+};
+
+// Streaming exports, fetched as a blob so the auth header is sent
+const downloadExport = async (path, params, filename) => {
+  const response = await adminApi.get(path, { params, responseType: 'blob' });
+  const url = URL.createObjectURL(response.data);
+  const link = document.createElement('a');
+  link.href = url;
+  link.download = filename;
+  link.click();
+  URL.revokeObjectURL(url);
+};
+
+export const exportProducts = (output = 'csv') => downloadExport('/products/export/', { output }, `products.${output}`);
+export const exportOrders = (params = {}, output = 'csv') => downloadExport('/orders/export/', { ...params, output }, `orders.${output}`);
+
+export const bulkUpdateProducts = (ids, changes) => adminApi.post('/products/bulk-update/', { ids, changes });
+export const bulkUpdateOrderStatus = (ids, status) => adminApi.post('/orders/bulk-status/', { ids, status });
+
 export const updateOrderStatus = (id, status) => adminApi.put(`/orders/${id}/status/`, { status });  // ✅ Fixed: added ( before backtick
 
 export default adminApi;
\ No newline at end of file
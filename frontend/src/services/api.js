@@ -28,7 +28,11 @@ api.interceptors.request.use(
 // ========================================
 // PRODUCT API CALLS
 // ========================================
-export const getProducts = () => api.get('/products/');
+// Catalog is cursor-paginated: pass filters/sort as params, then follow `next`
+export const getProducts = (params = {}) => api.get('/products/', { params });
+export const getProductsPage = (nextUrl) => api.get(nextUrl);
+export const getProductCategories = () => api.get('/products/categories/');
+export const searchProducts = (q, params = {}) => api.get('/products/search/', { params: { q, ...params } });
 export const getProduct = (id) => api.get(`/products/${id}/`);
 export const createProduct = (data) => api.post('/products/', data);
 export const updateProduct = (id, data) => api.put(`/products/${id}/`, data);
@@ -39,16 +43,29 @@ export const deleteProduct = (id) => api.delete(`/products/${id}/`);
 // ========================================
 export const getDeliveryZones = () => api.get('/delivery-zones/');
 
+// ========================================
+// CART (server-side, priced by the backend)
+// ========================================
+export const getCart = (params = {}) => api.get('/cart/', { params });
+export const addCartItems = (items) => api.post('/cart/items/', { items });
+export const setCartItemQuantity = (productId, quantity) => api.put(`/cart/items/${productId}/`, { quantity });
+export const removeCartItem = (productId) => api.delete(`/cart/items/${productId}/`);
+export const setCartCity = (shipping_city) => api.put('/cart/', { shipping_city });
+export const emptyCart = () => api.delete('/cart/');
+
 // ========================================
 // ORDER API CALLS
 // ========================================
-export const getOrders = () => api.get('/orders/');
+export const getOrders = (params = {}) => api.get('/orders/', { params });
 export const getOrder = (id) => api.get(`/orders/${id}/`);
-export const createOrder = (data) => api.post('/orders/create/', data);
-export const getUserOrders = () => api.get('/orders/user/');
+// Async (ASGI) checkout: same request/response as /orders/create/
+export const createOrder = (data) => api.post('/orders/create-async/', data);
+export const getUserOrders = (params = {}) => api.get('/orders/user/', { params });
+// Order lists are page-numbered: follow `next` from the previous response
+export const getOrdersPage = (nextUrl) => api.get(nextUrl);
 
 // Admin orders
-export const getAdminOrders = () => api.get('/admin/orders/');
+export const getAdminOrders = (params = {}) => api.get('/admin/orders/', { params });
 export const updateOrderStatus = (id, data) => api.put(`/admin/orders/${id}/status/`, data);
 
 export default api;
\ No newline at end of file